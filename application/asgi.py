@@ -2,6 +2,8 @@
 ASGI config for application project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Served by gunicorn with uvicorn workers when ``SERVER_MODE=asgi`` (see
+``application/gunicorn.py``).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -9,8 +11,15 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
+from dotenv import load_dotenv
+
+load_dotenv()
+
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'application.settings')
+if os.environ.get('DJANGO_ENV') == 'production':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'application.settings.production')
+else:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'application.settings.local')
 
 application = get_asgi_application()
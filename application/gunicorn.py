@@ -0,0 +1,115 @@
+"""
+Gunicorn configuration, used with ``gunicorn -c python:application.gunicorn``.
+
+Everything can be overridden from the environment:
+
+* ``GUNICORN_WORKER_CLASS`` — ``sync``, ``gthread``, ``gevent`` (needs the
+  ``gevent`` package) or ``uvicorn``. ``SERVER_MODE=asgi`` defaults it to
+  ``uvicorn``, which serves ``application.asgi`` and runs the async views
+  on an event loop; otherwise it is ``gthread``.
+* ``GUNICORN_WORKERS`` / ``GUNICORN_THREADS`` — by default derived from the
+  CPUs available to the container (cgroup quota, then CPU affinity): sync
+  workers are I/O bound so they get ``2 × CPUs + 1``; thread and event loop
+  workers already overlap I/O, so one per CPU (plus one) is enough.
+  ``GUNICORN_MAX_WORKERS`` caps the result, as every worker holds its own
+  database connections.
+* ``GUNICORN_PRELOAD`` — import the application once in the master so the
+  workers share its memory copy-on-write and start faster (default on).
+* ``GUNICORN_MAX_REQUESTS`` / ``GUNICORN_MAX_REQUESTS_JITTER`` — recycle a
+  worker after that many requests, so a slow leak cannot grow forever; the
+  jitter keeps the workers from restarting all at once.
+"""
+import math
+import os
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'gevent': 'gevent',
+    'uvicorn': 'uvicorn_worker.UvicornWorker',
+}
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def cpu_count():
+    """CPUs this process may use, honouring a cgroup v2 CPU quota."""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def worker_count(kind, cpus):
+    if kind == 'sync':
+        return 2 * cpus + 1
+    return cpus + 1
+
+
+_default_kind = 'uvicorn' if os.environ.get('SERVER_MODE', 'wsgi') == 'asgi' else 'gthread'
+_kind = os.environ.get('GUNICORN_WORKER_CLASS', _default_kind)
+if _kind not in WORKER_CLASSES:
+    raise RuntimeError(f'GUNICORN_WORKER_CLASS must be one of {", ".join(WORKER_CLASSES)}, not {_kind!r}')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = WORKER_CLASSES[_kind]
+workers = _env_int(
+    'GUNICORN_WORKERS',
+    min(worker_count(_kind, cpu_count()), _env_int('GUNICORN_MAX_WORKERS', 12)),
+)
+if _kind == 'gthread':
+    threads = _env_int('GUNICORN_THREADS', 4)
+if _kind == 'gevent':
+    worker_connections = _env_int('GUNICORN_WORKER_CONNECTIONS', 100)
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True').lower() in ('1', 'true', 'yes')
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10)
+timeout = _env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+# nginx keeps connections to the upstream open between requests.
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+# Worker heartbeat files on tmpfs; a container's overlay /tmp can stall them.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def when_ready(server):
+    # With preload_app the master imported the application; nothing it
+    # opened may be inherited by the workers.
+    if server.cfg.preload_app:
+        from django.db import connections
+
+        for connection in connections.all(initialized_only=True):
+            connection.close()
+            if hasattr(connection, 'close_pool'):
+                connection.close_pool()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def post_fork(server, worker):
+    # Live gauges start from zero in a forked process.
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from application import metrics
+
+        metrics.WORKERS.set(1)
+
+
+def child_exit(server, worker):
+    # Drop the per-process files of live gauges of the dead worker.
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,136 @@
+"""
+HTTP load generator for comparing the WSGI and ASGI deployments
+(``manage.py loadtest``).
+
+A fixed number of keep-alive connections request the given paths in turn
+for a fixed duration, each waiting for its response before sending the
+next request (optionally after a think time). The report holds throughput,
+latency percentiles and status counts; run it once against each server mode
+on the same dataset and compare the two reports.
+
+The client speaks just enough HTTP/1.1 for Django behind gunicorn: no
+redirects are followed and the response bodies are read and discarded.
+"""
+import asyncio
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from courses.benchmark import _percentile
+
+
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+
+
+async def _read_response(reader):
+    """Read one response; returns ``(status, keep_alive)``."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError('Connection closed by the server')
+    status = int(status_line.split()[1])
+    length, chunked, keep_alive = None, False, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = 'chunked' in value
+        elif name == 'connection':
+            keep_alive = value != 'close'
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        keep_alive = False
+    return status, keep_alive
+
+
+async def _client(target, paths, offset, deadline, think, cookie, results):
+    host = target.hostname
+    port = target.port or (443 if target.scheme == 'https' else 80)
+    headers = f'Host: {target.netloc}\r\nConnection: keep-alive\r\nUser-Agent: lms-loadtest\r\n'
+    if cookie:
+        headers += f'Cookie: {cookie}\r\n'
+
+    connection = None
+    index = offset
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port, ssl=target.scheme == 'https' or None)
+            reader, writer = connection
+            writer.write(f'GET {path} HTTP/1.1\r\n{headers}\r\n'.encode())
+            await writer.drain()
+            status, keep_alive = await _read_response(reader)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            results.errors += 1
+            keep_alive = False
+            status = None
+        if status is not None:
+            results.latencies.append((time.perf_counter() - started) * 1000)
+            results.statuses[status] += 1
+        if not keep_alive and connection is not None:
+            connection[1].close()
+            connection = None
+        if think:
+            await asyncio.sleep(think)
+
+    if connection is not None:
+        connection[1].close()
+
+
+async def _run(target, paths, connections, duration, think, cookie):
+    results = Results()
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(
+        _client(target, paths, offset, deadline, think, cookie, results)
+        for offset in range(connections)
+    ))
+    return results
+
+
+def run(url, paths, connections=50, duration=20, think=0, cookie=None):
+    """Load ``paths`` on the server at ``url``; returns the report dict."""
+    target = urlsplit(url)
+    started = time.perf_counter()
+    results = asyncio.run(_run(target, paths, connections, duration, think, cookie))
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'url': url,
+        'paths': paths,
+        'connections': connections,
+        'duration_s': round(elapsed, 3),
+        'think_s': think,
+        'requests': len(results.latencies),
+        'errors': results.errors,
+        'statuses': {str(status): count for status, count in sorted(results.statuses.items())},
+        'throughput_rps': round(len(results.latencies) / elapsed, 1),
+    }
+    if results.latencies:
+        report.update({
+            'p50_ms': round(statistics.median(results.latencies), 3),
+            'p90_ms': round(_percentile(results.latencies, 90), 3),
+            'p99_ms': round(_percentile(results.latencies, 99), 3),
+            'max_ms': round(max(results.latencies), 3),
+        })
+    return report
@@ -0,0 +1,100 @@
+import json
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from application import loadtest
+
+COMPARED = ('throughput_rps', 'p50_ms', 'p99_ms', 'errors')
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends concurrent keep-alive requests to a running server and writes a JSON report '
+        '(throughput, latency percentiles), to compare the WSGI and ASGI deployments'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server base URL (default: %(default)s)')
+        parser.add_argument(
+            '--path',
+            action='append',
+            dest='paths',
+            help='Path to request, in turn with the others (can be repeated, default: the read-heavy pages)',
+        )
+        parser.add_argument('--connections', type=int, default=50, help='Concurrent connections (default: 50)')
+        parser.add_argument('--duration', type=float, default=20, help='Seconds to run (default: 20)')
+        parser.add_argument(
+            '--think',
+            type=float,
+            default=0,
+            help='Seconds each connection waits between requests (default: 0)',
+        )
+        parser.add_argument(
+            '--login',
+            metavar='PHONE',
+            help='Send the requests as this user; the server must use the same database',
+        )
+        parser.add_argument('--output', default='loadtest.json', help='Path of the JSON report (default: loadtest.json)')
+        parser.add_argument('--compare', metavar='REPORT', help='Previous JSON report to print the differences against')
+
+    def handle(self, *args, **options):
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as report_file:
+                    previous = json.load(report_file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Cannot read {options["compare"]}: {error}')
+
+        cookie = None
+        paths = options['paths'] or ['/courses/']
+        if options['login']:
+            cookie = self.session_cookie(options['login'])
+            paths = options['paths'] or ['/courses/', '/courses/dashboard/', '/users/']
+
+        self.stdout.write(
+            f'Loading {options["url"]} with {options["connections"]} connections for {options["duration"]:g}s...'
+        )
+        report = loadtest.run(
+            options['url'].rstrip('/'),
+            paths,
+            connections=max(options['connections'], 1),
+            duration=options['duration'],
+            think=options['think'],
+            cookie=cookie,
+        )
+        with open(options['output'], 'w') as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+
+        self.stdout.write(
+            f'  {report["requests"]} requests, {report["throughput_rps"]} req/s, '
+            f'p50 {report.get("p50_ms")} ms, p99 {report.get("p99_ms")} ms, {report["errors"]} errors, '
+            f'statuses {report["statuses"]}'
+        )
+        self.stdout.write(self.style.SUCCESS(f'✓ Report written to {options["output"]}'))
+
+        if previous is not None:
+            for metric in COMPARED:
+                old, new = previous.get(metric), report.get(metric)
+                if old is None or new is None:
+                    continue
+                change = (new - old) / old * 100 if old else 0
+                better = change > 0 if metric == 'throughput_rps' else change < 0
+                line = f'{metric:<15} {old:>10} → {new:<10} ({change:+.1f}%)'
+                style = str if abs(change) <= 10 else self.style.SUCCESS if better else self.style.WARNING
+                self.stdout.write(style(line))
+
+    def session_cookie(self, phone_number):
+        try:
+            user = get_user_model().objects.get(phone_number=phone_number)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with phone number {phone_number}')
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
@@ -0,0 +1,57 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from application import profiling
+
+
+class Command(BaseCommand):
+    help = 'Switches the request sampling profiler on for users or views, off, or prints an X-Profile header token'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='users',
+            default=[],
+            metavar='PHONE',
+            help='Profile requests of the user with this phone number (can be repeated)',
+        )
+        parser.add_argument(
+            '--view',
+            action='append',
+            dest='views',
+            default=[],
+            metavar='URL_NAME',
+            help='Profile requests to this URL name, e.g. progress_dashboard (can be repeated)',
+        )
+        parser.add_argument('--minutes', type=int, default=15, help='How long targets stay active (default: 15)')
+        parser.add_argument('--off', action='store_true', help='Stop profiling all targets')
+        parser.add_argument(
+            '--token',
+            action='store_true',
+            help='Print a signed X-Profile header value that profiles any request carrying it',
+        )
+
+    def handle(self, *args, **options):
+        if options['token']:
+            token = profiling.make_token(max_age=options['minutes'] * 60)
+            self.stdout.write(f'X-Profile: {token}')
+            return
+        if options['off']:
+            profiling.clear_targets()
+            self.stdout.write(self.style.SUCCESS('✓ Profiling targets cleared'))
+            return
+        if not (options['users'] or options['views']):
+            raise CommandError('Pass --user, --view, --off or --token')
+
+        User = get_user_model()
+        user_ids = []
+        for phone in options['users']:
+            try:
+                user_ids.append(User.objects.get(phone_number=phone).pk)
+            except User.DoesNotExist:
+                raise CommandError(f'No user with phone number {phone}')
+        targets = profiling.add_targets(user_ids, options['views'], options['minutes'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Profiling users {targets["users"]} and views {targets["views"]} for {options["minutes"]} minutes'
+        ))
@@ -0,0 +1,130 @@
+"""
+Prometheus metrics, served at ``/metrics``.
+
+Request metrics are recorded by ``RequestMetricsMiddleware`` and cache
+lookups by ``courses.caching``; both only touch in-process counters. When
+``PROMETHEUS_MULTIPROC_DIR`` is set (see ``compose/production/django/start``)
+every gunicorn worker writes its values to that directory and a scrape
+aggregates all of them, whichever worker answers it.
+
+Values that need the database (grading queue, pending reviews and
+enrollments) are computed at scrape time, on the read replica if there is
+one, but kept in the cache for ``METRICS_GAUGE_TTL`` seconds, so frequent
+scrapes cost at most one round of COUNT queries per TTL.
+"""
+import hmac
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from .replicas import use_replica
+
+REQUEST_LATENCY = Histogram(
+    'lms_request_duration_seconds',
+    'Request latency by URL name',
+    ['view', 'method', 'status'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    'lms_request_db_queries',
+    'SQL queries per request by URL name',
+    ['view'],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_SQL_TIME = Histogram(
+    'lms_request_db_duration_seconds',
+    'Time spent in SQL per request by URL name',
+    ['view'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+CACHE_LOOKUPS = Counter(
+    'lms_cache_lookups_total',
+    'Progress cache lookups by result',
+    ['result'],
+)
+WORKERS = Gauge(
+    'lms_workers',
+    'Application worker processes',
+    multiprocess_mode='livesum',
+)
+# Requests, not processes: a threaded or async worker can run several at once.
+REQUESTS_IN_FLIGHT = Gauge(
+    'lms_requests_in_flight',
+    'Requests currently being handled, summed over all worker processes',
+    multiprocess_mode='livesum',
+)
+
+WORKERS.set(1)
+
+_GAUGES_KEY = 'metrics:gauges'
+
+
+def record_request(view, method, status, duration, queries, sql_time):
+    REQUEST_LATENCY.labels(view, method, f'{status // 100}xx').observe(duration)
+    REQUEST_QUERIES.labels(view).observe(queries)
+    REQUEST_SQL_TIME.labels(view).observe(sql_time)
+
+
+def record_cache_lookups(hits, misses):
+    if hits:
+        CACHE_LOOKUPS.labels('hit').inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels('miss').inc(misses)
+
+
+def _database_gauges():
+    from courses.models import Course, TaskSubmission
+
+    submissions = TaskSubmission.objects.order_by()
+    return {
+        'grading_queue': submissions.filter(status=TaskSubmission.STATUS_QUEUED).count(),
+        'pending_submissions': submissions.filter(status=TaskSubmission.STATUS_PENDING).count(),
+        # Denormalized counter, no scan of the enrollments table.
+        'pending_enrollments': Course.objects.aggregate(total=Sum('pending_enrollment_count'))['total'] or 0,
+    }
+
+
+class DatabaseCollector:
+    """Queue and backlog sizes, cached between scrapes."""
+
+    descriptions = {
+        'grading_queue': 'Task submissions waiting for the grading worker',
+        'pending_submissions': 'Task submissions waiting for manual review',
+        'pending_enrollments': 'Enrollment requests waiting for an answer',
+    }
+
+    def collect(self):
+        with use_replica():
+            values = cache.get_or_set(_GAUGES_KEY, _database_gauges, getattr(settings, 'METRICS_GAUGE_TTL', 15))
+        for name, value in values.items():
+            family = GaugeMetricFamily(f'lms_{name}', self.descriptions[name])
+            family.add_metric([], value)
+            yield family
+
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+
+    registry = CollectorRegistry()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        for collector in (REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_SQL_TIME, CACHE_LOOKUPS, WORKERS, REQUESTS_IN_FLIGHT):
+            registry.register(collector)
+    registry.register(DatabaseCollector())
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
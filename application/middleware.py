@@ -0,0 +1,195 @@
+"""
+Per-request instrumentation.
+
+``RequestMetricsMiddleware`` records how many SQL queries a request ran and
+how long they took, the template render time and the remaining Python
+time. The numbers are sent back in a ``Server-Timing`` header (visible in
+the browser dev tools), logged to ``application.metrics`` and exported to
+Prometheus (``application.metrics``, ``/metrics``). Queries that templates
+trigger lazily count in both ``db`` and ``tpl``; ``py`` is what is left
+after taking each of them out once. The query wrapper is installed on
+every connection for the duration of the request only.
+
+Queries are also grouped by their SQL with literals stripped; the same
+statement repeated ``N_PLUS_ONE_THRESHOLD`` times or more is logged as an
+N+1 pattern. ``QUERY_BUDGETS`` maps URL names to the maximum number of
+queries their view may run; going over it is logged, or raises
+``QueryBudgetExceeded`` when ``QUERY_BUDGET_MODE`` is ``'raise'`` (use that
+in tests).
+"""
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+from . import metrics as prometheus
+
+logger = logging.getLogger('application.metrics')
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+_IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def normalize_sql(sql):
+    """SQL with literals and ``IN`` list lengths removed, to group repeated statements."""
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _LITERAL_RE.sub('?', sql)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_sql_time = 0.0
+        self.template_depth = 0
+        self.statements = Counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.sql_time += elapsed
+            if self.template_depth:
+                self.template_sql_time += elapsed
+            self.queries += 1
+            self.statements[normalize_sql(sql)] += 1
+
+    def python_time(self, total):
+        return total - self.sql_time - (self.template_time - self.template_sql_time)
+
+    def instrument(self):
+        """Context manager counting queries on every connection until it exits."""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self.record_query))
+        return stack
+
+    def repeated_statements(self, threshold):
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+def _timed_render(render):
+    def wrapper(self, context):
+        metrics = _current.get()
+        if metrics is None or metrics.template_depth:
+            # Nested templates ({% include %}, {% extends %}) are part of the outer render.
+            return render(self, context)
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+            metrics.template_depth -= 1
+
+    wrapper.timed = True
+    return wrapper
+
+
+if not getattr(Template.render, 'timed', False):
+    Template.render = _timed_render(Template.render)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, 'REQUEST_METRICS', True):
+            return self.get_response(request)
+
+        metrics, token, started = self.start()
+        try:
+            with metrics.instrument():
+                response = self.get_response(request)
+        finally:
+            total = self.stop(token, started)
+        return self.finish(request, response, metrics, total)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'REQUEST_METRICS', True):
+            return await self.get_response(request)
+
+        metrics, token, started = self.start()
+        try:
+            # Connections are per thread: wrap the ones of the thread that
+            # runs this request's sync_to_async calls (ORM included).
+            instrumented = await sync_to_async(metrics.instrument)()
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(instrumented.close)()
+        finally:
+            total = self.stop(token, started)
+        return self.finish(request, response, metrics, total)
+
+    def start(self):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        prometheus.REQUESTS_IN_FLIGHT.inc()
+        return metrics, token, time.perf_counter()
+
+    def stop(self, token, started):
+        prometheus.REQUESTS_IN_FLIGHT.dec()
+        _current.reset(token)
+        return time.perf_counter() - started
+
+    def finish(self, request, response, metrics, total):
+        if getattr(settings, 'REQUEST_METRICS_HEADER', True):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.sql_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f'tpl;dur={metrics.template_time * 1000:.1f}',
+                f'py;dur={metrics.python_time(total) * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ])
+        self.check(request, response, metrics, total)
+        return response
+
+    def check(self, request, response, metrics, total):
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        prometheus.record_request(
+            match.view_name if match else 'unmatched',
+            request.method,
+            response.status_code,
+            total,
+            metrics.queries,
+            metrics.sql_time,
+        )
+        logger.debug(
+            '%s %s: %d queries, %.1f ms SQL, %.1f ms templates, %.1f ms total',
+            request.method, view, metrics.queries, metrics.sql_time * 1000, metrics.template_time * 1000, total * 1000,
+        )
+
+        for sql, count in metrics.repeated_statements(getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)):
+            logger.warning('Possible N+1 in %s: %d× %s', view, count, sql[:300])
+
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(match.url_name if match else None)
+        if budget is not None and metrics.queries > budget:
+            message = f'{view} ran {metrics.queries} queries, budget is {budget}'
+            if getattr(settings, 'QUERY_BUDGET_MODE', 'warn') == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
@@ -0,0 +1,245 @@
+"""
+On-demand sampling profiler for production requests.
+
+A profiled request gets a background thread that samples the request
+thread's stack every ``PROFILING_INTERVAL`` seconds. The samples are
+written to ``PROFILING_DIR`` in collapsed-stack format (one
+``frame;frame;frame count`` line per distinct stack), which
+``flamegraph.pl`` and speedscope read directly. Only the newest
+``PROFILING_MAX_FILES`` files are kept.
+
+A request is profiled when any of these match:
+
+* ``PROFILING_SAMPLE_RATE`` — random fraction of all requests (0 = off);
+* an ``X-Profile`` header holding a token from ``manage.py profiling --token``;
+* a target set by ``manage.py profiling --user/--view`` or the "Profile
+  requests" action in the user admin, for a limited time.
+
+Targets are stored in ``targets.json`` under ``PROFILING_DIR``, which every
+web process re-reads at most every ``PROFILING_POLL_INTERVAL`` seconds, so
+nothing has to be restarted to switch profiling on or off. With several
+hosts or containers, ``PROFILING_DIR`` must be on a volume they all mount.
+
+For async views (ASGI mode) the event loop thread is sampled, so database
+work done in ``sync_to_async`` threads shows up as time spent awaiting it.
+"""
+import functools
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+
+TARGETS_FILE = 'targets.json'
+TOKEN_SALT = 'application.profiling'
+
+_polled = {'at': 0, 'targets': None}
+# Keeps names unique when a process profiles several requests per second.
+_sequence = itertools.count()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def make_token(max_age=3600):
+    """Value for the ``X-Profile`` header, valid for ``max_age`` seconds."""
+    return signing.dumps({'until': time.time() + max_age}, salt=TOKEN_SALT)
+
+
+def _valid_token(token):
+    try:
+        payload = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        return False
+    return payload.get('until', 0) > time.time()
+
+
+def _directory():
+    return Path(_setting('PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def _read_targets():
+    try:
+        return json.loads((_directory() / TARGETS_FILE).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def get_targets():
+    """``{'users': [...], 'views': [...], 'until': timestamp}`` or ``None``."""
+    now = time.time()
+    # Re-read the shared file at most every few seconds per process.
+    if now - _polled['at'] >= _setting('PROFILING_POLL_INTERVAL', 5):
+        _polled.update(at=now, targets=_read_targets())
+    targets = _polled['targets']
+    if targets and targets['until'] > now:
+        return targets
+    return None
+
+
+def add_targets(users=(), views=(), minutes=15):
+    """Profile the given user ids / URL names for the next ``minutes``."""
+    current = get_targets() or {'users': [], 'views': []}
+    targets = {
+        'users': sorted(set(current['users']) | set(users)),
+        'views': sorted(set(current['views']) | set(views)),
+        'until': time.time() + minutes * 60,
+    }
+    directory = _directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    temporary = directory / f'{TARGETS_FILE}.{os.getpid()}.tmp'
+    temporary.write_text(json.dumps(targets))
+    os.replace(temporary, directory / TARGETS_FILE)
+    _polled.update(at=0, targets=None)
+    return targets
+
+
+def clear_targets():
+    (_directory() / TARGETS_FILE).unlink(missing_ok=True)
+    _polled.update(at=0, targets=None)
+
+
+def should_profile(request):
+    rate = _setting('PROFILING_SAMPLE_RATE', 0)
+    if rate and random.random() < rate:
+        return True
+    token = request.headers.get('X-Profile')
+    if token and _valid_token(token):
+        return True
+    targets = get_targets()
+    if targets is None:
+        return False
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and user.pk in targets['users']:
+        return True
+    match = request.resolver_match
+    return match is not None and match.url_name in targets['views']
+
+
+@functools.lru_cache(maxsize=4096)
+def _short_path(path):
+    for root in (str(settings.BASE_DIR), *sorted(sys.path, key=len, reverse=True)):
+        if root and path.startswith(root):
+            return path[len(root):].lstrip(os.sep)
+    return path
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{getattr(code, "co_qualname", code.co_name)} ({_short_path(code.co_filename)}:{frame.f_lineno})'
+
+
+class Sampler(threading.Thread):
+    """Samples the stack of ``thread_id`` until ``stop()`` is called."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def write_profile(stacks, name):
+    """Write collapsed stacks to ``PROFILING_DIR`` and rotate old files; returns the path."""
+    directory = _directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{name}.collapsed'
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(''.join(f'{stack} {count}\n' for stack, count in stacks.most_common()))
+    os.replace(temporary, path)
+
+    files = sorted(directory.glob('*.collapsed'), key=lambda item: item.stat().st_mtime, reverse=True)
+    for old in files[_setting('PROFILING_MAX_FILES', 200):]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+class ProfilingMiddleware:
+    """Must come after ``AuthenticationMiddleware`` so user targets work."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request._profiler = None
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(request)
+        return self.finish(request, response, started)
+
+    async def __acall__(self, request):
+        request._profiler = None
+        request._event_loop_thread = threading.get_ident()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.stop(request)
+        return self.finish(request, response, started)
+
+    def stop(self, request):
+        if request._profiler is not None:
+            request._profiler.stop()
+
+    def finish(self, request, response, started):
+        sampler = request._profiler
+        if sampler is None:
+            return response
+
+        elapsed = (time.perf_counter() - started) * 1000
+        match = request.resolver_match
+        user = getattr(request, 'user', None)
+        name = '{}-{}.{}-{}-{}-{}ms'.format(
+            time.strftime('%Y%m%d-%H%M%S'),
+            os.getpid(),
+            next(_sequence),
+            match.url_name if match and match.url_name else 'unmatched',
+            user.pk if user is not None and user.is_authenticated else 'anon',
+            round(elapsed),
+        )
+        path = write_profile(sampler.stacks, name)
+        response['X-Profile-File'] = path.name
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if should_profile(request):
+            # Under ASGI this runs on the request's sync_to_async thread, the
+            # same one that runs a sync view; async views run on the event loop.
+            thread_id = threading.get_ident()
+            if iscoroutinefunction(view_func):
+                thread_id = getattr(request, '_event_loop_thread', thread_id)
+            request._profiler = Sampler(thread_id, _setting('PROFILING_INTERVAL', 0.005))
+            request._profiler.start()
@@ -0,0 +1,189 @@
+"""
+Read replica routing.
+
+When ``DATABASE_REPLICA`` names a database alias (see ``DB_REPLICA_*`` in
+the settings), GET and HEAD requests to the URL names in ``REPLICA_VIEWS``
+read from it; every write, and every read inside a transaction on the
+primary, goes to ``default``. Code outside those views can opt in with
+``use_replica()`` for reads that tolerate replication lag, and reads that
+end up in a version-keyed cache opt out with ``use_primary()``.
+
+Reads stay on the primary for the rest of a request once it has written
+anything, and sessions are always read from the primary. A request that
+saves one of ``REPLICA_PIN_MODELS`` (completions, enrollments,
+submissions) or logs a user in sets the ``REPLICA_PIN_COOKIE`` cookie for
+``REPLICA_PIN_SECONDS``; while it is present the browser's requests read
+from the primary too, so students see their own progress immediately
+whatever the replication lag.
+
+Without a replica configured everything stays on ``default``.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+# Apps whose rows must never be read stale.
+PRIMARY_APPS = {'sessions'}
+
+_replica = contextvars.ContextVar('use_replica', default=None)
+
+
+class _Routing:
+    def __init__(self, replica=False, pinned=False):
+        self.replica = replica
+        # The client recently wrote: read from the primary.
+        self.pinned = pinned
+        # This request wrote: read from the primary from now on.
+        self.wrote = False
+        # This request saved a pinning model: set the cookie.
+        self.pin = False
+
+
+def replica_alias():
+    return getattr(settings, 'DATABASE_REPLICA', None)
+
+
+def _pin_cookie():
+    return getattr(settings, 'REPLICA_PIN_COOKIE', 'db_primary')
+
+
+def pin_to_primary():
+    """Read this client's next requests from the primary for ``REPLICA_PIN_SECONDS``."""
+    routing = _replica.get()
+    if routing is not None:
+        routing.pin = True
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _pin_after_progress_write(sender, **kwargs):
+    if sender._meta.label in getattr(settings, 'REPLICA_PIN_MODELS', ()):
+        pin_to_primary()
+
+
+@receiver(user_logged_in)
+def _pin_after_login(sender, **kwargs):
+    # A newly registered user may not have reached the replica yet.
+    pin_to_primary()
+
+
+@contextmanager
+def use_replica():
+    """Send the reads inside the block to the replica, if there is one."""
+    token = _replica.set(_Routing(True))
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """
+    Send the reads inside the block to the primary, even in a replica view.
+    For data stored in a cache under the current version tokens: those are
+    replaced when a write commits on the primary, so a lagging replica's
+    answer would be kept under the new version.
+    """
+    routing = _replica.get()
+    if routing is None or not routing.replica:
+        yield
+        return
+    # Updated in place, like process_view, so worker threads see it.
+    routing.replica = False
+    try:
+        yield
+    finally:
+        routing.replica = True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        routing = _replica.get()
+        if alias is None or routing is None or not routing.replica or routing.wrote:
+            return None
+        # Inside a transaction on the primary, reads must see its writes.
+        if model._meta.app_label in PRIMARY_APPS or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        routing = _replica.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == replica_alias():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Routes the reads of ``REPLICA_VIEWS`` to the replica; needs ``ReplicaRouter``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing = self.start(request)
+        token = _replica.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica.reset(token)
+        return self.finish(routing, response)
+
+    async def __acall__(self, request):
+        routing = self.start(request)
+        token = _replica.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica.reset(token)
+        return self.finish(routing, response)
+
+    def start(self, request):
+        return _Routing(pinned=_pin_cookie() in request.COOKIES)
+
+    def finish(self, routing, response):
+        if routing.pin and replica_alias() is not None:
+            response.set_cookie(
+                _pin_cookie(),
+                '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 15),
+                httponly=True,
+                samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Under ASGI this runs in a worker thread with a copy of the context,
+        # so the routing object is updated in place rather than replaced.
+        routing = _replica.get()
+        if routing is None or routing.pinned or replica_alias() is None or request.method not in ('GET', 'HEAD'):
+            return
+        match = request.resolver_match
+        routing.replica = match is not None and match.url_name in getattr(settings, 'REPLICA_VIEWS', ())
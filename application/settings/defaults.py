@@ -29,6 +29,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # local apps
     'users',
     'courses',
@@ -41,11 +42,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'application.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'application.profiling.ProfilingMiddleware',
+    'application.replicas.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -91,9 +95,168 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD", "password"),
         "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
         "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+        # Keep connections open between requests instead of reconnecting
+        # every time; a broken one is detected and replaced. Set to 0 under
+        # ASGI (the start script does) or when the pool is enabled.
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
     }
 }
 
+if "postgresql" in DATABASES["default"]["ENGINE"]:
+    # Server-side limit per statement in milliseconds, 0 disables it. The
+    # release script turns it off so migrations can take as long as needed.
+    DB_STATEMENT_TIMEOUT = int(os.environ.get("DB_STATEMENT_TIMEOUT", 30000))
+    DATABASES["default"]["OPTIONS"]["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"
+
+    # Connection pool per process (Django's psycopg 3 pool; needs
+    # `psycopg[pool]` installed instead of psycopg2).
+    if os.environ.get("DB_POOL", "False").lower() in ("1", "true", "yes"):
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        }
+
+# Read replica (application/replicas.py): reads of the REPLICA_VIEWS pages
+# go to it, everything else to the primary. Configured by overriding the
+# host and/or name of the primary, e.g. DB_REPLICA_NAME=replica.sqlite3
+# for a copy of the local SQLite database.
+DATABASE_REPLICA = None
+if os.environ.get("DB_REPLICA_HOST") or os.environ.get("DB_REPLICA_NAME"):
+    DATABASE_REPLICA = "replica"
+    DATABASES[DATABASE_REPLICA] = {
+        **DATABASES["default"],
+        "HOST": os.environ.get("DB_REPLICA_HOST", DATABASES["default"]["HOST"]),
+        "NAME": os.environ.get("DB_REPLICA_NAME", DATABASES["default"]["NAME"]),
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["application.replicas.ReplicaRouter"]
+REPLICA_VIEWS = [
+    "course_list",
+    "course_detail",
+    "course_lesson",
+    "progress_dashboard",
+    "submission_history",
+    "home",
+    "material_media",
+]
+# Saving one of these models (or logging in) makes the client read from the
+# primary for REPLICA_PIN_SECONDS, so students see their own progress.
+REPLICA_PIN_MODELS = ["courses.MaterialCompletion", "courses.Enrollment", "courses.TaskSubmission"]
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 15))
+REPLICA_PIN_COOKIE = "db_primary"
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory for development and tests; production.py switches to Redis
+# (CACHE_BACKEND/CACHE_LOCATION) and refuses a per-process cache.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "basirat"),
+    }
+}
+PROGRESS_CACHE_TIMEOUT = int(os.environ.get("PROGRESS_CACHE_TIMEOUT", 60 * 60))
+# Course list/detail pages served to anonymous visitors from the cache
+# (courses/page_cache.py); 0 disables it. Course edits invalidate them.
+ANONYMOUS_PAGE_CACHE_TIMEOUT = int(os.environ.get("ANONYMOUS_PAGE_CACHE_TIMEOUT", 600))
+
+# Task grading
+# When enabled, submit_task only queues submissions and
+# `manage.py run_grading_worker` grades them in the background.
+GRADING_ASYNC = os.environ.get("GRADING_ASYNC", "True").lower() in ("1", "true", "yes")
+
+# Route the read-heavy pages (course list and detail, progress dashboard,
+# home) to their async views. Meant for the ASGI deployment
+# (SERVER_MODE=asgi in compose/production/django/start); under WSGI every
+# async view gets its own event loop, which is slower than the sync view.
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "False").lower() in ("1", "true", "yes")
+
+# Video transcoding (courses/transcoding.py)
+# Uploaded videos are queued and turned into HLS renditions by
+# `manage.py run_transcoding_worker`; renditions taller than the source
+# are skipped.
+TRANSCODE_VIDEOS = os.environ.get("TRANSCODE_VIDEOS", "True").lower() in ("1", "true", "yes")
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.environ.get("FFPROBE_BINARY", "ffprobe")
+TRANSCODE_TIMEOUT = int(os.environ.get("TRANSCODE_TIMEOUT", 4 * 60 * 60))
+HLS_SEGMENT_SECONDS = 6
+TRANSCODE_RENDITIONS = [
+    {"name": "360p", "height": 360, "video_kbps": 800, "audio_kbps": 96},
+    {"name": "480p", "height": 480, "video_kbps": 1400, "audio_kbps": 128},
+    {"name": "720p", "height": 720, "video_kbps": 2800, "audio_kbps": 128},
+    {"name": "1080p", "height": 1080, "video_kbps": 5000, "audio_kbps": 192},
+]
+
+# Image and PDF previews (courses/derivatives.py): WebP thumbnails in
+# THUMBNAIL_WIDTHS, kept in DERIVATIVE_DIR inside MEDIA_ROOT and trimmed
+# to DERIVATIVE_CACHE_MAX_BYTES, least recently used first. Bump
+# DERIVATIVE_VERSION after changing how they are made.
+THUMBNAIL_WIDTHS = [320, 640, 1280]
+THUMBNAIL_QUALITY = int(os.environ.get("THUMBNAIL_QUALITY", 80))
+DERIVATIVE_DIR = ".derivatives"
+DERIVATIVE_CACHE_MAX_BYTES = int(os.environ.get("DERIVATIVE_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+DERIVATIVE_VERSION = 1
+PDFTOPPM_BINARY = os.environ.get("PDFTOPPM_BINARY", "pdftoppm")
+
+# Resumable uploads (courses/uploads.py)
+# Large media files are sent in chunks of at most UPLOAD_CHUNK_MAX_SIZE
+# (keep nginx's client_max_body_size for /courses/uploads/ above it).
+# UPLOAD_TEMP_DIR defaults to MEDIA_ROOT/.uploads and should stay on the
+# same filesystem so finished files are renamed, not copied. With
+# UPLOAD_VERIFY_ASYNC the whole-file checksum of a finished upload is
+# checked by `manage.py run_transcoding_worker` instead of the last request.
+UPLOAD_VERIFY_ASYNC = os.environ.get("UPLOAD_VERIFY_ASYNC", "True").lower() in ("1", "true", "yes")
+UPLOAD_TEMP_DIR = os.environ.get("UPLOAD_TEMP_DIR", "")
+UPLOAD_CHUNK_MAX_SIZE = int(os.environ.get("UPLOAD_CHUNK_MAX_SIZE", 16 * 1024 * 1024))
+UPLOAD_MAX_SIZE = int(os.environ.get("UPLOAD_MAX_SIZE", 20 * 1024 ** 3))
+UPLOAD_SESSION_TTL = int(os.environ.get("UPLOAD_SESSION_TTL", 24 * 60 * 60))
+
+# Request metrics (application/middleware.py)
+# Query counts, SQL/template time in a Server-Timing header and the
+# application.metrics log. QUERY_BUDGETS caps the queries per URL name;
+# QUERY_BUDGET_MODE 'raise' turns overruns into errors (tests). Budgets are
+# the cold-cache counts measured by RequestMetricsTests plus one or two
+# for optional statements (savepoints, a fallback lookup).
+REQUEST_METRICS = os.environ.get("REQUEST_METRICS", "True").lower() in ("1", "true", "yes")
+REQUEST_METRICS_HEADER = os.environ.get("REQUEST_METRICS_HEADER", "True").lower() in ("1", "true", "yes")
+N_PLUS_ONE_THRESHOLD = 5
+QUERY_BUDGET_MODE = os.environ.get("QUERY_BUDGET_MODE", "warn")
+QUERY_BUDGETS = {
+    "course_list": 5,
+    "course_detail": 8,
+    "course_lesson": 10,
+    "task_submit": 26,
+    "material_complete": 18,
+    "submission_history": 8,
+    "progress_dashboard": 7,
+    "home": 8,
+    "profile": 11,
+    "material_media": 6,
+    "material_preview": 6,
+    "media_auth": 0,
+    "signed_media": 0,
+}
+
+# Prometheus metrics at /metrics (application/metrics.py). Set METRICS_TOKEN
+# to require "Authorization: Bearer <token>" from the scraper (production.py
+# refuses to start without one).
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_GAUGE_TTL = int(os.environ.get("METRICS_GAUGE_TTL", 15))
+
+# Sampling profiler (application/profiling.py). Collapsed stacks of
+# profiled requests are written to PROFILING_DIR; switch targets on with
+# `manage.py profiling` or the user admin, no restart needed. Targets are
+# kept in PROFILING_DIR too, so every web container must mount the same one.
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+PROFILING_INTERVAL = float(os.environ.get("PROFILING_INTERVAL", 0.005))
+PROFILING_DIR = os.environ.get("PROFILING_DIR", BASE_DIR / "profiles")
+PROFILING_MAX_FILES = int(os.environ.get("PROFILING_MAX_FILES", 200))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -148,6 +311,17 @@ MODELTRANSLATION_TRANSLATION_REGISTRY = 'application.translation'
 
 STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
+# Lesson media goes through courses.views.material_media, which checks the
+# enrollment. With MEDIA_ACCEL_REDIRECT nginx serves the bytes from its
+# internal MEDIA_ACCEL_PREFIX location instead of Django.
+MEDIA_ACCEL_REDIRECT = os.environ.get("MEDIA_ACCEL_REDIRECT", "False").lower() in ("1", "true", "yes")
+MEDIA_ACCEL_PREFIX = os.environ.get("MEDIA_ACCEL_PREFIX", "/protected-media/")
+# Protected materials use signed MEDIA_URL links (courses/media_signing.py)
+# valid for MEDIA_URL_TTL seconds, with the expiry rounded up to
+# MEDIA_URL_EXPIRY_STEP so pages keep the same URLs and caches stay warm.
+MEDIA_URL_TTL = int(os.environ.get("MEDIA_URL_TTL", 4 * 60 * 60))
+MEDIA_URL_EXPIRY_STEP = int(os.environ.get("MEDIA_URL_EXPIRY_STEP", 60 * 60))
+MEDIA_USER_COOKIE = "media_user"
 
 
 # Default primary key field type
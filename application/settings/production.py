@@ -1,11 +1,31 @@
 import os
 
-from .defaults import *
+from django.core.exceptions import ImproperlyConfigured
 
+from .defaults import *
 
 DEBUG = False
 ALLOWED_HOSTS = [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host.strip()]
 
 STATIC_ROOT = os.getenv('DJANGO_STATIC_ROOT')
 MEDIA_ROOT = os.getenv('DJANGO_MEDIA_ROOT')
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', 'True').lower() in ('1', 'true', 'yes')
+
+# Cache versions, progress and cached pages must be shared by every gunicorn
+# worker and the grading/transcoding workers, so production uses the redis
+# service from docker-compose.prod.yml instead of the per-process default.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.redis.RedisCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "redis://redis:6379/1"),
+    }
+}
+if CACHES["default"]["BACKEND"] in (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+):
+    raise ImproperlyConfigured("Production needs a shared cache; set CACHE_BACKEND to Redis or Memcached.")
 
+# /metrics exposes per-view traffic; never serve it without a token.
+if not METRICS_TOKEN:
+    raise ImproperlyConfigured("Set METRICS_TOKEN; production does not serve /metrics without it.")
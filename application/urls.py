@@ -2,16 +2,20 @@ import os
 
 from django.conf import settings
 from django.conf.urls.i18n import i18n_patterns
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include
 from django.urls import path
 from django.views.generic import RedirectView
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
+from courses.views import signed_media
+
+from .metrics import metrics_view
+
 urlpatterns = [
     path('', RedirectView.as_view(pattern_name='course_list', permanent=False)),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
@@ -24,7 +28,11 @@ urlpatterns += i18n_patterns(
 
 )
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Uploads are only served for signed URLs (courses/media_signing.py); in
+# production nginx answers these itself after asking media_auth.
+urlpatterns += [
+    path(f'{settings.MEDIA_URL.lstrip("/")}<path:path>', signed_media, name='signed_media'),
+]
 
 # Custom error handlers
 handler404 = 'django.views.defaults.page_not_found'
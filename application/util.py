@@ -30,31 +30,33 @@ def unique_slug_generator(instance, title, new_slug=None):
     return slug
 
 
+AUDIO_EXTENSIONS = ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.aiff', '.m4a']
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm']
+BOOK_EXTENSIONS = ['.epub', '.pdf', '.mobi', '.azw', '.azw3', '.docx']
+IMAGE_EXTENSIONS = ['.jpg', '.png', '.jpeg', '.gif', '.svg', '.webp', '.bmp', '.tiff',]
+
+
 def validate_audio_extension(value):
-    allowed_extensions = ['.mp3', '.wav', '.flac', '.aac', '.ogg', '.aiff', '.m4a']
     ext = os.path.splitext(value.name)[1]
-    if not ext.lower() in allowed_extensions:
+    if not ext.lower() in AUDIO_EXTENSIONS:
         raise ValidationError('Only MP3, WAV, FLAC, AAC, OGG, AIFF, M4A files allowed.')
 
 
 def validate_video_extension(value):
-    allowed_extensions = ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm']
     ext = os.path.splitext(value.name)[1]
-    if not ext.lower() in allowed_extensions:
+    if not ext.lower() in VIDEO_EXTENSIONS:
         raise ValidationError('Only MP4, AVI, MKV, MOV, WMV, FLV, WEBM files allowed.')
 
 
 def validate_book_extension(value):
-    allowed_extensions = ['.epub', '.pdf', '.mobi', '.azw', '.azw3', '.docx']
     ext = os.path.splitext(value.name)[1]
-    if not ext.lower() in allowed_extensions:
+    if not ext.lower() in BOOK_EXTENSIONS:
         raise ValidationError('Only Epub, Pdf, Mobi, Azw, Azw3, Docx files allowed.')
 
 
 def validate_image_extension(value):
-    allowed_extensions = ['.jpg', '.png', '.jpeg', '.gif', '.svg', '.webp', '.bmp', '.tiff',]
     ext = os.path.splitext(value.name)[1]
-    if not ext.lower() in allowed_extensions:
+    if not ext.lower() in IMAGE_EXTENSIONS:
         raise ValidationError('Only jpg, png, jpeg, gif, svg, webp, bmp, tiff files allowed.')
 
 
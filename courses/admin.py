@@ -1,7 +1,13 @@
+from django.conf import settings
 from django.contrib import admin
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 
+from .caching import invalidate_progress
+from .counters import refresh_course_counters
+from .grading import regrade_materials
 from .models import (
     Course,
     Enrollment,
@@ -10,6 +16,7 @@ from .models import (
     MaterialCompletion,
     TaskSubmission,
 )
+from .transcoding import is_video
 
 
 # Configure admin site
@@ -62,6 +69,16 @@ class EnrollmentInline(admin.TabularInline):
         return False
 
 
+def _regrade(modeladmin, request, materials):
+    regraded, completions = regrade_materials(materials.filter(material_type=Material.TASK))
+    modeladmin.message_user(
+        request,
+        _('{count} submissions regraded, {completions} completions changed').format(
+            count=regraded, completions=completions,
+        ),
+    )
+
+
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
     list_display = ('title', 'lesson_count', 'enrollment_count', 'is_published', 'updated_at')
@@ -71,6 +88,7 @@ class CourseAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
     ordering = ('-created_at',)
     inlines = [LessonInline, EnrollmentInline]
+    actions = ('regrade_submissions',)
     
     fieldsets = (
         (_('Course Information'), {
@@ -84,16 +102,19 @@ class CourseAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
     
     def lesson_count(self, obj):
-        return obj.lessons.count()
+        return obj.lesson_count
     lesson_count.short_description = _('Lessons')
-    lesson_count.admin_order_field = 'lessons__count'
+    lesson_count.admin_order_field = 'lesson_count'
     
     def enrollment_count(self, obj):
-        return obj.enrollments.filter(status=Enrollment.STATUS_ACCEPTED).count()
+        return obj.accepted_enrollment_count
     enrollment_count.short_description = _('Students')
-    
-    def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related('lessons', 'enrollments')
+    enrollment_count.admin_order_field = 'accepted_enrollment_count'
+
+    def regrade_submissions(self, request, queryset):
+        """Regrade submissions of every task in the selected courses."""
+        _regrade(self, request, Material.objects.filter(lesson__course__in=queryset))
+    regrade_submissions.short_description = _('Regrade submissions')
 
 
 @admin.register(Lesson)
@@ -106,6 +127,7 @@ class LessonAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('title',)}
     ordering = ('course', 'order')
     inlines = [MaterialInline]
+    actions = ('regrade_submissions',)
     
     fieldsets = (
         (_('Lesson Information'), {
@@ -119,29 +141,37 @@ class LessonAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
     
     def material_count(self, obj):
-        return obj.materials.count()
+        return obj.material_count
     material_count.short_description = _('Materials')
+    material_count.admin_order_field = 'material_count'
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('course').prefetch_related('materials')
+        return super().get_queryset(request).select_related('course')
+
+    def regrade_submissions(self, request, queryset):
+        """Regrade submissions of every task in the selected lessons."""
+        _regrade(self, request, Material.objects.filter(lesson__in=queryset))
+    regrade_submissions.short_description = _('Regrade submissions')
 
 
 @admin.register(Material)
 class MaterialAdmin(admin.ModelAdmin):
-    list_display = ('title', 'order', 'lesson', 'material_type', 'question_type', 'is_protected')
+    list_display = ('title', 'order', 'lesson', 'material_type', 'question_type', 'is_protected', 'transcode_status')
     list_display_links = ('title',)
-    list_filter = ('material_type', 'question_type', 'lesson__course', 'is_protected')
+    list_filter = ('material_type', 'question_type', 'lesson__course', 'is_protected', 'transcode_status')
     list_editable = ('order',)
     search_fields = ('title', 'lesson__title', 'lesson__course__title')
     autocomplete_fields = ('lesson',)
     ordering = ('lesson__course', 'lesson__order', 'order')
+    actions = ('regrade_submissions', 'transcode_videos')
+    readonly_fields = ('resumable_upload', 'transcode_status', 'transcode_error')
     
     fieldsets = (
         (_('Material Information'), {
             'fields': ('lesson', 'title', 'order', 'material_type')
         }),
         (_('Learning Content'), {
-            'fields': ('content', 'media_file', 'is_protected'),
+            'fields': ('content', 'media_file', 'resumable_upload', 'is_protected', 'transcode_status', 'transcode_error'),
             'description': _('For learning materials only. Leave empty for tasks.')
         }),
         (_('Task Content'), {
@@ -150,9 +180,41 @@ class MaterialAdmin(admin.ModelAdmin):
         }),
     )
     
+    class Media:
+        js = ('courses/admin/resumable_upload.js',)
+
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('lesson', 'lesson__course')
 
+    def resumable_upload(self, obj):
+        # Files above nginx's request size limit go up in chunks (courses/uploads.py).
+        if obj is None or obj.pk is None:
+            return _('Save the material first to upload large files in chunks.')
+        return format_html(
+            '<input type="file" class="resumable-upload" data-endpoint="{}" data-material="{}" data-chunk-size="{}">'
+            ' <span class="resumable-upload-status"></span>',
+            reverse('upload_create'),
+            obj.pk,
+            settings.UPLOAD_CHUNK_MAX_SIZE,
+        )
+    resumable_upload.short_description = _('Large file upload')
+
+    def regrade_submissions(self, request, queryset):
+        """Regrade submissions of the selected tasks against their current answers."""
+        _regrade(self, request, queryset)
+    regrade_submissions.short_description = _('Regrade submissions')
+
+    def transcode_videos(self, request, queryset):
+        """Queue the selected videos for (re-)transcoding, e.g. after a failure."""
+        ids = [
+            material.pk
+            for material in queryset.exclude(media_file='').exclude(media_file__isnull=True).only('pk', 'media_file')
+            if is_video(material.media_file.name)
+        ]
+        count = Material.objects.filter(pk__in=ids).update(transcode_status=Material.TRANSCODE_QUEUED, transcode_error='')
+        self.message_user(request, _('{count} videos queued for transcoding').format(count=count))
+    transcode_videos.short_description = _('Transcode videos')
+
 
 @admin.register(Enrollment)
 class EnrollmentAdmin(admin.ModelAdmin):
@@ -188,18 +250,24 @@ class EnrollmentAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('student', 'course')
 
     def make_accepted(self, request, queryset):
-        updated = queryset.exclude(status=Enrollment.STATUS_ACCEPTED).update(
+        changed = queryset.exclude(status=Enrollment.STATUS_ACCEPTED)
+        course_ids = set(changed.values_list('course_id', flat=True))
+        updated = changed.update(
             status=Enrollment.STATUS_ACCEPTED,
             answered_at=timezone.now(),
         )
+        refresh_course_counters(course_ids)
         self.message_user(request, _('{count} enrollments accepted').format(count=updated))
     make_accepted.short_description = _('Mark selected enrollments as accepted')
 
     def make_rejected(self, request, queryset):
-        updated = queryset.exclude(status=Enrollment.STATUS_REJECTED).update(
+        changed = queryset.exclude(status=Enrollment.STATUS_REJECTED)
+        course_ids = set(changed.values_list('course_id', flat=True))
+        updated = changed.update(
             status=Enrollment.STATUS_REJECTED,
             answered_at=timezone.now(),
         )
+        refresh_course_counters(course_ids)
         self.message_user(request, _('{count} enrollments rejected').format(count=updated))
     make_rejected.short_description = _('Mark selected enrollments as rejected')
 
@@ -254,7 +322,7 @@ class TaskSubmissionAdmin(admin.ModelAdmin):
     search_fields = ('student__phone_number', 'student__first_name', 'student__last_name', 'material__title', 'material__lesson__title')
     date_hierarchy = 'submitted_at'
     ordering = ('-submitted_at',)
-    readonly_fields = ('material', 'student', 'submitted_at', 'attempt_number', 'answer_payload', 'graded_at')
+    readonly_fields = ('material', 'student', 'submitted_at', 'attempt_number', 'answer_payload', 'graded_at', 'graded_manually')
     actions = ['mark_as_graded', 'mark_as_passing']
     
     fieldsets = (
@@ -266,7 +334,7 @@ class TaskSubmissionAdmin(admin.ModelAdmin):
             'description': _('The answer submitted by the student')
         }),
         (_('Grading'), {
-            'fields': ('status', 'score', 'feedback', 'graded_at'),
+            'fields': ('status', 'score', 'feedback', 'graded_at', 'graded_manually'),
             'description': _('Enter score (0-100) and feedback, then use actions to mark as graded')
         }),
     )
@@ -290,6 +358,11 @@ class TaskSubmissionAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         return False
 
+    def save_model(self, request, obj, form, change):
+        if 'score' in form.changed_data:
+            obj.graded_manually = True
+        super().save_model(request, obj, form, change)
+
     def mark_as_graded(self, request, queryset):
         """Mark selected submissions as graded (requires manual score entry)."""
         pending = queryset.filter(status=TaskSubmission.STATUS_PENDING)
@@ -298,7 +371,8 @@ class TaskSubmissionAdmin(admin.ModelAdmin):
             if submission.score is not None:
                 submission.status = TaskSubmission.STATUS_GRADED
                 submission.graded_at = timezone.now()
-                submission.save(update_fields=['status', 'graded_at'])
+                submission.graded_manually = True
+                submission.save(update_fields=['status', 'graded_at', 'graded_manually'])
                 
                 # Create completion if passing
                 if submission.is_passing():
@@ -316,6 +390,7 @@ class TaskSubmissionAdmin(admin.ModelAdmin):
             status=TaskSubmission.STATUS_GRADED,
             score=100,
             graded_at=timezone.now(),
+            graded_manually=True,
         )
         # Create completions for all passing submissions
         for submission in queryset:
@@ -323,6 +398,7 @@ class TaskSubmissionAdmin(admin.ModelAdmin):
                 material=submission.material,
                 student=submission.student
             )
+            invalidate_progress(submission.student_id, submission.material.lesson.course_id)
         self.message_user(request, _('{count} submissions marked as passing').format(count=updated))
     mark_as_passing.short_description = _('Mark as 100 percent passing')
 
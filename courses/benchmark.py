@@ -0,0 +1,198 @@
+"""
+Request-level benchmarks of the course and user pages (``manage.py bench``).
+
+Each scale seeds a fresh synthetic dataset (``courses.synthetic``), then
+requests every page through the test client as the busiest student and
+records latency percentiles, query counts and peak Python memory. The
+report is plain JSON so runs from two commits can be diffed with
+``manage.py bench --compare old.json``.
+"""
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from io import StringIO
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Enrollment, Lesson, Material, TaskSubmission
+
+SCALES = {
+    'tiny': {'courses': 2, 'lessons': 2, 'materials': 3, 'students': 20},
+    'small': {'courses': 10, 'lessons': 5, 'materials': 4, 'students': 200},
+    'medium': {'courses': 30, 'lessons': 10, 'materials': 6, 'students': 2000},
+    'large': {'courses': 100, 'lessons': 12, 'materials': 8, 'students': 20000},
+}
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Scenario:
+    """Pages to request for one seeded dataset."""
+
+    def __init__(self):
+        enrollment = (
+            Enrollment.objects.filter(status=Enrollment.STATUS_ACCEPTED)
+            .values('student_id')
+            .annotate(total=Count('id'))
+            .order_by('-total', 'student_id')
+            .first()
+        )
+        if enrollment is None:
+            raise ValueError('The dataset has no accepted enrollments')
+        self.student = get_user_model().objects.get(pk=enrollment['student_id'])
+        course_ids = Enrollment.objects.filter(
+            student=self.student, status=Enrollment.STATUS_ACCEPTED,
+        ).values_list('course_id', flat=True)
+        # The first lesson is always available, so its pages and tasks can be requested.
+        self.lesson = (
+            Lesson.objects.filter(course_id__in=course_ids, course__is_published=True, order=0)
+            .select_related('course')
+            .order_by('-material_count', 'pk')
+            .first()
+        )
+        self.task = (
+            Material.objects.filter(
+                lesson__course_id__in=course_ids,
+                lesson__order=0,
+                question_type=Material.SINGLE_CHOICE,
+            )
+            .select_related('lesson__course')
+            .order_by('pk')
+            .first()
+        )
+
+    def pages(self):
+        """``{name: (method, url, data, setup)}``; ``setup`` runs untimed before each request."""
+        pages = {
+            'course_list': ('get', reverse('course_list'), None, None),
+            'course_list_search': ('get', reverse('course_list'), {'q': 'python'}, None),
+            'progress_dashboard': ('get', reverse('progress_dashboard'), None, None),
+            'submission_history': ('get', reverse('submission_history'), None, None),
+            'home': ('get', reverse('home'), None, None),
+            'profile': ('get', reverse('profile'), None, None),
+        }
+        if self.lesson is not None:
+            course_slug = self.lesson.course.slug
+            pages['course_detail'] = ('get', reverse('course_detail', args=[course_slug]), None, None)
+            pages['lesson_detail'] = (
+                'get', reverse('course_lesson', args=[course_slug, self.lesson.slug]), None, None,
+            )
+        if self.task is not None:
+            answer = {'answer': self.task.question_payload['correct_answer']}
+            pages['submit_task'] = ('post', reverse('task_submit', args=[self.task.pk]), answer, self.reset_attempts)
+        return pages
+
+    def reset_attempts(self):
+        TaskSubmission.objects.filter(material=self.task, student=self.student).delete()
+
+
+def measure(client, method, url, data, setup, repeat, warmup, cold):
+    """Time ``repeat`` requests; returns a result dict for the report."""
+    timings, queries, status = [], [], None
+    for iteration in range(warmup + repeat):
+        if setup:
+            setup()
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            elapsed = (time.perf_counter() - started) * 1000
+        status = response.status_code
+        if iteration >= warmup:
+            timings.append(elapsed)
+            queries.append(len(context.captured_queries))
+
+    # Memory is traced in a separate request: tracemalloc slows everything down.
+    if setup:
+        setup()
+    if cold:
+        cache.clear()
+    tracemalloc.start()
+    try:
+        getattr(client, method)(url, data)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': status,
+        'p50_ms': round(statistics.median(timings), 3),
+        'p90_ms': round(_percentile(timings, 90), 3),
+        'p99_ms': round(_percentile(timings, 99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': max(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(scales, repeat=20, warmup=2, cold=False, seed=1, log=None):
+    """Seed each scale in turn and benchmark every page; returns the report dict."""
+    report = {
+        'meta': {
+            'revision': _git_revision(),
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'repeat': repeat,
+            'warmup': warmup,
+            'cold_cache': cold,
+        },
+        'results': {},
+    }
+    for scale in scales:
+        call_command('flush', interactive=False, verbosity=0)
+        cache.clear()
+        if log:
+            log(f'Seeding {scale} dataset...')
+        call_command('populate_test_data', scale=True, seed=seed, stdout=StringIO(), **SCALES[scale])
+
+        scenario = Scenario()
+        client = Client()
+        client.force_login(scenario.student)
+        results = report['results'][scale] = {}
+        for name, (method, url, data, setup) in scenario.pages().items():
+            results[name] = measure(client, method, url, data, setup, repeat, warmup, cold)
+            if log:
+                result = results[name]
+                log(f'  {name}: p50 {result["p50_ms"]} ms, p99 {result["p99_ms"]} ms, {result["queries"]} queries')
+    return report
+
+
+def compare(old, new):
+    """Yield ``(scale, page, metric, old, new)`` for the metrics present in both reports."""
+    for scale, pages in new['results'].items():
+        for page, result in pages.items():
+            previous = old.get('results', {}).get(scale, {}).get(page)
+            if previous is None:
+                continue
+            for metric in ('p50_ms', 'p99_ms', 'queries', 'peak_kb'):
+                if metric in previous:
+                    yield scale, page, metric, previous[metric], result[metric]
@@ -0,0 +1,151 @@
+"""
+Versioned caching of per-student progress data.
+
+Cached values never get deleted; instead their keys embed version tokens
+that writes replace:
+
+* ``progress`` — one per (student, course), replaced when the student's
+  completions or submissions in that course change;
+* ``student`` — one per student, replaced on any of the above, for data
+  aggregated across all of a student's courses;
+* ``structure`` — one per course, replaced when the course, its lessons or
+  its materials change;
+* ``catalog`` — a single one, replaced along with any ``structure``
+  version, for pages listing several courses (``courses.page_cache``).
+
+A missing version (never set or evicted) is initialised to a fresh random
+token, so stale entries can never be resurrected.
+
+Versions are replaced when the write commits, not when it is made: a
+reader running between the two would otherwise cache data from before the
+write under the new version. For the same reason values are computed from
+the primary (``application.replicas.use_primary``): a lagging replica is
+such a reader.
+"""
+import hashlib
+import uuid
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from application.metrics import record_cache_lookups
+from application.replicas import use_primary
+
+
+_MISSING = object()
+
+
+def _timeout():
+    return getattr(settings, 'PROGRESS_CACHE_TIMEOUT', 60 * 60)
+
+
+def _version_key(kind, *ids):
+    return 'courses:version:{}:{}'.format(kind, ':'.join(str(pk) for pk in ids))
+
+
+def _new_token():
+    return uuid.uuid4().hex[:12]
+
+
+def get_versions(version_keys):
+    """Current token for each key, initialising the missing ones."""
+    versions = cache.get_many(version_keys)
+    missing = {key: _new_token() for key in version_keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+
+def progress_version_key(student_id, course_id):
+    return _version_key('progress', student_id, course_id)
+
+
+def student_version_key(student_id):
+    return _version_key('student', student_id)
+
+
+def structure_version_key(course_id):
+    return _version_key('structure', course_id)
+
+
+def _replace_versions(*version_keys):
+    transaction.on_commit(partial(cache.set_many, {key: _new_token() for key in version_keys}, None))
+
+
+def invalidate_progress(student_id, course_id):
+    _replace_versions(progress_version_key(student_id, course_id), student_version_key(student_id))
+
+
+def catalog_version_key():
+    return _version_key('catalog', 'all')
+
+
+def invalidate_structure(course_id):
+    _replace_versions(structure_version_key(course_id), catalog_version_key())
+
+
+def lesson_list_version(student_id, course_id):
+    """Version of a course's lesson states as seen by ``student_id`` (``None`` for anonymous)."""
+    keys = [structure_version_key(course_id)]
+    if student_id is not None:
+        keys.append(progress_version_key(student_id, course_id))
+    versions = get_versions(keys)
+    return '.'.join(versions[key] for key in keys)
+
+
+def progress_keys(student_id, course_ids):
+    """``{course_id: cache key}`` for the progress data of ``student_id``."""
+    version_keys = {}
+    for course_id in course_ids:
+        version_keys[course_id] = (progress_version_key(student_id, course_id), structure_version_key(course_id))
+    versions = get_versions([key for pair in version_keys.values() for key in pair])
+    return {
+        course_id: 'courses:progress:{}:{}:{}:{}'.format(
+            student_id, course_id, versions[progress_key], versions[structure_key],
+        )
+        for course_id, (progress_key, structure_key) in version_keys.items()
+    }
+
+
+def student_key(name, student_id, course_ids=()):
+    """
+    Cache key for data aggregated over a student's courses: changes when any
+    of the student's progress changes or any of ``course_ids`` is edited.
+    """
+    course_ids = sorted(course_ids)
+    student_version = student_version_key(student_id)
+    structure_versions = [structure_version_key(pk) for pk in course_ids]
+    versions = get_versions([student_version] + structure_versions)
+    digest = hashlib.md5(
+        '-'.join(f'{pk}.{versions[key]}' for pk, key in zip(course_ids, structure_versions)).encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return 'courses:{}:{}:{}:{}'.format(name, student_id, versions[student_version], digest)
+
+
+def get_or_set(key, default):
+    """``cache.get_or_set`` with the progress timeout; ``default`` is a callable."""
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        record_cache_lookups(1, 0)
+        return value
+    record_cache_lookups(0, 1)
+    # Versions are replaced on commit on the primary; a replica may lag behind.
+    with use_primary():
+        value = default()
+    cache.set(key, value, _timeout())
+    return value
+
+
+def get_many(keys):
+    keys = list(keys)
+    found = cache.get_many(keys)
+    record_cache_lookups(len(found), len(keys) - len(found))
+    return found
+
+
+def set_many(mapping):
+    cache.set_many(mapping, _timeout())
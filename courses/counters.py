@@ -0,0 +1,68 @@
+"""
+Denormalized counters on ``Course`` and ``Lesson``.
+
+Each refresh is a single ``UPDATE ... SET col = (SELECT COUNT(*) ...)``
+statement, so counters are recomputed atomically from the source rows and
+cannot drift under concurrent writes. Signals in ``courses.signals`` call
+these after every create/delete/status change; code that writes with
+``queryset.update()`` or ``bulk_create`` must call them itself.
+"""
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Course, Enrollment, Lesson, Material
+
+
+def _count(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        Value(0),
+    )
+
+
+def course_counter_expressions():
+    return {
+        'lesson_count': _count(Lesson.objects.all(), 'course'),
+        'accepted_enrollment_count': _count(Enrollment.objects.filter(status=Enrollment.STATUS_ACCEPTED), 'course'),
+        'pending_enrollment_count': _count(Enrollment.objects.filter(status=Enrollment.STATUS_PENDING), 'course'),
+    }
+
+
+def lesson_counter_expressions():
+    return {
+        'material_count': _count(Material.objects.all(), 'lesson'),
+        'task_count': _count(Material.objects.filter(material_type=Material.TASK), 'lesson'),
+    }
+
+
+def refresh_course_counters(course_ids=None):
+    """Recompute counters for ``course_ids`` (every course when ``None``)."""
+    courses = Course.objects.all() if course_ids is None else Course.objects.filter(pk__in=course_ids)
+    return courses.update(**course_counter_expressions())
+
+
+def refresh_lesson_counters(lesson_ids=None):
+    """Recompute counters for ``lesson_ids`` (every lesson when ``None``)."""
+    lessons = Lesson.objects.all() if lesson_ids is None else Lesson.objects.filter(pk__in=lesson_ids)
+    return lessons.update(**lesson_counter_expressions())
+
+
+def find_counter_mismatches():
+    """Yield ``(obj, field, stored, actual)`` for every stale counter."""
+    checks = (
+        (Course.objects.all(), course_counter_expressions()),
+        (Lesson.objects.all(), lesson_counter_expressions()),
+    )
+    for queryset, expressions in checks:
+        annotated = queryset.annotate(**{f'actual_{field}': expr for field, expr in expressions.items()})
+        for obj in annotated.iterator():
+            for field in expressions:
+                stored, actual = getattr(obj, field), getattr(obj, f'actual_{field}')
+                if stored != actual:
+                    yield obj, field, stored, actual
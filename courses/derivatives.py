@@ -0,0 +1,153 @@
+"""
+Resized WebP derivatives of lesson images and first-page previews of PDFs.
+
+``ensure(material, width)`` returns the media storage name of a WebP at
+most ``width`` pixels wide of the material's image, or of its PDF's first
+page (rendered with ``pdftoppm`` from poppler-utils), creating it on first
+use. File names are a digest of the upload name, the width and
+``DERIVATIVE_VERSION``: a new upload gets new URLs, so the files can be
+served as immutable (``courses.views.material_preview``).
+
+Derivatives live under ``DERIVATIVE_DIR`` in the media storage, an on-disk
+cache of at most ``DERIVATIVE_CACHE_MAX_BYTES``. Serving a file refreshes
+its modification time; after creating one the least recently used files
+are deleted until the cache is back under 90% of the limit (at most once a
+minute per process, as it walks the whole directory).
+"""
+import hashlib
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from application.util import IMAGE_EXTENSIONS
+
+# Formats Pillow cannot resize are shown as uploaded.
+_UNRESIZABLE = {'.svg'}
+
+_last_eviction = {'at': float('-inf')}
+
+
+def kind(name):
+    """``'image'`` or ``'pdf'`` for uploads that get previews, else ``None``."""
+    extension = os.path.splitext(name)[1].lower()
+    if extension in IMAGE_EXTENSIONS and extension not in _UNRESIZABLE:
+        return 'image'
+    if extension == '.pdf':
+        return 'pdf'
+    return None
+
+
+def derivative_key(name, width):
+    return hashlib.md5(f'{settings.DERIVATIVE_VERSION}:{name}:{width}'.encode(), usedforsecurity=False).hexdigest()
+
+
+def derivative_name(name, width):
+    key = derivative_key(name, width)
+    return f'{settings.DERIVATIVE_DIR}/{key[:2]}/{key}.webp'
+
+
+def default_width():
+    """Width of the ``src`` fallback next to ``srcset``."""
+    widths = settings.THUMBNAIL_WIDTHS
+    return widths[len(widths) // 2]
+
+
+def preview_url(material, width):
+    return reverse('material_preview', args=[material.pk, width, derivative_key(material.media_file.name, width)])
+
+
+def srcset(material):
+    return ', '.join(f'{preview_url(material, width)} {width}w' for width in settings.THUMBNAIL_WIDTHS)
+
+
+def _render_pdf_page(source, width, directory):
+    """First page of the PDF ``source`` as a PNG ``width`` pixels wide; returns its path."""
+    prefix = os.path.join(directory, 'page')
+    subprocess.run(
+        [
+            settings.PDFTOPPM_BINARY, '-f', '1', '-l', '1', '-singlefile', '-png',
+            '-scale-to-x', str(width), '-scale-to-y', '-1', source, prefix,
+        ],
+        check=True,
+        capture_output=True,
+        timeout=60,
+    )
+    return f'{prefix}.png'
+
+
+def _write_webp(path, target, width):
+    with Image.open(path) as image:
+        # Lets JPEG decode at a fraction of the size instead of full resolution.
+        image.draft('RGB', (width, width * 4))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+        image.save(target, 'WEBP', quality=settings.THUMBNAIL_QUALITY, method=4)
+
+
+def ensure(material, width):
+    """Storage name of the ``width`` derivative of ``material``'s upload, created if missing."""
+    name = derivative_name(material.media_file.name, width)
+    path = default_storage.path(name)
+    try:
+        os.utime(path)
+        return name
+    except FileNotFoundError:
+        pass
+
+    source = default_storage.path(material.media_file.name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Concurrent requests may both render it; each swaps in a complete file.
+    working = f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+    try:
+        if kind(material.media_file.name) == 'pdf':
+            with tempfile.TemporaryDirectory() as directory:
+                _write_webp(_render_pdf_page(source, width, directory), working, width)
+        else:
+            _write_webp(source, working, width)
+        os.replace(working, path)
+    finally:
+        if os.path.exists(working):
+            os.remove(working)
+
+    if time.monotonic() - _last_eviction['at'] >= 60:
+        _last_eviction['at'] = time.monotonic()
+        evict()
+    return name
+
+
+def evict(max_bytes=None):
+    """Delete least recently used derivatives while the cache is over its limit; returns how many."""
+    limit = settings.DERIVATIVE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    files, total = [], 0
+    for directory, _, filenames in os.walk(default_storage.path(settings.DERIVATIVE_DIR)):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    if total <= limit:
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= limit * 0.9:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
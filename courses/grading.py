@@ -0,0 +1,240 @@
+"""
+Task grading.
+
+``AnswerKey`` holds everything needed to score answers to one material and
+is built once per material, so grading many submissions costs a dict
+lookup and a comparison each. Submissions are queued by ``submit_task``
+with ``STATUS_QUEUED`` and graded in batches by ``grade_pending`` (run by
+``manage.py run_grading_worker``). Rows are claimed with
+``SELECT ... FOR UPDATE SKIP LOCKED`` so any number of workers can run
+side by side. A submission that keeps failing to grade is sent to manual
+review instead of blocking the queue.
+
+``regrade_materials`` re-scores existing submissions after an answer key
+was fixed, streaming them in primary key order so memory stays flat no
+matter how many there are.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import caching
+from .models import Material, MaterialCompletion, TaskSubmission
+from .progress import deferred_refresh, refresh_progress
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerKey:
+    """Precomputed correct answer of a task material."""
+
+    def __init__(self, material):
+        self.question_type = material.question_type
+        payload = material.question_payload or {}
+        self.correct = payload.get('correct_answer')
+        self.correct_set = frozenset(self.correct) if isinstance(self.correct, list) else None
+        self.gradable = (
+            self.question_type in (Material.SINGLE_CHOICE, Material.MULTI_CHOICE)
+            and 'correct_answer' in payload
+            and (self.question_type == Material.SINGLE_CHOICE or self.correct_set is not None)
+        )
+
+    def score(self, answer_payload):
+        """Score (0 or 100) for an answer, or ``None`` if it needs manual review."""
+        if not self.gradable:
+            return None
+        answer = (answer_payload or {}).get('answer')
+        if self.question_type == Material.SINGLE_CHOICE:
+            return 100 if answer == self.correct else 0
+        if not isinstance(answer, list):
+            return None
+        return 100 if set(answer) == self.correct_set else 0
+
+
+def grade_submissions(submissions, keys=None):
+    """
+    Grade ``submissions`` (with ``material`` loaded) in bulk.
+
+    Auto-gradable answers become graded, the rest wait for manual review.
+    Completions are created for passing scores and progress/caches of the
+    affected students are refreshed once per course. Returns the number of
+    submissions graded automatically.
+    """
+    keys = {} if keys is None else keys
+    now = timezone.now()
+    graded, affected = 0, defaultdict(set)
+    passing = []
+    for submission in submissions:
+        material = submission.material
+        if material.pk not in keys:
+            keys[material.pk] = AnswerKey(material)
+        score = keys[material.pk].score(submission.answer_payload)
+        if score is None:
+            submission.status = TaskSubmission.STATUS_PENDING
+        else:
+            submission.score = score
+            submission.status = TaskSubmission.STATUS_GRADED
+            submission.graded_at = now
+            graded += 1
+            if submission.is_passing():
+                passing.append(MaterialCompletion(material_id=material.pk, student_id=submission.student_id))
+        affected[material.lesson.course_id].add(submission.student_id)
+
+    with deferred_refresh():
+        TaskSubmission.objects.bulk_update(submissions, ['score', 'status', 'graded_at'], batch_size=500)
+        MaterialCompletion.objects.bulk_create(passing, batch_size=500, ignore_conflicts=True)
+        for course_id, student_ids in affected.items():
+            refresh_progress(course_id, student_ids)
+    return graded
+
+
+def _claim_queued():
+    return (
+        TaskSubmission.objects.select_for_update(skip_locked=True, of=('self',))
+        .filter(status=TaskSubmission.STATUS_QUEUED)
+        .select_related('material__lesson')
+    )
+
+
+def grade_pending(batch_size=50):
+    """
+    Claim up to ``batch_size`` queued submissions, grade them and commit.
+
+    If the batch fails, its submissions are retried one at a time and any
+    that fails again on its own is left for manual review. Errors outside
+    grading (the database going away) are raised to the worker.
+    """
+    submissions = []
+    try:
+        with transaction.atomic():
+            submissions = list(_claim_queued().order_by('submitted_at')[:batch_size])
+            if submissions:
+                grade_submissions(submissions)
+    except Exception:
+        if not submissions:
+            raise
+        logger.exception('Grading %d submissions failed, retrying one at a time', len(submissions))
+        for submission in submissions:
+            _grade_alone(submission.pk)
+    return len(submissions)
+
+
+def _grade_alone(pk):
+    try:
+        with transaction.atomic():
+            submissions = list(_claim_queued().filter(pk=pk))
+            if submissions:
+                grade_submissions(submissions)
+        return
+    except Exception:
+        logger.exception('Grading submission %s failed again, leaving it for manual review', pk)
+    with transaction.atomic():
+        for submission in _claim_queued().filter(pk=pk):
+            submission.status = TaskSubmission.STATUS_PENDING
+            submission.save(update_fields=['status'])
+
+
+def _regrade_chunks(material, key, chunk_size):
+    """Yield changed submissions of ``material`` one chunk at a time."""
+    submissions = (
+        TaskSubmission.objects.filter(material=material, graded_manually=False)
+        .exclude(status=TaskSubmission.STATUS_QUEUED)
+        .only('id', 'student_id', 'answer_payload', 'score', 'status', 'graded_at')
+        .order_by('pk')
+    )
+    now = timezone.now()
+    last_pk = 0
+    while True:
+        chunk = list(submissions.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        last_pk = chunk[-1].pk
+        changed = []
+        for submission in chunk:
+            score = key.score(submission.answer_payload)
+            if score is None:
+                continue
+            if submission.status != TaskSubmission.STATUS_GRADED or submission.score != score:
+                submission.score = score
+                submission.status = TaskSubmission.STATUS_GRADED
+                submission.graded_at = now
+                changed.append(submission)
+        yield changed
+
+
+def _reconcile_completions(material, chunk_size):
+    """
+    Make completions of ``material`` match its submissions: one for every
+    student with a passing submission, none for students whose submissions
+    all fail. Returns the ids of the students whose completion changed.
+    """
+    passing = TaskSubmission.objects.filter(
+        material=material,
+        student=OuterRef('student'),
+        score__gte=TaskSubmission.PASSING_SCORE,
+    )
+    completed = MaterialCompletion.objects.filter(material=material, student=OuterRef('student'))
+    affected = set()
+
+    missing = (
+        TaskSubmission.objects.filter(material=material, score__gte=TaskSubmission.PASSING_SCORE)
+        .filter(~Exists(completed))
+        .order_by()
+        .values_list('student_id', flat=True)
+        .distinct()
+    )
+    batch = []
+    for student_id in missing.iterator(chunk_size=chunk_size):
+        affected.add(student_id)
+        batch.append(MaterialCompletion(material_id=material.pk, student_id=student_id))
+        if len(batch) >= chunk_size:
+            MaterialCompletion.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    MaterialCompletion.objects.bulk_create(batch, ignore_conflicts=True)
+
+    # Only completions earned through a submission can be revoked.
+    revoked = (
+        MaterialCompletion.objects.filter(material=material)
+        .filter(Exists(TaskSubmission.objects.filter(material=material, student=OuterRef('student'))))
+        .filter(~Exists(passing))
+    )
+    stale = list(revoked.values_list('pk', 'student_id'))
+    for start in range(0, len(stale), chunk_size):
+        rows = stale[start:start + chunk_size]
+        MaterialCompletion.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+        affected.update(student_id for _, student_id in rows)
+    return affected
+
+
+def regrade_materials(materials, chunk_size=1000):
+    """
+    Re-score every submission of the auto-gradable ``materials`` against
+    their current answer key and reconcile completions and progress.
+
+    Materials that cannot be graded automatically (free response, missing
+    answer) are skipped. Queued submissions, which the worker grades anyway,
+    and submissions an administrator scored by hand are left alone. Returns ``(regraded submissions, changed completions)``.
+    """
+    regraded = changed_completions = 0
+    with deferred_refresh():
+        for material in materials.select_related('lesson').order_by('pk').iterator(chunk_size=100):
+            key = AnswerKey(material)
+            if not key.gradable:
+                continue
+            regraded_students = set()
+            for changed in _regrade_chunks(material, key, chunk_size):
+                TaskSubmission.objects.bulk_update(changed, ['score', 'status', 'graded_at'])
+                regraded_students.update(submission.student_id for submission in changed)
+                regraded += len(changed)
+            course_id = material.lesson.course_id
+            affected = _reconcile_completions(material, chunk_size)
+            changed_completions += len(affected)
+            if affected:
+                refresh_progress(course_id, affected)
+            # Scores shown in cached submission history changed as well.
+            for student_id in regraded_students - affected:
+                caching.invalidate_progress(student_id, course_id)
+    return regraded, changed_completions
@@ -0,0 +1,72 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from courses import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the course and user pages on a throwaway test database and writes a JSON report '
+        '(latency percentiles, query counts, peak memory per page and dataset scale)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            action='append',
+            dest='scales',
+            choices=list(benchmark.SCALES),
+            help='Dataset scale to benchmark (can be repeated, default: small and medium)',
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per page (default: 20)')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per page first (default: 2)')
+        parser.add_argument('--seed', type=int, default=1, help='Seed of the synthetic data (default: 1)')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request')
+        parser.add_argument(
+            '--output',
+            default='bench.json',
+            help='Path of the JSON report (default: bench.json)',
+        )
+        parser.add_argument(
+            '--compare',
+            metavar='REPORT',
+            help='Previous JSON report to print the differences against',
+        )
+
+    def handle(self, *args, **options):
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as report_file:
+                    previous = json.load(report_file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Cannot read {options["compare"]}: {error}')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        try:
+            report = benchmark.run(
+                options['scales'] or ['small', 'medium'],
+                repeat=max(options['repeat'], 1),
+                warmup=options['warmup'],
+                cold=options['cold'],
+                seed=options['seed'],
+                log=self.stdout.write,
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f'✓ Report written to {options["output"]}'))
+
+        if previous is not None:
+            for scale, page, metric, old, new in benchmark.compare(previous, report):
+                change = (new - old) / old * 100 if old else 0
+                line = f'{scale:>7} {page:<20} {metric:<8} {old:>10} → {new:<10} ({change:+.1f}%)'
+                style = self.style.WARNING if change > 10 else self.style.SUCCESS if change < -10 else str
+                self.stdout.write(style(line))
@@ -0,0 +1,94 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from courses.models import Course, Enrollment, Lesson, Material, MaterialCompletion, TaskSubmission
+
+
+class Command(BaseCommand):
+    help = (
+        'Prints EXPLAIN plans and timings of the hot view/admin queries. Run it on a seeded '
+        'database before and after an index migration (migrate courses <previous>) to compare.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--student',
+            metavar='PHONE',
+            help='Student whose pages are measured (default: the one with most accepted enrollments)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Number of timed runs per query (default: 20)',
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Use EXPLAIN ANALYZE on PostgreSQL',
+        )
+        parser.add_argument(
+            '--no-plans',
+            action='store_true',
+            help='Only print timings',
+        )
+
+    def handle(self, *args, **options):
+        enrollments = Enrollment.objects.filter(status=Enrollment.STATUS_ACCEPTED)
+        if options['student']:
+            enrollments = enrollments.filter(student__phone_number=options['student'])
+        student_id = (
+            enrollments.values('student_id')
+            .annotate(count=Count('pk'))
+            .order_by('-count', 'student_id')
+            .values_list('student_id', flat=True)
+            .first()
+        )
+        if student_id is None:
+            raise CommandError('No accepted enrollment found; seed data with populate_test_data first')
+        course_ids = list(enrollments.filter(student_id=student_id).order_by('course_id').values_list('course_id', flat=True))
+        course_id = course_ids[0]
+        lesson = Lesson.objects.filter(course_id=course_id).order_by('order').first()
+
+        queries = {
+            'catalog': Course.objects.filter(is_published=True).order_by('title')[:20],
+            'student enrollments': Enrollment.objects.filter(
+                student_id=student_id, status=Enrollment.STATUS_ACCEPTED,
+            ),
+            'student completions': MaterialCompletion.objects.filter(
+                student_id=student_id, material__lesson__course_id__in=course_ids,
+            ).values_list('material_id', flat=True),
+            'course lessons': Lesson.objects.filter(course_id=course_id).order_by('order', 'title'),
+            'lesson materials': Material.objects.filter(lesson=lesson).order_by('order'),
+            'recent submissions': TaskSubmission.objects.filter(student_id=student_id).order_by('-submitted_at')[:5],
+            'pending enrollments': Enrollment.objects.filter(
+                status=Enrollment.STATUS_PENDING,
+            ).order_by('-requested_at')[:100],
+            'grading queue': TaskSubmission.objects.filter(
+                status=TaskSubmission.STATUS_QUEUED,
+            ).order_by('submitted_at')[:50],
+            'review queue': TaskSubmission.objects.filter(
+                status=TaskSubmission.STATUS_PENDING,
+            ).order_by('-submitted_at')[:100],
+        }
+
+        explain_options = {}
+        if options['analyze'] and connection.vendor == 'postgresql':
+            explain_options = {'analyze': True, 'buffers': True}
+
+        for name, queryset in queries.items():
+            timings = []
+            for _ in range(max(options['repeat'], 1)):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ {name}: median {statistics.median(timings):.2f} ms, max {max(timings):.2f} ms'
+            ))
+            if not options['no_plans']:
+                plan = queryset.explain(**explain_options)
+                self.stdout.write('\n'.join(f'    {line}' for line in plan.splitlines()))
@@ -1,5 +1,9 @@
-from django.core.management.base import BaseCommand
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 from django.utils.text import slugify
+from courses import synthetic
 from courses.models import Course, Lesson, Material
 
 
@@ -12,8 +16,28 @@ class Command(BaseCommand):
             action='store_true',
             help='Clear existing test data before creating new data',
         )
+        parser.add_argument(
+            '--scale',
+            action='store_true',
+            help='Generate a large synthetic dataset for load testing instead of the sample courses',
+        )
+        parser.add_argument('--courses', type=int, default=50, help='--scale: number of courses (default: 50)')
+        parser.add_argument('--lessons', type=int, default=10, help='--scale: lessons per course (default: 10)')
+        parser.add_argument('--materials', type=int, default=6, help='--scale: materials per lesson (default: 6)')
+        parser.add_argument('--students', type=int, default=5000, help='--scale: number of students (default: 5000)')
+        parser.add_argument('--seed', type=int, default=1, help='--scale: random seed, same seed gives the same data (default: 1)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='--scale: rows per bulk insert (default: 5000)')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='--scale: parallel processes creating students (PostgreSQL only, default: 1)',
+        )
 
     def handle(self, *args, **options):
+        if options['scale']:
+            return self.handle_scale(options)
+
         if options['clear']:
             self.stdout.write(self.style.WARNING('Clearing existing test data...'))
             Course.objects.filter(slug__in=['python-basics', 'web-development']).delete()
@@ -719,3 +743,40 @@ HTML uses tags to structure content.''',
         self.stdout.write(self.style.SUCCESS(f'Courses created: {Course.objects.filter(slug__in=["python-basics", "web-development"]).count()}'))
         self.stdout.write(self.style.SUCCESS(f'Total lessons: {Lesson.objects.filter(course__slug__in=["python-basics", "web-development"]).count()}'))
         self.stdout.write(self.style.SUCCESS(f'Total materials: {Material.objects.filter(lesson__course__slug__in=["python-basics", "web-development"]).count()}'))
+
+    def handle_scale(self, options):
+        prefix = f'load-{options["seed"]}'
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('SQLite allows a single writer, using one worker'))
+            workers = 1
+        if options['clear']:
+            self.stdout.write(self.style.WARNING('Clearing existing synthetic data...'))
+            Course.objects.filter(slug__startswith=f'{prefix}-').delete()
+        if Course.objects.filter(slug__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Synthetic courses for seed {options["seed"]} already exist, pass --clear to recreate them')
+
+        started = time.monotonic()
+        course_ids = synthetic.create_catalog(
+            prefix, options['seed'], options['courses'], options['lessons'], options['materials'], options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Created {len(course_ids)} courses × {options["lessons"]} lessons × {options["materials"]} materials'
+        ))
+
+        totals = {}
+        structure = synthetic.load_structure(course_ids)
+        for counts in synthetic.populate(
+            options['students'], structure, options['seed'], prefix, options['batch_size'], workers,
+        ):
+            for name, count in counts.items():
+                totals[name] = totals.get(name, 0) + count
+            self.stdout.write(f'  {totals.get("CustomUser", 0)}/{options["students"]} students...')
+
+        self.stdout.write('Recomputing counters, search vectors and progress...')
+        synthetic.finalize(course_ids)
+        for name, count in sorted(totals.items()):
+            self.stdout.write(self.style.SUCCESS(f'✓ {name}: {count}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Done in {time.monotonic() - started:.1f}s (student password: {synthetic.PASSWORD})'
+        ))
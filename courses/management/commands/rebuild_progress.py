@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import Course
+from courses.progress import rebuild_course_progress
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the materialized lesson/course progress tables from material completions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--course',
+            action='append',
+            dest='courses',
+            metavar='SLUG',
+            help='Only rebuild the given course (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        courses = Course.objects.order_by('pk')
+        if options['courses']:
+            courses = courses.filter(slug__in=options['courses'])
+        for course in courses:
+            rebuild_course_progress(course.pk)
+            self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt progress for {course.title}'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.counters import find_counter_mismatches, refresh_course_counters, refresh_lesson_counters
+
+
+class Command(BaseCommand):
+    help = 'Recomputes denormalized course/lesson counters, or verifies them with --verify'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report stale counters; exits with an error if any are found',
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            mismatches = list(find_counter_mismatches())
+            for obj, field, stored, actual in mismatches:
+                self.stdout.write(self.style.WARNING(
+                    f'{obj._meta.model_name} {obj.pk} ({obj}): {field} is {stored}, expected {actual}'
+                ))
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} stale counters found')
+            self.stdout.write(self.style.SUCCESS('✓ All counters are up to date'))
+            return
+
+        courses = refresh_course_counters()
+        lessons = refresh_lesson_counters()
+        self.stdout.write(self.style.SUCCESS(f'✓ Recomputed counters for {courses} courses and {lessons} lessons'))
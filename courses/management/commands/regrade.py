@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.grading import regrade_materials
+from courses.models import Material
+
+
+class Command(BaseCommand):
+    help = 'Regrades existing task submissions against the current answer keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--material',
+            action='append',
+            dest='materials',
+            type=int,
+            metavar='ID',
+            help='Regrade submissions of the given material (can be repeated)',
+        )
+        parser.add_argument(
+            '--lesson',
+            action='append',
+            dest='lessons',
+            type=int,
+            metavar='ID',
+            help='Regrade every task of the given lesson (can be repeated)',
+        )
+        parser.add_argument(
+            '--course',
+            action='append',
+            dest='courses',
+            metavar='SLUG',
+            help='Regrade every task of the given course (can be repeated)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of submissions loaded and written at a time (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        if not (options['materials'] or options['lessons'] or options['courses']):
+            raise CommandError('Pass at least one of --material, --lesson or --course')
+
+        materials = Material.objects.none()
+        tasks = Material.objects.filter(material_type=Material.TASK)
+        if options['materials']:
+            materials |= tasks.filter(pk__in=options['materials'])
+        if options['lessons']:
+            materials |= tasks.filter(lesson_id__in=options['lessons'])
+        if options['courses']:
+            materials |= tasks.filter(lesson__course__slug__in=options['courses'])
+
+        regraded, completions = regrade_materials(materials, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Regraded {regraded} submissions, {completions} completions changed'
+        ))
@@ -0,0 +1,68 @@
+import logging
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from courses.grading import grade_pending
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between retries while grading keeps failing.
+MAX_BACKOFF = 60
+
+
+class Command(BaseCommand):
+    help = 'Grades queued task submissions; run several workers side by side to scale out'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Submissions claimed per transaction (default: 50)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the queue is empty (default: 1.0)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue and exit instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.stdout.write(self.style.SUCCESS('Grading worker started'))
+        total = failures = 0
+        while self.running:
+            close_old_connections()
+            try:
+                graded = grade_pending(options['batch_size'])
+            except Exception:
+                failures += 1
+                delay = min(options['interval'] * 2 ** failures, MAX_BACKOFF)
+                logger.exception('Grading failed %d time(s) in a row, retrying in %.0fs', failures, delay)
+                # Drops a connection the failure left unusable.
+                close_old_connections()
+                time.sleep(delay)
+                continue
+            failures = 0
+            total += graded
+            if graded:
+                self.stdout.write(f'Processed {graded} submissions ({total} total)')
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Grading worker stopped after {total} submissions'))
+
+    def stop(self, signum, frame):
+        self.running = False
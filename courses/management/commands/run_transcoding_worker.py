@@ -0,0 +1,61 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from courses.transcoding import transcode_pending
+from courses.uploads import verify_pending
+
+
+class Command(BaseCommand):
+    help = (
+        'Verifies finished uploads and transcodes queued videos to HLS with ffmpeg; '
+        'run several workers side by side to scale out. '
+        'Videos left "processing" by a killed worker are re-queued with the "Transcode videos" admin action'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1,
+            help='Videos claimed at a time (default: 1)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait when the queue is empty (default: 5.0)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue and exit instead of polling forever',
+        )
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.stdout.write(self.style.SUCCESS('Transcoding worker started'))
+        total = 0
+        while self.running:
+            close_old_connections()
+            verified = verify_pending()
+            processed = transcode_pending(options['batch_size'])
+            total += processed
+            if verified:
+                self.stdout.write(f'Verified {verified} uploads')
+            if processed:
+                self.stdout.write(f'Processed {processed} videos ({total} total)')
+            if verified or processed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Transcoding worker stopped after {total} videos'))
+
+    def stop(self, signum, frame):
+        self.running = False
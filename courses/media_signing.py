@@ -0,0 +1,121 @@
+"""
+Signed, expiring URLs for protected lesson media.
+
+``signed_url()`` returns ``MEDIA_URL`` plus the file name with ``u`` (user
+id), ``e`` (expiry timestamp) and ``s`` (HMAC of name, user and expiry)
+query parameters. ``verify()`` also requires the ``MEDIA_USER_COOKIE``
+cookie, a signed user id set by the lesson page, to name the same user, so
+a link copied to another browser is refused.
+
+HLS playlists refer to their segments by relative URLs, which drop the
+query string, so ``signed_directory_url()`` puts the token in the path
+instead (``MEDIA_URL/t/<user>-<expiry>-<signature>/<directory>/<file>``)
+and signs the directory: every file in it resolves to a valid URL.
+
+Neither touches the database: nginx asks ``courses.views.media_auth``
+about every ``/media/`` request (``auth_request``), caches the answer
+briefly and serves the bytes itself. Expiry times are rounded up to
+``MEDIA_URL_EXPIRY_STEP`` seconds so a lesson page keeps producing the same
+URLs for a while and browsers reuse what they already downloaded.
+"""
+import math
+import posixpath
+import re
+import time
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+URL_SALT = 'courses.media_signing.url'
+COOKIE_SALT = 'courses.media_signing.cookie'
+
+_TOKEN_PATH_RE = re.compile(r'^t/(\d+)-(\d+)-([0-9a-f]+)/(.+)$')
+
+
+def _signature(name, user_id, expires):
+    return salted_hmac(URL_SALT, f'{name}:{user_id}:{expires}', algorithm='sha256').hexdigest()
+
+
+def _expires(now):
+    step = settings.MEDIA_URL_EXPIRY_STEP
+    return math.ceil(((now or time.time()) + settings.MEDIA_URL_TTL) / step) * step
+
+
+def signed_url(name, user_id, now=None):
+    """URL of the media file ``name`` for ``user_id``, valid for at least ``MEDIA_URL_TTL`` seconds."""
+    expires = _expires(now)
+    query = urlencode({'u': user_id, 'e': expires, 's': _signature(name, user_id, expires)})
+    return f'{settings.MEDIA_URL}{quote(name)}?{query}'
+
+
+def signed_directory_url(directory, filename, user_id, now=None):
+    """Like ``signed_url()`` for ``directory/filename``, with the token covering the whole directory."""
+    directory = directory.strip('/') + '/'
+    expires = _expires(now)
+    token = f'{user_id}-{expires}-{_signature(directory, user_id, expires)}'
+    return f'{settings.MEDIA_URL}t/{token}/{quote(directory + filename)}'
+
+
+def set_user_cookie(response, user):
+    response.set_cookie(
+        settings.MEDIA_USER_COOKIE,
+        signing.dumps(user.pk, salt=COOKIE_SALT),
+        max_age=settings.SESSION_COOKIE_AGE,
+        httponly=True,
+        samesite='Lax',
+        secure=settings.SESSION_COOKIE_SECURE,
+    )
+
+
+def _cookie_user(value):
+    try:
+        return signing.loads(value, salt=COOKIE_SALT, max_age=settings.SESSION_COOKIE_AGE)
+    except signing.BadSignature:
+        return None
+
+
+def _valid(subject, user_id, expires, signature, cookie, now):
+    if expires < (now or time.time()):
+        return False
+    if not constant_time_compare(signature, _signature(subject, user_id, expires)):
+        return False
+    return cookie is not None and _cookie_user(cookie) == user_id
+
+
+def media_name(path):
+    """File name in the media storage of a ``MEDIA_URL``-relative ``path``."""
+    match = _TOKEN_PATH_RE.match(path)
+    return match.group(4) if match else path
+
+
+def verify(path, params, cookie, now=None):
+    """
+    Whether the ``MEDIA_URL``-relative ``path`` is signed for the user in
+    ``cookie``, by a path token or by the ``u``/``e``/``s`` ``params``.
+    """
+    match = _TOKEN_PATH_RE.match(path)
+    if match is not None:
+        user_id, expires, signature, name = match.groups()
+        if '..' in name.split('/'):
+            return False
+        directory = posixpath.dirname(name) + '/'
+        return _valid(directory, int(user_id), int(expires), signature, cookie, now)
+    try:
+        user_id = int(params['u'])
+        expires = int(params['e'])
+        signature = params['s']
+    except (KeyError, ValueError):
+        return False
+    return _valid(path, user_id, expires, signature, cookie, now)
+
+
+def verify_uri(uri, cookie, now=None):
+    """``verify()`` for a full request URI such as nginx's ``$request_uri``."""
+    parts = urlsplit(uri)
+    if not parts.path.startswith(settings.MEDIA_URL):
+        return False
+    name = unquote(parts.path[len(settings.MEDIA_URL):])
+    params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+    return verify(name, params, cookie, now)
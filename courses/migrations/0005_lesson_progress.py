@@ -0,0 +1,100 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:52
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_progress(apps, schema_editor):
+    Lesson = apps.get_model('courses', 'Lesson')
+    MaterialCompletion = apps.get_model('courses', 'MaterialCompletion')
+    LessonProgress = apps.get_model('courses', 'LessonProgress')
+    CourseProgress = apps.get_model('courses', 'CourseProgress')
+
+    lessons_by_course = defaultdict(list)
+    for lesson_id, course_id, order, total in (
+        Lesson.objects.annotate(total=Count('materials'))
+        .order_by('course_id', 'order')
+        .values_list('id', 'course_id', 'order', 'total')
+    ):
+        lessons_by_course[course_id].append((lesson_id, order, total))
+
+    completed = defaultdict(lambda: defaultdict(dict))
+    for student_id, course_id, lesson_id, count in (
+        MaterialCompletion.objects.order_by()
+        .values_list('student_id', 'material__lesson__course_id', 'material__lesson_id')
+        .annotate(count=Count('id'))
+    ):
+        completed[course_id][student_id][lesson_id] = count
+
+    for course_id, students in completed.items():
+        records, courses = [], []
+        for student_id, done_by_lesson in students.items():
+            done_lessons, unlocked_order = 0, None
+            for lesson_id, order, total in lessons_by_course[course_id]:
+                done = min(done_by_lesson.get(lesson_id, 0), total)
+                if done >= total:
+                    done_lessons += 1
+                elif unlocked_order is None:
+                    unlocked_order = order
+                records.append(LessonProgress(
+                    lesson_id=lesson_id,
+                    student_id=student_id,
+                    completed_materials=done,
+                    total_materials=total,
+                    is_completed=done >= total,
+                ))
+            courses.append(CourseProgress(
+                course_id=course_id,
+                student_id=student_id,
+                completed_lessons=done_lessons,
+                highest_unlocked_order=unlocked_order,
+            ))
+        LessonProgress.objects.bulk_create(records, batch_size=500)
+        CourseProgress.objects.bulk_create(courses, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_tasksubmission'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_lessons', models.PositiveIntegerField(default=0, verbose_name='Completed lessons')),
+                ('highest_unlocked_order', models.PositiveIntegerField(blank=True, null=True, verbose_name='Highest unlocked order')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_records', to='courses.course', verbose_name='Course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_progress', to=settings.AUTH_USER_MODEL, verbose_name='Student')),
+            ],
+            options={
+                'verbose_name': 'course progress',
+                'verbose_name_plural': 'course progress',
+                'unique_together': {('course', 'student')},
+            },
+        ),
+        migrations.CreateModel(
+            name='LessonProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_materials', models.PositiveIntegerField(default=0, verbose_name='Completed materials')),
+                ('total_materials', models.PositiveIntegerField(default=0, verbose_name='Total materials')),
+                ('is_completed', models.BooleanField(default=False, verbose_name='Is completed')),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_records', to='courses.lesson', verbose_name='Lesson')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lesson_progress', to=settings.AUTH_USER_MODEL, verbose_name='Student')),
+            ],
+            options={
+                'verbose_name': 'lesson progress',
+                'verbose_name_plural': 'lesson progress',
+                'unique_together': {('lesson', 'student')},
+            },
+        ),
+        migrations.RunPython(backfill_progress, migrations.RunPython.noop),
+    ]
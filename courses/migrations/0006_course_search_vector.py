@@ -0,0 +1,51 @@
+# Generated by Django 5.1.3 on 2026-10-17 23:10
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+SEARCH_CONFIGS = ('simple', 'english', 'russian')
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Course = apps.get_model('courses', 'Course')
+    vector = None
+    for config in SEARCH_CONFIGS:
+        part = SearchVector('title', weight='A', config=config) + SearchVector('summary', weight='B', config=config)
+        vector = part if vector is None else vector + part
+    Course.objects.update(search_vector=vector)
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS courses_course_search_vector_gin '
+        'ON courses_course USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS courses_course_title_trgm '
+        'ON courses_course USING gin (title gin_trgm_ops)'
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS courses_course_search_vector_gin')
+    schema_editor.execute('DROP INDEX IF EXISTS courses_course_title_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_lesson_progress'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='course',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
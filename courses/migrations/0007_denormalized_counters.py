@@ -0,0 +1,70 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:56
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        Value(0),
+    )
+
+
+def backfill_counters(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Lesson = apps.get_model('courses', 'Lesson')
+    Material = apps.get_model('courses', 'Material')
+    Enrollment = apps.get_model('courses', 'Enrollment')
+    Course.objects.update(
+        lesson_count=_count(Lesson.objects.all(), 'course'),
+        accepted_enrollment_count=_count(Enrollment.objects.filter(status='accepted'), 'course'),
+        pending_enrollment_count=_count(Enrollment.objects.filter(status='pending'), 'course'),
+    )
+    Lesson.objects.update(
+        material_count=_count(Material.objects.all(), 'lesson'),
+        task_count=_count(Material.objects.filter(material_type='task'), 'lesson'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_course_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='accepted_enrollment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Students'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='lesson_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Lessons'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='pending_enrollment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Pending enrollments'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='material_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Materials'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='task_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Tasks'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tasksubmission',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Awaiting grading'), ('pending', 'Pending review'), ('graded', 'Graded')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def renumber_attempts(apps, schema_editor):
+    """Give duplicated attempt numbers a fresh 1..n sequence by submission time."""
+    TaskSubmission = apps.get_model('courses', 'TaskSubmission')
+    duplicated = (
+        TaskSubmission.objects.order_by()
+        .values('material_id', 'student_id', 'attempt_number')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .values_list('material_id', 'student_id')
+        .distinct()
+    )
+    for material_id, student_id in duplicated:
+        submissions = list(
+            TaskSubmission.objects.filter(material_id=material_id, student_id=student_id)
+            .order_by('submitted_at', 'pk')
+        )
+        for number, submission in enumerate(submissions, start=1):
+            submission.attempt_number = number
+        TaskSubmission.objects.bulk_update(submissions, ['attempt_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_tasksubmission_queued_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumber_attempts, migrations.RunPython.noop),
+    ]
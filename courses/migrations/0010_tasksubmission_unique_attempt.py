@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-17 23:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_renumber_submission_attempts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='tasksubmission',
+            constraint=models.UniqueConstraint(fields=('material', 'student', 'attempt_number'), name='unique_submission_attempt'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.3 on 2026-10-17 23:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_tasksubmission_unique_attempt'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['is_published', 'title'], name='course_published_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['student', 'status'], name='enrollment_student_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['-requested_at'], name='enrollment_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['course', 'order', 'title'], name='lesson_course_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['lesson', 'order'], name='material_lesson_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='materialcompletion',
+            index=models.Index(fields=['student', 'material'], name='completion_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tasksubmission',
+            index=models.Index(fields=['student', '-submitted_at'], name='submission_student_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tasksubmission',
+            index=models.Index(condition=models.Q(('status', 'queued')), fields=['submitted_at'], name='submission_queued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tasksubmission',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['-submitted_at'], name='submission_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.3 on 2026-10-17 23:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='material',
+            name='hls_playlist',
+            field=models.CharField(blank=True, help_text='Master HLS playlist of the transcoded video, relative to the media root.', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='poster',
+            field=models.CharField(blank=True, help_text='Poster frame of the transcoded video.', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='renditions',
+            field=models.JSONField(blank=True, help_text='Name, height and bandwidth of each HLS rendition.', null=True),
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='transcode_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='material',
+            name='transcode_status',
+            field=models.CharField(blank=True, choices=[('', 'Not a video'), ('queued', 'Queued'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='', max_length=16, verbose_name='Transcoding'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(condition=models.Q(('transcode_status', 'queued')), fields=['updated_at'], name='material_transcode_queued_idx'),
+        ),
+    ]
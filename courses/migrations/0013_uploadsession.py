@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-17 23:37
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_material_transcoding'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='File name')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='Received bytes')),
+                ('checksum', models.CharField(blank=True, help_text='Expected SHA-256 of the whole file, hex encoded.', max_length=64)),
+                ('status', models.CharField(choices=[('active', 'Uploading'), ('completed', 'Completed')], default='active', max_length=16, verbose_name='Status')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL, verbose_name='Created by')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='courses.material', verbose_name='Material')),
+            ],
+            options={
+                'verbose_name': 'upload session',
+                'verbose_name_plural': 'upload sessions',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 00:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tasksubmission',
+            name='graded_manually',
+            field=models.BooleanField(default=False, help_text='Score set by an administrator; regrading leaves it alone.', verbose_name='Graded manually'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.3 on 2026-10-18 00:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0014_tasksubmission_graded_manually'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='enrollment',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='enrollments', to=settings.AUTH_USER_MODEL, verbose_name='Student'),
+        ),
+        migrations.AlterField(
+            model_name='lesson',
+            name='course',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='lessons', to='courses.course', verbose_name='Course'),
+        ),
+        migrations.AlterField(
+            model_name='material',
+            name='lesson',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='materials', to='courses.lesson'),
+        ),
+        migrations.AlterField(
+            model_name='materialcompletion',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='material_completions', to=settings.AUTH_USER_MODEL, verbose_name='Student'),
+        ),
+        migrations.AlterField(
+            model_name='tasksubmission',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='task_submissions', to=settings.AUTH_USER_MODEL, verbose_name='Student'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 00:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0015_drop_redundant_fk_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('active', 'Uploading'), ('verifying', 'Verifying'), ('completed', 'Completed'), ('rejected', 'Checksum mismatch')], default='active', max_length=16, verbose_name='Status'),
+        ),
+    ]
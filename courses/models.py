@@ -1,22 +1,53 @@
+import os
+import uuid
+
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
-class Course(models.Model):
+class CounterFieldsMixin:
+	"""
+	Keeps the denormalized ``counter_fields`` out of ordinary saves: they are
+	only written by ``courses.counters`` with ``UPDATE``, so saving an
+	instance loaded before a counter changed cannot put the old value back.
+	"""
+	counter_fields = ()
+
+	def save(self, *args, **kwargs):
+		if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+			kwargs['update_fields'] = [
+				field.name for field in self._meta.concrete_fields
+				if not field.primary_key and field.name not in self.counter_fields
+			]
+		super().save(*args, **kwargs)
+
+
+class Course(CounterFieldsMixin, models.Model):
 	title = models.CharField(max_length=255, verbose_name=_('Title'))
 	slug = models.SlugField(unique=True, verbose_name=_('Slug'))
 	summary = models.TextField(blank=True, verbose_name=_('Summary'))
 	is_published = models.BooleanField(default=False, verbose_name=_('Is published'))
+	lesson_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('Lessons'))
+	accepted_enrollment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('Students'))
+	pending_enrollment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('Pending enrollments'))
+	search_vector = SearchVectorField(null=True, editable=False)
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
+	counter_fields = ('lesson_count', 'accepted_enrollment_count', 'pending_enrollment_count')
+
 	class Meta:
 		ordering = ['title']
 		verbose_name = _('course')
 		verbose_name_plural = _('courses')
+		indexes = [
+			# Catalog listing: published courses in title order.
+			models.Index(fields=['is_published', 'title'], name='course_published_title_idx'),
+		]
 
 	def __str__(self):
 		return self.title
@@ -26,26 +57,40 @@ class Course(models.Model):
 			return None
 		return self.enrollments.filter(student=user).first()
 
+	async def aenrollment_for(self, user):
+		if not user.is_authenticated:
+			return None
+		return await self.enrollments.filter(student=user).afirst()
+
 
-class Lesson(models.Model):
+class Lesson(CounterFieldsMixin, models.Model):
 	course = models.ForeignKey(
 		Course,
 		on_delete=models.CASCADE,
 		related_name='lessons',
+		# Covered by lesson_course_order_idx.
+		db_index=False,
 		verbose_name=_('Course'),
 	)
 	title = models.CharField(max_length=255, verbose_name=_('Title'))
 	slug = models.SlugField(verbose_name=_('Slug'))
 	description = models.TextField(blank=True, verbose_name=_('Description'))
 	order = models.PositiveIntegerField(default=0, verbose_name=_('Order'))
+	material_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('Materials'))
+	task_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('Tasks'))
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
+	counter_fields = ('material_count', 'task_count')
+
 	class Meta:
 		ordering = ['order', 'title']
 		unique_together = [('course', 'slug')]
 		verbose_name = _('lesson')
 		verbose_name_plural = _('lessons')
+		indexes = [
+			models.Index(fields=['course', 'order', 'title'], name='lesson_course_order_idx'),
+		]
 
 	def __str__(self):
 		return f"{self.course.title} — {self.title}"
@@ -53,13 +98,44 @@ class Lesson(models.Model):
 	def completed_for(self, user):
 		if not user.is_authenticated:
 			return False
-		return all(material.is_completed_by(user) for material in self.materials.all())
+		record = self.progress_records.filter(student=user).values_list('is_completed', flat=True).first()
+		if record is None:
+			# No progress stored yet: only lessons without materials count as done.
+			return not self.materials.exists()
+		return record
 
 	def is_available_for(self, user):
 		if not user.is_authenticated:
 			return False
-		previous_lessons = self.course.lessons.filter(order__lt=self.order)
-		return all(lesson.completed_for(user) for lesson in previous_lessons)
+		progress = CourseProgress.objects.filter(course_id=self.course_id, student=user).first()
+		if progress is None:
+			return not Material.objects.filter(
+				lesson__course_id=self.course_id,
+				lesson__order__lt=self.order,
+			).exists()
+		return progress.unlocks(self.order)
+
+	def is_accessible_for(self, user):
+		"""``is_available_for(user) or completed_for(user)``, in one query once progress is stored."""
+		if not user.is_authenticated:
+			return False
+		progress = (
+			CourseProgress.objects.filter(course_id=self.course_id, student=user)
+			.annotate(lesson_completed=models.Subquery(
+				LessonProgress.objects.filter(lesson=self, student=user).values('is_completed')[:1],
+			))
+			.first()
+		)
+		if progress is None:
+			# As in the methods above: no materials before it, or none in it.
+			counts = Material.objects.filter(lesson__course_id=self.course_id, lesson__order__lte=self.order).aggregate(
+				earlier=models.Count('pk', filter=models.Q(lesson__order__lt=self.order)),
+				own=models.Count('pk', filter=models.Q(lesson=self)),
+			)
+			return not counts['earlier'] or not counts['own']
+		if progress.lesson_completed is None:
+			return progress.unlocks(self.order) or not self.materials.exists()
+		return progress.lesson_completed or progress.unlocks(self.order)
 
 
 class Material(models.Model):
@@ -78,11 +154,25 @@ class Material(models.Model):
 		(MULTI_CHOICE, _('Multiple choice')),
 		(FREE_RESPONSE, _('Free response')),
 	]
+	TRANSCODE_NONE = ''
+	TRANSCODE_QUEUED = 'queued'
+	TRANSCODE_PROCESSING = 'processing'
+	TRANSCODE_READY = 'ready'
+	TRANSCODE_FAILED = 'failed'
+	TRANSCODE_STATUS_CHOICES = [
+		(TRANSCODE_NONE, _('Not a video')),
+		(TRANSCODE_QUEUED, _('Queued')),
+		(TRANSCODE_PROCESSING, _('Processing')),
+		(TRANSCODE_READY, _('Ready')),
+		(TRANSCODE_FAILED, _('Failed')),
+	]
 
 	lesson = models.ForeignKey(
 		Lesson,
 		on_delete=models.CASCADE,
 		related_name='materials',
+		# Covered by material_lesson_order_idx.
+		db_index=False,
 	)
 	title = models.CharField(max_length=255)
 	material_type = models.CharField(
@@ -98,6 +188,22 @@ class Material(models.Model):
 		help_text=_('Upload videos, PDFs, images, or other assets that play inline.'),
 	)
 	is_protected = models.BooleanField(default=True, help_text=_('Controls UI hints that discourage downloads/copying.'))
+	# HLS renditions of uploaded videos, written by courses.transcoding.
+	transcode_status = models.CharField(
+		max_length=16,
+		choices=TRANSCODE_STATUS_CHOICES,
+		blank=True,
+		default=TRANSCODE_NONE,
+		verbose_name=_('Transcoding'),
+	)
+	hls_playlist = models.CharField(
+		max_length=255,
+		blank=True,
+		help_text=_('Master HLS playlist of the transcoded video, relative to the media root.'),
+	)
+	poster = models.CharField(max_length=255, blank=True, help_text=_('Poster frame of the transcoded video.'))
+	renditions = models.JSONField(blank=True, null=True, help_text=_('Name, height and bandwidth of each HLS rendition.'))
+	transcode_error = models.TextField(blank=True)
 	question_type = models.CharField(max_length=24, choices=QUESTION_TYPE_CHOICES, blank=True)
 	question_payload = models.JSONField(
 		blank=True,
@@ -112,6 +218,15 @@ class Material(models.Model):
 		ordering = ['order', 'title']
 		verbose_name = _('material')
 		verbose_name_plural = _('materials')
+		indexes = [
+			models.Index(fields=['lesson', 'order'], name='material_lesson_order_idx'),
+			# Work queue of the transcoding worker.
+			models.Index(
+				fields=['updated_at'],
+				name='material_transcode_queued_idx',
+				condition=models.Q(transcode_status='queued'),
+			),
+		]
 
 	def __str__(self):
 		return f"{self.lesson.title} — {self.title}"
@@ -158,6 +273,8 @@ class Enrollment(models.Model):
 		settings.AUTH_USER_MODEL,
 		on_delete=models.CASCADE,
 		related_name='enrollments',
+		# Covered by enrollment_student_status_idx.
+		db_index=False,
 		verbose_name=_('Student'),
 	)
 	status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
@@ -168,6 +285,16 @@ class Enrollment(models.Model):
 		unique_together = ('course', 'student')
 		verbose_name = _('enrollment')
 		verbose_name_plural = _('enrollments')
+		indexes = [
+			# A student's accepted courses (home, profile, dashboards).
+			models.Index(fields=['student', 'status'], name='enrollment_student_status_idx'),
+			# Enrollment requests waiting for an answer (admin, dashboard).
+			models.Index(
+				fields=['-requested_at'],
+				name='enrollment_pending_idx',
+				condition=models.Q(status='pending'),
+			),
+		]
 
 	def __str__(self):
 		return f"{self.student} — {self.course} ({self.status})"
@@ -187,9 +314,14 @@ class Enrollment(models.Model):
 
 
 class TaskSubmission(models.Model):
+	MAX_ATTEMPTS = 3
+	PASSING_SCORE = 90
+
+	STATUS_QUEUED = 'queued'
 	STATUS_PENDING = 'pending'
 	STATUS_GRADED = 'graded'
 	STATUS_CHOICES = [
+		(STATUS_QUEUED, _('Awaiting grading')),
 		(STATUS_PENDING, _('Pending review')),
 		(STATUS_GRADED, _('Graded')),
 	]
@@ -205,6 +337,8 @@ class TaskSubmission(models.Model):
 		settings.AUTH_USER_MODEL,
 		on_delete=models.CASCADE,
 		related_name='task_submissions',
+		# Covered by submission_student_recent_idx.
+		db_index=False,
 		verbose_name=_('Student'),
 	)
 	answer_payload = models.JSONField(
@@ -222,6 +356,11 @@ class TaskSubmission(models.Model):
 	attempt_number = models.PositiveIntegerField(default=1, verbose_name=_('Attempt number'))
 	submitted_at = models.DateTimeField(auto_now_add=True)
 	graded_at = models.DateTimeField(null=True, blank=True)
+	graded_manually = models.BooleanField(
+		default=False,
+		verbose_name=_('Graded manually'),
+		help_text=_('Score set by an administrator; regrading leaves it alone.'),
+	)
 
 	class Meta:
 		ordering = ['-submitted_at']
@@ -229,6 +368,24 @@ class TaskSubmission(models.Model):
 		verbose_name_plural = _('task submissions')
 		indexes = [
 			models.Index(fields=['material', 'student', '-submitted_at']),
+			models.Index(fields=['student', '-submitted_at'], name='submission_student_recent_idx'),
+			# Work queues: the grading worker and manual review in the admin.
+			models.Index(
+				fields=['submitted_at'],
+				name='submission_queued_idx',
+				condition=models.Q(status='queued'),
+			),
+			models.Index(
+				fields=['-submitted_at'],
+				name='submission_pending_idx',
+				condition=models.Q(status='pending'),
+			),
+		]
+		constraints = [
+			models.UniqueConstraint(
+				fields=['material', 'student', 'attempt_number'],
+				name='unique_submission_attempt',
+			),
 		]
 
 	def __str__(self):
@@ -239,36 +396,21 @@ class TaskSubmission(models.Model):
 		Automatically grade single/multiple choice questions.
 		Returns True if graded, False if manual review required.
 		"""
-		if self.material.question_type == Material.FREE_RESPONSE:
-			return False
+		from .grading import AnswerKey
 
-		payload = self.material.question_payload
-		if not payload or 'correct_answer' not in payload:
+		score = AnswerKey(self.material).score(self.answer_payload)
+		if score is None:
 			return False
 
-		correct = payload['correct_answer']
-		answer = self.answer_payload.get('answer')
-
-		if self.material.question_type == Material.SINGLE_CHOICE:
-			self.score = 100 if answer == correct else 0
-		elif self.material.question_type == Material.MULTI_CHOICE:
-			if not isinstance(answer, list) or not isinstance(correct, list):
-				return False
-			answer_set = set(answer)
-			correct_set = set(correct)
-			if answer_set == correct_set:
-				self.score = 100
-			else:
-				self.score = 0
-
+		self.score = score
 		self.status = self.STATUS_GRADED
 		self.graded_at = timezone.now()
 		self.save(update_fields=['score', 'status', 'graded_at'])
 		return True
 
 	def is_passing(self):
-		"""Check if submission meets 90% passing threshold."""
-		return self.score is not None and self.score >= 90
+		"""Check if submission meets the PASSING_SCORE threshold."""
+		return self.score is not None and self.score >= self.PASSING_SCORE
 
 	@classmethod
 	def get_attempts_count(cls, material, student):
@@ -277,8 +419,41 @@ class TaskSubmission(models.Model):
 
 	@classmethod
 	def can_submit(cls, material, student):
-		"""Check if student can submit (hasn't exceeded 3 attempts)."""
-		return cls.get_attempts_count(material, student) < 3
+		"""Check if student can submit (hasn't exceeded MAX_ATTEMPTS attempts)."""
+		return cls.get_attempts_count(material, student) < cls.MAX_ATTEMPTS
+
+	@classmethod
+	def submit(cls, material, student, answer_payload, status=STATUS_PENDING):
+		"""
+		Record the student's next attempt, or return None if no attempts are left.
+
+		The limit is on the number of attempts, like ``can_submit``, and is
+		checked with the student's enrollment in the course locked so
+		concurrent submits to that course see each other. Numbers continue
+		after the highest one, so an attempt an admin deleted frees a try
+		without reusing its number; the unique constraint on the number backs
+		this up where ``FOR UPDATE`` is not supported. Raises ``IntegrityError``
+		if the number is still taken after ``MAX_ATTEMPTS`` tries.
+		"""
+		attempts = cls.objects.filter(material=material, student=student).order_by()
+		enrollment = Enrollment.objects.select_for_update().filter(course_id=material.lesson.course_id, student=student)
+		for retry in range(cls.MAX_ATTEMPTS):
+			try:
+				with transaction.atomic():
+					list(enrollment.values_list('pk', flat=True))
+					used = attempts.aggregate(count=models.Count('pk'), last=models.Max('attempt_number'))
+					if used['count'] >= cls.MAX_ATTEMPTS:
+						return None
+					return cls.objects.create(
+						material=material,
+						student=student,
+						answer_payload=answer_payload,
+						attempt_number=(used['last'] or 0) + 1,
+						status=status,
+					)
+			except IntegrityError:
+				if retry == cls.MAX_ATTEMPTS - 1:
+					raise
 
 
 class MaterialCompletion(models.Model):
@@ -292,6 +467,8 @@ class MaterialCompletion(models.Model):
 		settings.AUTH_USER_MODEL,
 		on_delete=models.CASCADE,
 		related_name='material_completions',
+		# Covered by completion_student_idx.
+		db_index=False,
 		verbose_name=_('Student'),
 	)
 	completed_at = models.DateTimeField(auto_now_add=True)
@@ -300,3 +477,124 @@ class MaterialCompletion(models.Model):
 		unique_together = ('material', 'student')
 		verbose_name = _('material completion')
 		verbose_name_plural = _('material completions')
+		indexes = [
+			# The unique index leads with material; progress reads go by student.
+			models.Index(fields=['student', 'material'], name='completion_student_idx'),
+		]
+
+
+class LessonProgress(models.Model):
+	"""
+	Materialized completion state of one lesson for one student.
+	Kept in sync by ``courses.progress``; never edit rows by hand.
+	"""
+	lesson = models.ForeignKey(
+		Lesson,
+		on_delete=models.CASCADE,
+		related_name='progress_records',
+		verbose_name=_('Lesson'),
+	)
+	student = models.ForeignKey(
+		settings.AUTH_USER_MODEL,
+		on_delete=models.CASCADE,
+		related_name='lesson_progress',
+		verbose_name=_('Student'),
+	)
+	completed_materials = models.PositiveIntegerField(default=0, verbose_name=_('Completed materials'))
+	total_materials = models.PositiveIntegerField(default=0, verbose_name=_('Total materials'))
+	is_completed = models.BooleanField(default=False, verbose_name=_('Is completed'))
+
+	class Meta:
+		unique_together = ('lesson', 'student')
+		verbose_name = _('lesson progress')
+		verbose_name_plural = _('lesson progress')
+
+	def __str__(self):
+		return f"{self.student} — {self.lesson.title} ({self.completed_materials}/{self.total_materials})"
+
+
+class CourseProgress(models.Model):
+	"""
+	Materialized sequential-unlock state of one course for one student.
+	``highest_unlocked_order`` is the order of the first incomplete lesson;
+	every lesson up to and including that order is available. ``None``
+	means every lesson is completed and therefore available.
+	"""
+	course = models.ForeignKey(
+		Course,
+		on_delete=models.CASCADE,
+		related_name='progress_records',
+		verbose_name=_('Course'),
+	)
+	student = models.ForeignKey(
+		settings.AUTH_USER_MODEL,
+		on_delete=models.CASCADE,
+		related_name='course_progress',
+		verbose_name=_('Student'),
+	)
+	completed_lessons = models.PositiveIntegerField(default=0, verbose_name=_('Completed lessons'))
+	highest_unlocked_order = models.PositiveIntegerField(null=True, blank=True, verbose_name=_('Highest unlocked order'))
+
+	class Meta:
+		unique_together = ('course', 'student')
+		verbose_name = _('course progress')
+		verbose_name_plural = _('course progress')
+
+	def __str__(self):
+		return f"{self.student} — {self.course.title}"
+
+	def unlocks(self, order):
+		return self.highest_unlocked_order is None or order <= self.highest_unlocked_order
+
+
+class UploadSession(models.Model):
+	"""
+	Resumable chunked upload of a ``Material.media_file`` (courses/uploads.py).
+	Chunks are appended to ``part_path`` until ``offset`` reaches ``size``;
+	uploads with a ``checksum`` then wait in ``verifying`` for the worker.
+	"""
+	STATUS_ACTIVE = 'active'
+	STATUS_VERIFYING = 'verifying'
+	STATUS_COMPLETED = 'completed'
+	STATUS_REJECTED = 'rejected'
+	STATUS_CHOICES = [
+		(STATUS_ACTIVE, _('Uploading')),
+		(STATUS_VERIFYING, _('Verifying')),
+		(STATUS_COMPLETED, _('Completed')),
+		(STATUS_REJECTED, _('Checksum mismatch')),
+	]
+
+	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	material = models.ForeignKey(
+		Material,
+		on_delete=models.CASCADE,
+		related_name='upload_sessions',
+		verbose_name=_('Material'),
+	)
+	created_by = models.ForeignKey(
+		settings.AUTH_USER_MODEL,
+		on_delete=models.CASCADE,
+		related_name='upload_sessions',
+		verbose_name=_('Created by'),
+	)
+	filename = models.CharField(max_length=255, verbose_name=_('File name'))
+	size = models.PositiveBigIntegerField(verbose_name=_('Size'))
+	offset = models.PositiveBigIntegerField(default=0, verbose_name=_('Received bytes'))
+	checksum = models.CharField(max_length=64, blank=True, help_text=_('Expected SHA-256 of the whole file, hex encoded.'))
+	status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_ACTIVE, verbose_name=_('Status'))
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		ordering = ['-created_at']
+		verbose_name = _('upload session')
+		verbose_name_plural = _('upload sessions')
+
+	def __str__(self):
+		return f"{self.filename} ({self.offset}/{self.size})"
+
+	@property
+	def part_path(self):
+		# Next to the media files by default, so finishing is a rename.
+		directory = settings.UPLOAD_TEMP_DIR or os.path.join(settings.MEDIA_ROOT, '.uploads')
+		return os.path.join(directory, f'{self.pk}.part')
@@ -0,0 +1,120 @@
+"""
+Full-page caching of catalog pages for anonymous visitors.
+
+``cache_anonymous_page`` stores the rendered page per language and query
+string for ``ANONYMOUS_PAGE_CACHE_TIMEOUT`` seconds (0 disables it). Keys
+embed the ``catalog`` version from ``courses.caching``, which any change to
+a course, lesson or material replaces, so edits in the admin show up on
+the next request.
+
+Pages are rendered from the primary on a miss, even for ``REPLICA_VIEWS``:
+a lagging replica would otherwise get its answer stored under a version
+that a newer write already replaced.
+
+Pages contain CSRF tokens (language switcher, enroll button) that must
+match each visitor's cookie: they are stored as a placeholder and filled in
+with the visitor's own token when served.
+
+Only the ``CACHED_PARAMS`` values are cached: the catalog's sort orders
+and an empty search. Searches and any other parameter bypass the cache, so
+each page has a bounded number of entries however its query string is
+varied.
+"""
+import hashlib
+import re
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.translation import get_language
+
+from application.replicas import use_primary
+
+from . import caching
+
+# Cacheable values of each allowed query parameter.
+CACHED_PARAMS = {
+    'q': {''},
+    'sort': {'', 'relevance', 'title', '-title', 'lessons'},
+}
+
+_CSRF_INPUT_RE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+_CSRF_PLACEHOLDER = b'{{ page_cache_csrf_token }}'
+
+
+def _timeout():
+    return getattr(settings, 'ANONYMOUS_PAGE_CACHE_TIMEOUT', 600)
+
+
+def page_key(request):
+    """Cache key of the anonymous version of this page, ``None`` if it must not be cached."""
+    if not _timeout() or request.method not in ('GET', 'HEAD'):
+        return None
+    params = {}
+    for name, values in request.GET.lists():
+        value = values[-1].strip()
+        if name not in CACHED_PARAMS or len(values) > 1 or value not in CACHED_PARAMS[name]:
+            return None
+        if value:
+            params[name] = value
+    version_key = caching.catalog_version_key()
+    version = caching.get_versions([version_key])[version_key]
+    query = urlencode(sorted(params.items()))
+    digest = hashlib.md5(f'{request.path}?{query}'.encode(), usedforsecurity=False).hexdigest()
+    return f'courses:page:{version}:{get_language()}:{digest}'
+
+
+def _cached_response(request, entry):
+    content_type, content = entry
+    if _CSRF_PLACEHOLDER in content:
+        content = content.replace(_CSRF_PLACEHOLDER, get_token(request).encode())
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def _store(key, response):
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return
+    content = _CSRF_INPUT_RE.sub(rb'\1' + _CSRF_PLACEHOLDER + rb'\2', response.content)
+    cache.set(key, (response['Content-Type'], content), _timeout())
+    response['X-Page-Cache'] = 'miss'
+
+
+def cache_anonymous_page(view):
+    """Serve ``view`` from the page cache to anonymous visitors (sync or async views)."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            user = await request.auser()
+            key = None if user.is_authenticated else await sync_to_async(page_key)(request)
+            if key is None:
+                return await view(request, *args, **kwargs)
+            entry = await cache.aget(key)
+            if entry is not None:
+                return _cached_response(request, entry)
+            with use_primary():
+                response = await view(request, *args, **kwargs)
+            await sync_to_async(_store)(key, response)
+            return response
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = None if request.user.is_authenticated else page_key(request)
+        if key is None:
+            return view(request, *args, **kwargs)
+        entry = cache.get(key)
+        if entry is not None:
+            return _cached_response(request, entry)
+        with use_primary():
+            response = view(request, *args, **kwargs)
+        _store(key, response)
+        return response
+
+    return wrapper
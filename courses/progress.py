@@ -0,0 +1,304 @@
+"""
+Student progress: the bulk ``ProgressResolver`` used by listing pages and
+maintenance of the materialized ``LessonProgress``/``CourseProgress`` store.
+
+Every write that can change a student's progress (material completions,
+materials added or removed, lessons reordered) ends up in
+``refresh_progress`` which recomputes the affected rows from the source
+tables in a fixed number of queries. Inside ``deferred_refresh()`` the
+refreshes are collected and flushed once per course on exit, which is what
+bulk operations should use.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Count
+
+from application.replicas import use_primary
+
+from . import caching
+from .models import CourseProgress, Lesson, LessonProgress, Material, MaterialCompletion
+
+_state = threading.local()
+
+
+class ProgressResolver:
+    """
+    Completed/available state of every lesson of a course for one student.
+
+    Built from three queries (lessons, material ids, the student's completed
+    material ids) no matter how many courses are resolved at once, followed
+    by a single pass over the lessons in ``order``. Resolved courses are
+    cached per student (see ``courses.caching``).
+    """
+
+    def __init__(self, user, course, lessons, materials, completed_ids):
+        self.course = course
+        self.states = []
+        blocked_order = None
+        for lesson in lessons:
+            lesson.course = course
+            lesson_materials = materials.get(lesson.pk, [])
+            done = sum(material_id in completed_ids for material_id, _ in lesson_materials)
+            completed = user.is_authenticated and done == len(lesson_materials)
+            available = user.is_authenticated and (blocked_order is None or lesson.order <= blocked_order)
+            if not completed and blocked_order is None:
+                blocked_order = lesson.order
+            self.states.append({
+                'lesson': lesson,
+                'completed': completed,
+                'available': available,
+                'total_materials': len(lesson_materials),
+                'completed_materials': done,
+                'learning_count': sum(kind == Material.LEARNING for _, kind in lesson_materials),
+                'task_count': sum(kind == Material.TASK for _, kind in lesson_materials),
+            })
+
+    @classmethod
+    def for_course(cls, user, course):
+        return cls.for_courses(user, [course])[course.pk]
+
+    @classmethod
+    def for_courses(cls, user, courses):
+        """Resolve several courses for ``user``; returns ``{course_id: resolver}``."""
+        courses = {course.pk: course for course in courses}
+        if not courses or not user.is_authenticated:
+            return cls._load(user, courses)
+        keys = caching.progress_keys(user.pk, courses)
+        cached = caching.get_many(keys.values())
+        resolvers = {course_id: cached[key] for course_id, key in keys.items() if key in cached}
+        missing = {course_id: course for course_id, course in courses.items() if course_id not in resolvers}
+        if missing:
+            loaded = cls._load(user, missing)
+            caching.set_many({keys[course_id]: resolver for course_id, resolver in loaded.items()})
+            resolvers.update(loaded)
+        return resolvers
+
+    @classmethod
+    async def afor_course(cls, user, course):
+        return (await cls.afor_courses(user, [course]))[course.pk]
+
+    @classmethod
+    async def afor_courses(cls, user, courses):
+        # The cache backends are synchronous, so the whole lookup runs in a worker thread.
+        return await sync_to_async(cls.for_courses)(user, courses)
+
+    @classmethod
+    def _load(cls, user, courses):
+        if not courses:
+            return {}
+        # Cached under versions that only commits on the primary replace.
+        with use_primary():
+            return cls._query(user, courses)
+
+    @classmethod
+    def _query(cls, user, courses):
+        lessons = defaultdict(list)
+        for lesson in Lesson.objects.filter(course_id__in=courses).order_by('order', 'title'):
+            lessons[lesson.course_id].append(lesson)
+        materials = defaultdict(list)
+        for material_id, lesson_id, material_type in (
+            Material.objects.filter(lesson__course_id__in=courses)
+            .order_by()
+            .values_list('id', 'lesson_id', 'material_type')
+        ):
+            materials[lesson_id].append((material_id, material_type))
+        completed_ids = set()
+        if user.is_authenticated:
+            completed_ids = set(
+                MaterialCompletion.objects.filter(student=user, material__lesson__course_id__in=courses)
+                .values_list('material_id', flat=True)
+            )
+        return {
+            course_id: cls(user, course, lessons[course_id], materials, completed_ids)
+            for course_id, course in courses.items()
+        }
+
+    @property
+    def total_lessons(self):
+        return len(self.states)
+
+    @property
+    def completed_lessons(self):
+        return sum(state['completed'] for state in self.states)
+
+    @property
+    def is_completed(self):
+        return bool(self.states) and self.completed_lessons == self.total_lessons
+
+    @property
+    def progress_percentage(self):
+        return round(self.completed_lessons / self.total_lessons * 100) if self.states else 0
+
+    @property
+    def next_lesson(self):
+        """First lesson that is available but not yet completed."""
+        for state in self.states:
+            if state['available'] and not state['completed']:
+                return state['lesson']
+        return None
+
+    @property
+    def total_materials(self):
+        return sum(state['total_materials'] for state in self.states)
+
+    @property
+    def learning_count(self):
+        return sum(state['learning_count'] for state in self.states)
+
+    @property
+    def task_count(self):
+        return sum(state['task_count'] for state in self.states)
+
+
+def _pending():
+    return getattr(_state, 'pending', None)
+
+
+@contextmanager
+def deferred_refresh():
+    """Collect progress refreshes and run them once per course on exit."""
+    if _pending() is not None:
+        # Nested block: the outermost one flushes.
+        yield
+        return
+    _state.pending = defaultdict(set)
+    try:
+        yield
+        pending = _state.pending
+    finally:
+        _state.pending = None
+    for course_id, student_ids in pending.items():
+        _refresh(course_id, None if None in student_ids else student_ids)
+
+
+def refresh_progress(course_id, student_ids=None):
+    """
+    Recompute stored progress for ``student_ids`` in ``course_id`` and drop
+    their cached progress. ``None`` means the course structure changed:
+    every student that has progress in the course is affected.
+    """
+    pending = _pending()
+    if pending is not None:
+        if student_ids is None:
+            pending[course_id].add(None)
+        else:
+            pending[course_id].update(student_ids)
+        return
+    _refresh(course_id, student_ids)
+
+
+def _refresh(course_id, student_ids):
+    rebuild_course_progress(course_id, student_ids)
+    if student_ids is None:
+        caching.invalidate_structure(course_id)
+    else:
+        for student_id in student_ids:
+            caching.invalidate_progress(student_id, course_id)
+
+
+def rebuild_course_progress(course_id, student_ids=None):
+    """
+    Rebuild progress rows for a course from lessons, materials and completions.
+
+    The affected ``CourseProgress`` rows are locked before anything is read,
+    so two refreshes for the same student (two tabs completing materials)
+    run one after the other and the second sees the first one's completion
+    instead of overwriting its result with a stale count.
+    """
+    with transaction.atomic():
+        _rebuild_course_progress(course_id, student_ids)
+
+
+def _rebuild_course_progress(course_id, student_ids):
+    courses = CourseProgress.objects.filter(course_id=course_id)
+    if student_ids is not None:
+        student_ids = set(student_ids)
+        # Rows to lock for students that have no progress yet.
+        CourseProgress.objects.bulk_create(
+            [CourseProgress(course_id=course_id, student_id=student_id) for student_id in sorted(student_ids)],
+            ignore_conflicts=True,
+        )
+        courses = courses.filter(student_id__in=student_ids)
+    existing_courses = {p.student_id: p for p in courses.select_for_update().order_by('student_id')}
+
+    lessons = list(
+        Lesson.objects.filter(course_id=course_id)
+        .annotate(total=Count('materials'))
+        .order_by('order')
+        .values_list('id', 'order', 'total')
+    )
+    completions = MaterialCompletion.objects.filter(material__lesson__course_id=course_id)
+    records = LessonProgress.objects.filter(lesson__course_id=course_id)
+    if student_ids is not None:
+        completions = completions.filter(student_id__in=student_ids)
+        records = records.filter(student_id__in=student_ids)
+
+    completed = defaultdict(dict)
+    for student_id, lesson_id, count in (
+        completions.order_by()
+        .values_list('student_id', 'material__lesson_id')
+        .annotate(count=Count('id'))
+    ):
+        completed[student_id][lesson_id] = count
+
+    existing_records = {(r.student_id, r.lesson_id): r for r in records}
+    students = set(completed) | {student_id for student_id, _ in existing_records} | set(existing_courses)
+    if student_ids is not None:
+        students |= student_ids
+
+    records_to_create, records_to_update = [], []
+    courses_to_create, courses_to_update = [], []
+    for student_id in students:
+        done_lessons = 0
+        unlocked_order = None
+        for lesson_id, order, total in lessons:
+            done = min(completed[student_id].get(lesson_id, 0), total)
+            is_completed = done >= total
+            if is_completed:
+                done_lessons += 1
+            elif unlocked_order is None:
+                unlocked_order = order
+            record = existing_records.get((student_id, lesson_id))
+            if record is None:
+                records_to_create.append(LessonProgress(
+                    lesson_id=lesson_id,
+                    student_id=student_id,
+                    completed_materials=done,
+                    total_materials=total,
+                    is_completed=is_completed,
+                ))
+            elif (record.completed_materials, record.total_materials, record.is_completed) != (done, total, is_completed):
+                record.completed_materials = done
+                record.total_materials = total
+                record.is_completed = is_completed
+                records_to_update.append(record)
+
+        progress = existing_courses.get(student_id)
+        if progress is None:
+            courses_to_create.append(CourseProgress(
+                course_id=course_id,
+                student_id=student_id,
+                completed_lessons=done_lessons,
+                highest_unlocked_order=unlocked_order,
+            ))
+        elif (progress.completed_lessons, progress.highest_unlocked_order) != (done_lessons, unlocked_order):
+            progress.completed_lessons = done_lessons
+            progress.highest_unlocked_order = unlocked_order
+            courses_to_update.append(progress)
+
+    LessonProgress.objects.bulk_create(records_to_create, batch_size=500, ignore_conflicts=True)
+    LessonProgress.objects.bulk_update(
+        records_to_update,
+        ['completed_materials', 'total_materials', 'is_completed'],
+        batch_size=500,
+    )
+    CourseProgress.objects.bulk_create(courses_to_create, batch_size=500, ignore_conflicts=True)
+    CourseProgress.objects.bulk_update(
+        courses_to_update,
+        ['completed_lessons', 'highest_unlocked_order'],
+        batch_size=500,
+    )
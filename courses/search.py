@@ -0,0 +1,97 @@
+"""
+Course catalog search.
+
+On PostgreSQL courses carry a stored ``search_vector`` (title weighted A,
+summary weighted B) built for every configured language and indexed with
+GIN, plus a trigram index on ``title`` for typo-tolerant fallback matching.
+Other backends (SQLite in local development) fall back to ``icontains``
+with a simple title-first ranking.
+"""
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils.translation import get_language
+
+# PostgreSQL text search configuration per ``settings.LANGUAGES`` code.
+# There is no Uzbek dictionary, so it uses the language-neutral one.
+SEARCH_CONFIGS = {
+    'uz': 'simple',
+    'en': 'english',
+    'ru': 'russian',
+}
+TRIGRAM_THRESHOLD = 0.3
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def course_search_vector():
+    """Vector expression stored in ``Course.search_vector``."""
+    vector = None
+    for config in dict.fromkeys(SEARCH_CONFIGS.values()):
+        part = (
+            SearchVector('title', weight='A', config=config)
+            + SearchVector('summary', weight='B', config=config)
+        )
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def update_search_vectors(queryset):
+    """Recompute the stored vectors of ``queryset`` (no-op off PostgreSQL)."""
+    if is_supported(queryset.db):
+        queryset.update(search_vector=course_search_vector())
+
+
+def _search_query(text):
+    config = SEARCH_CONFIGS.get((get_language() or '').split('-')[0], 'simple')
+    query = SearchQuery(text, config=config, search_type='websearch')
+    tokens = _TOKEN_RE.findall(text)
+    if tokens:
+        # Prefix match on the language-neutral lexemes so partially typed words hit.
+        prefix = ' & '.join(f'{token}:*' for token in tokens)
+        query |= SearchQuery(prefix, config='simple', search_type='raw')
+    return query
+
+
+def search_courses(queryset, text):
+    """
+    Filter ``queryset`` to courses matching ``text`` ordered by relevance.
+    Falls back to trigram similarity on the title when nothing matches.
+    """
+    if not is_supported(queryset.db):
+        return (
+            queryset.filter(Q(title__icontains=text) | Q(summary__icontains=text))
+            .annotate(rank=Case(
+                When(title__istartswith=text, then=Value(3)),
+                When(title__icontains=text, then=Value(2)),
+                default=Value(1),
+                output_field=IntegerField(),
+            ))
+            .order_by('-rank', 'title')
+        )
+
+    query = _search_query(text)
+    ranked = (
+        queryset.filter(search_vector=query)
+        .annotate(rank=SearchRank(F('search_vector'), query))
+        .order_by('-rank', 'title')
+    )
+    if ranked.exists():
+        return ranked
+    return (
+        queryset.filter(title__trigram_word_similar=text)
+        .annotate(rank=TrigramWordSimilarity(text, 'title'))
+        .filter(rank__gte=TRIGRAM_THRESHOLD)
+        .order_by('-rank', 'title')
+    )
@@ -0,0 +1,143 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching
+from .counters import refresh_course_counters, refresh_lesson_counters
+from .models import Course, Enrollment, Lesson, Material, MaterialCompletion, TaskSubmission
+from .progress import refresh_progress
+from .search import update_search_vectors
+from .transcoding import queue_if_changed
+
+
+def _origin_model(origin):
+    """Model whose deletion started the current delete (may be a cascade)."""
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+def _course_id_for_material(material_id):
+    return Lesson.objects.filter(materials=material_id).values_list('course_id', flat=True).first()
+
+
+def _course_id_for(instance):
+    """Course of a completion's or submission's material, without a query when the view loaded it."""
+    if type(instance).material.is_cached(instance) and Material.lesson.is_cached(instance.material):
+        return instance.material.lesson.course_id
+    return _course_id_for_material(instance.material_id)
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'title', 'summary'} & set(update_fields):
+        update_search_vectors(Course.objects.filter(pk=instance.pk))
+    caching.invalidate_structure(instance.pk)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    caching.invalidate_structure(instance.pk)
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or 'status' in update_fields:
+        refresh_course_counters([instance.course_id])
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, origin=None, **kwargs):
+    if _origin_model(origin) is not Course:
+        refresh_course_counters([instance.course_id])
+
+
+@receiver(post_save, sender=MaterialCompletion)
+def completion_saved(sender, instance, created, **kwargs):
+    if created:
+        refresh_progress(_course_id_for(instance), [instance.student_id])
+
+
+@receiver(post_delete, sender=MaterialCompletion)
+def completion_deleted(sender, instance, origin=None, **kwargs):
+    if _origin_model(origin) is MaterialCompletion:
+        refresh_progress(_course_id_for(instance), [instance.student_id])
+
+
+@receiver(post_save, sender=TaskSubmission)
+def submission_saved(sender, instance, **kwargs):
+    caching.invalidate_progress(instance.student_id, _course_id_for(instance))
+
+
+@receiver(post_delete, sender=TaskSubmission)
+def submission_deleted(sender, instance, origin=None, **kwargs):
+    if _origin_model(origin) is TaskSubmission:
+        caching.invalidate_progress(instance.student_id, _course_id_for(instance))
+
+
+@receiver(pre_save, sender=Material)
+def material_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        queue_if_changed(instance)
+    # Lesson, course and type before the save, to tell a move from an edit.
+    instance._previous_row = None
+    if instance.pk is not None:
+        instance._previous_row = (
+            Material.objects.filter(pk=instance.pk)
+            .values_list('lesson_id', 'lesson__course_id', 'material_type')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Material)
+def material_saved(sender, instance, created, **kwargs):
+    course_id = instance.lesson.course_id
+    previous = getattr(instance, '_previous_row', None)
+    if not created and previous is not None and previous[0] == instance.lesson_id:
+        # Same lesson: completion counts and unlocks cannot change, only
+        # what the cached pages show (and the task count on a type change).
+        if previous[2] != instance.material_type:
+            refresh_lesson_counters([instance.lesson_id])
+        caching.invalidate_structure(course_id)
+        return
+    lesson_ids, course_ids = {instance.lesson_id}, {course_id}
+    if previous is not None:
+        lesson_ids.add(previous[0])
+        course_ids.add(previous[1])
+    refresh_lesson_counters(sorted(lesson_ids))
+    for changed_course_id in sorted(course_ids):
+        refresh_progress(changed_course_id)
+
+
+@receiver(post_delete, sender=Material)
+def material_deleted(sender, instance, origin=None, **kwargs):
+    if _origin_model(origin) is Material:
+        refresh_lesson_counters([instance.lesson_id])
+        refresh_progress(instance.lesson.course_id)
+
+
+@receiver(pre_save, sender=Lesson)
+def lesson_saving(sender, instance, **kwargs):
+    # Course and order before the save, to tell a move or reorder from an edit.
+    instance._previous_row = None
+    if instance.pk is not None:
+        instance._previous_row = Lesson.objects.filter(pk=instance.pk).values_list('course_id', 'order').first()
+
+
+@receiver(post_save, sender=Lesson)
+def lesson_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_row', None)
+    moved = previous is not None and previous[0] != instance.course_id
+    if created or moved:
+        refresh_course_counters([instance.course_id, previous[0]] if moved else [instance.course_id])
+    if moved:
+        refresh_progress(previous[0])
+    if created or moved or previous is None or previous[1] != instance.order:
+        refresh_progress(instance.course_id)
+    else:
+        caching.invalidate_structure(instance.course_id)
+
+
+@receiver(post_delete, sender=Lesson)
+def lesson_deleted(sender, instance, origin=None, **kwargs):
+    if _origin_model(origin) is Lesson:
+        refresh_course_counters([instance.course_id])
+        refresh_progress(instance.course_id)
@@ -0,0 +1,115 @@
+// Resumable chunked upload of large material media (tus 1.0, see courses/uploads.py).
+// Progress survives reloads: the upload URL is kept in localStorage per file.
+// Each chunk carries an Upload-Checksum; no whole-file checksum is sent, since
+// hashing a multi-gigabyte file here would mean reading it all a second time.
+(function () {
+    'use strict';
+
+    var RETRIES = 5;
+
+    function csrfToken() {
+        var input = document.querySelector('input[name=csrfmiddlewaretoken]');
+        return input ? input.value : '';
+    }
+
+    function encode(value) {
+        return btoa(unescape(encodeURIComponent(String(value))));
+    }
+
+    function request(method, url, headers, body) {
+        headers = Object.assign({'Tus-Resumable': '1.0.0', 'X-CSRFToken': csrfToken()}, headers);
+        return fetch(url, {method: method, headers: headers, body: body, credentials: 'same-origin'});
+    }
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    async function chunkChecksum(blob) {
+        if (!window.crypto || !crypto.subtle) {
+            return null;  // Only available on HTTPS (and localhost).
+        }
+        var digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        return 'sha256 ' + btoa(String.fromCharCode.apply(null, new Uint8Array(digest)));
+    }
+
+    async function resumeOffset(url) {
+        var response = await request('HEAD', url);
+        return response.ok ? parseInt(response.headers.get('Upload-Offset'), 10) : null;
+    }
+
+    async function create(input, file) {
+        var response = await request('POST', input.dataset.endpoint, {
+            'Upload-Length': String(file.size),
+            'Upload-Metadata': 'material ' + encode(input.dataset.material) + ',filename ' + encode(file.name),
+        });
+        if (response.status !== 201) {
+            throw new Error(await response.text());
+        }
+        return response.headers.get('Location');
+    }
+
+    async function upload(input, file, status) {
+        var key = ['resumable-upload', input.dataset.material, file.name, file.size, file.lastModified].join(':');
+        var chunkSize = parseInt(input.dataset.chunkSize, 10);
+        var url = localStorage.getItem(key);
+        var offset = url ? await resumeOffset(url) : null;
+        if (offset === null) {
+            url = await create(input, file);
+            offset = 0;
+            localStorage.setItem(key, url);
+        }
+
+        var failures = 0;
+        while (offset < file.size) {
+            status.textContent = Math.floor(offset * 100 / file.size) + '%';
+            var chunk = file.slice(offset, offset + chunkSize);
+            var headers = {'Content-Type': 'application/offset+octet-stream', 'Upload-Offset': String(offset)};
+            var checksum = await chunkChecksum(chunk);
+            if (checksum) {
+                headers['Upload-Checksum'] = checksum;
+            }
+            var response = null;
+            try {
+                response = await request('PATCH', url, headers, chunk);
+            } catch (error) {
+                // Network error: fall through to the retry below.
+            }
+            if (response && response.ok) {
+                offset = parseInt(response.headers.get('Upload-Offset'), 10);
+                failures = 0;
+                continue;
+            }
+            if (response && [400, 403, 404, 413, 415].indexOf(response.status) !== -1) {
+                localStorage.removeItem(key);
+                throw new Error(await response.text());
+            }
+            if (++failures > RETRIES) {
+                throw new Error('Upload interrupted; choose the file again to resume.');
+            }
+            await sleep(1000 * failures);
+            // 409 or a dropped connection: ask the server where to continue.
+            var current = await resumeOffset(url).catch(function () { return null; });
+            if (current !== null) {
+                offset = current;
+            }
+        }
+        localStorage.removeItem(key);
+    }
+
+    document.addEventListener('change', function (event) {
+        var input = event.target;
+        if (!input.classList || !input.classList.contains('resumable-upload') || !input.files.length) {
+            return;
+        }
+        var status = input.parentNode.querySelector('.resumable-upload-status');
+        input.disabled = true;
+        upload(input, input.files[0], status).then(function () {
+            status.textContent = '100%';
+            window.location.reload();
+        }, function (error) {
+            status.textContent = error.message;
+            input.disabled = false;
+        });
+    });
+})();
@@ -0,0 +1,251 @@
+"""
+Synthetic data for load testing (``populate_test_data --scale``).
+
+Everything is derived from a seed: the catalog from the seed itself and
+each block of students from ``(seed, block)``. The same options therefore
+produce the same rows no matter how many worker processes share the
+student blocks. Rows are written with ``bulk_create`` in batches, which
+bypasses signals, so ``finalize`` recomputes counters, search vectors and
+progress at the end.
+"""
+import multiprocessing
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.utils import timezone
+
+from .counters import refresh_course_counters, refresh_lesson_counters
+from .models import Course, Enrollment, Lesson, Material, MaterialCompletion, TaskSubmission
+from .progress import rebuild_course_progress
+from .search import update_search_vectors
+
+PASSWORD = 'password'
+STUDENT_BLOCK = 500
+
+WORDS = (
+    'python', 'django', 'data', 'web', 'design', 'algebra', 'history', 'english', 'networks',
+    'security', 'statistics', 'biology', 'marketing', 'finance', 'physics', 'chemistry',
+    'introduction', 'advanced', 'practical', 'applied', 'modern', 'fundamentals', 'project',
+)
+CHOICES = ['A', 'B', 'C', 'D']
+
+# Catalog shared with the worker processes (inherited on fork, not pickled per job).
+_structure = {}
+
+
+class _Writer:
+    """Buffers model instances and flushes them with ``bulk_create``."""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, obj):
+        model = type(obj)
+        buffer = self.buffers.setdefault(model, [])
+        buffer.append(obj)
+        if len(buffer) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model=None):
+        for model in [model] if model else list(self.buffers):
+            rows = self.buffers.get(model)
+            if rows:
+                model.objects.bulk_create(rows, batch_size=self.batch_size, ignore_conflicts=True)
+                self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(rows)
+                self.buffers[model] = []
+
+
+def _title(rnd, words):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def _task_payload(rnd, question_type):
+    if question_type == Material.SINGLE_CHOICE:
+        return {'question': _title(rnd, 6) + '?', 'choices': CHOICES, 'correct_answer': rnd.choice(CHOICES)}
+    if question_type == Material.MULTI_CHOICE:
+        return {'question': _title(rnd, 6) + '?', 'choices': CHOICES, 'correct_answer': sorted(rnd.sample(CHOICES, 2))}
+    return {'question': _title(rnd, 8) + '?'}
+
+
+def create_catalog(prefix, seed, courses, lessons, materials, batch_size):
+    """Create the courses, lessons and materials; returns the course ids."""
+    rnd = random.Random(seed)
+    Course.objects.bulk_create(
+        [
+            Course(
+                title=f'{_title(rnd, 3)} {index}',
+                slug=f'{prefix}-{index:06d}',
+                summary=_title(rnd, 20),
+                is_published=rnd.random() < 0.9,
+            )
+            for index in range(courses)
+        ],
+        batch_size=batch_size,
+    )
+    course_ids = list(Course.objects.filter(slug__startswith=f'{prefix}-').order_by('slug').values_list('pk', flat=True))
+    Lesson.objects.bulk_create(
+        [
+            Lesson(course_id=course_id, title=_title(rnd, 4), slug=f'lesson-{order}', order=order)
+            for course_id in course_ids
+            for order in range(lessons)
+        ],
+        batch_size=batch_size,
+    )
+    writer = _Writer(batch_size)
+    for lesson_id in Lesson.objects.filter(course_id__in=course_ids).order_by('pk').values_list('pk', flat=True).iterator():
+        for order in range(materials):
+            if rnd.random() < 0.7:
+                writer.add(Material(
+                    lesson_id=lesson_id, title=_title(rnd, 3), order=order,
+                    material_type=Material.LEARNING, content=_title(rnd, 60),
+                ))
+                continue
+            question_type = rnd.choices(
+                (Material.SINGLE_CHOICE, Material.MULTI_CHOICE, Material.FREE_RESPONSE), weights=(50, 35, 15),
+            )[0]
+            writer.add(Material(
+                lesson_id=lesson_id, title=_title(rnd, 3), order=order,
+                material_type=Material.TASK, question_type=question_type,
+                question_payload=_task_payload(rnd, question_type),
+            ))
+    writer.flush()
+    return course_ids
+
+
+def load_structure(course_ids):
+    """Picklable ``{course_id: [[(material_id, type, question_type, payload), ...] per lesson]}``."""
+    lesson_index = {}
+    structure = {course_id: [] for course_id in course_ids}
+    for lesson_id, course_id in Lesson.objects.filter(course_id__in=course_ids).order_by('course_id', 'order').values_list('pk', 'course_id'):
+        lesson_index[lesson_id] = len(structure[course_id])
+        structure[course_id].append([])
+    for material_id, lesson_id, course_id, kind, question_type, payload in (
+        Material.objects.filter(lesson__course_id__in=course_ids)
+        .order_by('lesson_id', 'order')
+        .values_list('pk', 'lesson_id', 'lesson__course_id', 'material_type', 'question_type', 'question_payload')
+    ):
+        structure[course_id][lesson_index[lesson_id]].append((material_id, kind, question_type, payload))
+    return structure
+
+
+def _wrong_answer(rnd, question_type, payload):
+    if question_type == Material.SINGLE_CHOICE:
+        return rnd.choice([choice for choice in CHOICES if choice != payload['correct_answer']])
+    return [rnd.choice(CHOICES)]
+
+
+def _submissions(rnd, writer, student_id, material, passed):
+    """1–3 attempts per task; the last one passes when ``passed``."""
+    material_id, _, question_type, payload = material
+    if question_type == Material.FREE_RESPONSE:
+        graded = rnd.random() < 0.6
+        score = (rnd.choice((90, 100)) if passed else 70) if graded else None
+        writer.add(TaskSubmission(
+            material_id=material_id, student_id=student_id, attempt_number=1,
+            answer_payload={'answer': _title(rnd, 15)},
+            status=TaskSubmission.STATUS_GRADED if graded else TaskSubmission.STATUS_PENDING,
+            score=score,
+            graded_at=timezone.now() if graded else None,
+        ))
+        return graded and passed
+    attempts = rnd.choices((1, 2, 3), weights=(60, 28, 12))[0] if passed else rnd.randint(1, TaskSubmission.MAX_ATTEMPTS)
+    for number in range(1, attempts + 1):
+        correct = passed and number == attempts
+        writer.add(TaskSubmission(
+            material_id=material_id, student_id=student_id, attempt_number=number,
+            answer_payload={'answer': payload['correct_answer'] if correct else _wrong_answer(rnd, question_type, payload)},
+            status=TaskSubmission.STATUS_GRADED,
+            score=100 if correct else 0,
+            graded_at=timezone.now(),
+        ))
+    return passed
+
+
+def create_students(job):
+    """Create one block of students with their enrollments and activity."""
+    prefix, seed, block, first, last, course_weights, batch_size = job
+    structure = _structure
+    connections.close_all()
+    rnd = random.Random(f'{seed}:{block}')
+    course_ids = list(structure)
+    User = get_user_model()
+    password = make_password(PASSWORD, salt=f'{prefix}{seed}')
+    User.objects.bulk_create(
+        [User(phone_number=f'+99877{index:07d}', first_name='Student', last_name=str(index), password=password) for index in range(first, last)],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    student_ids = list(
+        User.objects.filter(phone_number__in=[f'+99877{index:07d}' for index in range(first, last)])
+        .order_by('phone_number')
+        .values_list('pk', flat=True)
+    )
+
+    writer = _Writer(batch_size)
+    for student_id in student_ids:
+        # Long tail: most students take one or two courses, popular courses get most of them.
+        wanted = min(len(course_ids), 1 + int(rnd.expovariate(0.8)))
+        chosen = set()
+        while len(chosen) < wanted:
+            chosen.add(rnd.choices(course_ids, weights=course_weights)[0])
+        for course_id in sorted(chosen):
+            status = rnd.choices(
+                (Enrollment.STATUS_ACCEPTED, Enrollment.STATUS_PENDING, Enrollment.STATUS_REJECTED), weights=(80, 15, 5),
+            )[0]
+            writer.add(Enrollment(course_id=course_id, student_id=student_id, status=status))
+            if status != Enrollment.STATUS_ACCEPTED:
+                continue
+            lessons = structure[course_id]
+            # Skewed towards early drop-off, a few students finish the course.
+            progress = rnd.betavariate(1.2, 2.0) * len(lessons)
+            for position, lesson in enumerate(lessons):
+                if position > progress:
+                    break
+                finishing = position + 1 <= progress
+                for material in lesson:
+                    done = finishing or rnd.random() < 0.5
+                    if material[1] == Material.TASK:
+                        if not done and rnd.random() < 0.5:
+                            continue
+                        done = _submissions(rnd, writer, student_id, material, done)
+                    if done:
+                        writer.add(MaterialCompletion(material_id=material[0], student_id=student_id))
+                    elif not finishing:
+                        break
+    writer.flush()
+    writer.counts['CustomUser'] = len(student_ids)
+    connections.close_all()
+    return writer.counts
+
+
+def populate(students, structure, seed, prefix, batch_size, workers=1):
+    """Create ``students`` in blocks, in parallel when ``workers > 1``; yields per-block counts."""
+    _structure.clear()
+    _structure.update(structure)
+    rnd = random.Random(seed)
+    course_weights = [1 / (rank + 1) ** 1.1 for rank in range(len(structure))]
+    rnd.shuffle(course_weights)
+    jobs = [
+        (prefix, seed, block, first, min(first + STUDENT_BLOCK, students), course_weights, batch_size)
+        for block, first in enumerate(range(0, students, STUDENT_BLOCK))
+    ]
+    if workers <= 1:
+        yield from map(create_students, jobs)
+        return
+    connections.close_all()
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        yield from pool.imap_unordered(create_students, jobs)
+
+
+def finalize(course_ids):
+    """Bring counters, search vectors and materialized progress up to date."""
+    courses = Course.objects.filter(pk__in=course_ids)
+    refresh_course_counters(course_ids)
+    refresh_lesson_counters(Lesson.objects.filter(course_id__in=course_ids).values_list('pk', flat=True))
+    update_search_vectors(courses)
+    for course_id in course_ids:
+        rebuild_course_progress(course_id)
@@ -1,3 +1,1535 @@
-from django.test import TestCase
+import base64
+import hashlib
+import importlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, connections, router
+from django.db.models.signals import post_init
+from django.http import HttpResponse
+from django.test import (
+    Client,
+    LiveServerTestCase,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from application import gunicorn as gunicorn_config
+from application import profiling, replicas
+from application.middleware import QueryBudgetExceeded, normalize_sql
+from application.replicas import ReplicaRoutingMiddleware, use_primary, use_replica
+
+from .models import (
+    Course,
+    CourseProgress,
+    Enrollment,
+    Lesson,
+    LessonProgress,
+    Material,
+    MaterialCompletion,
+    TaskSubmission,
+    UploadSession,
+)
+from . import benchmark, caching, derivatives, media_signing, transcoding
+from .counters import find_counter_mismatches
+from .grading import AnswerKey, grade_pending, regrade_materials
+from .progress import ProgressResolver, deferred_refresh, rebuild_course_progress
+from .search import search_courses
+from .uploads import verify_pending
+
+
+class CourseFixtureMixin:
+    """Small published course with three lessons of two learning materials each."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = get_user_model().objects.create_user(phone_number='+998901110000', password='secret')
+        cls.course = Course.objects.create(title='Python', slug='python', is_published=True)
+        cls.lessons = []
+        for order in range(3):
+            lesson = Lesson.objects.create(course=cls.course, title=f'Lesson {order}', slug=f'lesson-{order}', order=order)
+            for position in range(2):
+                Material.objects.create(lesson=lesson, title=f'Material {position}', content='Text', order=position)
+            cls.lessons.append(lesson)
+
+    def setUp(self):
+        cache.clear()
+
+    def complete_lesson(self, lesson):
+        for material in lesson.materials.all():
+            MaterialCompletion.objects.get_or_create(material=material, student=self.student)
+
+
+class LessonProgressTests(CourseFixtureMixin, TestCase):
+    def test_first_lesson_available_without_progress(self):
+        first, second, _ = self.lessons
+        self.assertTrue(first.is_available_for(self.student))
+        self.assertFalse(first.completed_for(self.student))
+        self.assertFalse(second.is_available_for(self.student))
+
+    def test_completions_unlock_next_lesson(self):
+        first, second, third = self.lessons
+        self.complete_lesson(first)
+        self.assertTrue(first.completed_for(self.student))
+        self.assertTrue(second.is_available_for(self.student))
+        self.assertFalse(third.is_available_for(self.student))
+        progress = CourseProgress.objects.get(course=self.course, student=self.student)
+        self.assertEqual(progress.completed_lessons, 1)
+        self.assertEqual(progress.highest_unlocked_order, second.order)
+
+    def test_lookups_are_constant_queries(self):
+        self.complete_lesson(self.lessons[0])
+        with self.assertNumQueries(1):
+            self.lessons[2].is_available_for(self.student)
+        with self.assertNumQueries(1):
+            self.lessons[0].completed_for(self.student)
+
+    def test_access_check_matches_available_or_completed(self):
+        def expected():
+            return [lesson.is_available_for(self.student) or lesson.completed_for(self.student) for lesson in self.lessons]
+
+        def accessible():
+            return [lesson.is_accessible_for(self.student) for lesson in self.lessons]
+
+        self.assertEqual(accessible(), expected())
+        self.complete_lesson(self.lessons[1])
+        self.assertEqual(accessible(), [True, True, False])
+        self.assertEqual(accessible(), expected())
+        with self.assertNumQueries(1):
+            self.lessons[2].is_accessible_for(self.student)
+
+    def test_new_material_reopens_completed_lesson(self):
+        first, second, _ = self.lessons
+        self.complete_lesson(first)
+        Material.objects.create(lesson=first, title='Extra', content='Text', order=5)
+        self.assertFalse(first.completed_for(self.student))
+        self.assertFalse(second.is_available_for(self.student))
+        record = LessonProgress.objects.get(lesson=first, student=self.student)
+        self.assertEqual((record.completed_materials, record.total_materials), (2, 3))
+
+    def test_removed_material_and_completion_are_reflected(self):
+        first, second, _ = self.lessons
+        completion = MaterialCompletion.objects.create(material=first.materials.first(), student=self.student)
+        first.materials.last().delete()
+        self.assertTrue(first.completed_for(self.student))
+        self.assertTrue(second.is_available_for(self.student))
+        completion.delete()
+        self.assertFalse(first.completed_for(self.student))
+        self.assertFalse(second.is_available_for(self.student))
+
+    def test_editing_in_place_skips_the_progress_rebuild(self):
+        material = self.lessons[0].materials.first()
+        lesson = self.lessons[1]
+        with mock.patch('courses.signals.refresh_progress') as refresh, \
+                mock.patch.object(caching, 'invalidate_structure') as invalidate:
+            material.title = 'Renamed'
+            material.save()
+            lesson.title = 'Renamed'
+            lesson.save()
+        refresh.assert_not_called()
+        self.assertEqual(invalidate.call_count, 2)
+        with mock.patch('courses.signals.refresh_progress') as refresh:
+            material.lesson = lesson
+            material.save()
+            lesson.order = 7
+            lesson.save()
+        self.assertEqual(refresh.call_count, 2)
+
+    def test_rebuild_locks_the_students_progress_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            rebuild_course_progress(self.course.pk, [self.student.pk])
+        self.assertEqual(CourseProgress.objects.get(student=self.student).highest_unlocked_order, self.lessons[0].order)
+        if connection.features.has_select_for_update:
+            self.assertTrue(any('FOR UPDATE' in query['sql'] for query in queries))
+
+    def test_deferred_refresh_matches_full_rebuild(self):
+        with deferred_refresh():
+            self.complete_lesson(self.lessons[0])
+            self.complete_lesson(self.lessons[1])
+            self.assertFalse(CourseProgress.objects.exists())
+        progress = CourseProgress.objects.get(student=self.student)
+        self.assertEqual(progress.highest_unlocked_order, self.lessons[2].order)
+        CourseProgress.objects.all().delete()
+        LessonProgress.objects.all().delete()
+        rebuild_course_progress(self.course.pk)
+        self.assertEqual(CourseProgress.objects.get(student=self.student).completed_lessons, 2)
+
+
+class ProgressResolverTests(CourseFixtureMixin, TestCase):
+    def test_states_match_per_lesson_checks(self):
+        self.complete_lesson(self.lessons[0])
+        MaterialCompletion.objects.create(material=self.lessons[1].materials.first(), student=self.student)
+        resolver = ProgressResolver.for_course(self.student, self.course)
+        for state in resolver.states:
+            lesson = state['lesson']
+            self.assertEqual(state['completed'], lesson.completed_for(self.student))
+            self.assertEqual(state['available'], lesson.is_available_for(self.student))
+        self.assertEqual(resolver.completed_lessons, 1)
+        self.assertEqual(resolver.next_lesson, self.lessons[1])
+        self.assertEqual(resolver.progress_percentage, 33)
+
+    def test_anonymous_user_sees_everything_locked(self):
+        resolver = ProgressResolver.for_course(AnonymousUser(), self.course)
+        self.assertFalse(any(state['available'] or state['completed'] for state in resolver.states))
+
+    def test_query_count_independent_of_course_count(self):
+        other = Course.objects.create(title='Django', slug='django', is_published=True)
+        Lesson.objects.create(course=other, title='Intro', slug='intro')
+        with self.assertNumQueries(3):
+            resolvers = ProgressResolver.for_courses(self.student, [self.course, other])
+        self.assertEqual(resolvers[other.pk].total_lessons, 1)
+
+
+class ProgressViewQueryTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Enrollment.objects.create(course=self.course, student=self.student, status=Enrollment.STATUS_ACCEPTED)
+        self.client.force_login(self.student)
+
+    def add_lessons(self, count):
+        start = self.course.lessons.count()
+        for order in range(start, start + count):
+            lesson = Lesson.objects.create(course=self.course, title=f'Lesson {order}', slug=f'lesson-{order}', order=order)
+            Material.objects.create(lesson=lesson, title='Material', content='Text')
+
+    def assert_constant_queries(self, url):
+        # Measure the uncached path both times.
+        cache.clear()
+        with CaptureQueriesContext(connection) as before:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_lessons(10)
+        cache.clear()
+        with CaptureQueriesContext(connection) as after:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(before), len(after))
+
+    def test_course_detail(self):
+        self.assert_constant_queries(reverse('course_detail', args=[self.course.slug]))
+
+    def test_progress_dashboard(self):
+        self.assert_constant_queries(reverse('progress_dashboard'))
+
+    def test_home_and_profile(self):
+        self.assert_constant_queries(reverse('home'))
+        self.assert_constant_queries(reverse('profile'))
+
+
+class LessonDetailQueryTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Enrollment.objects.create(course=self.course, student=self.student, status=Enrollment.STATUS_ACCEPTED)
+        self.client.force_login(self.student)
+        self.lesson = self.lessons[0]
+        self.url = reverse('course_lesson', args=[self.course.slug, self.lesson.slug])
+
+    def add_tasks(self, count):
+        for position in range(count):
+            material = Material.objects.create(
+                lesson=self.lesson,
+                title=f'Quiz {position}',
+                material_type=Material.TASK,
+                question_type=Material.SINGLE_CHOICE,
+                question_payload={'question': '2+2?', 'choices': ['3', '4'], 'correct_answer': '4'},
+                order=10 + position,
+            )
+            for attempt in range(1, 3):
+                TaskSubmission.objects.create(
+                    material=material,
+                    student=self.student,
+                    answer_payload={'answer': '3'},
+                    attempt_number=attempt,
+                )
+
+    def test_constant_queries_as_tasks_grow(self):
+        self.add_tasks(1)
+        with CaptureQueriesContext(connection) as before:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.add_tasks(15)
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(self.url)
+        self.assertEqual(len(before), len(after))
+        task_data = [data for data in response.context['material_data'] if 'submissions' in data]
+        self.assertEqual(len(task_data), 16)
+        for data in task_data:
+            self.assertEqual(data['attempts_used'], 2)
+            self.assertTrue(data['can_submit'])
+            self.assertEqual(data['latest_submission'], data['submissions'][0])
+
+
+class CourseSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Course.objects.create(title='Advanced Python', slug='advanced-python', is_published=True)
+        Course.objects.create(title='Python Basics', slug='python-basics', is_published=True)
+        Course.objects.create(title='Web', slug='web', summary='Django and Python for the web', is_published=True)
+        Course.objects.create(title='Python Drafts', slug='python-drafts')
+
+    def test_fallback_ranks_title_prefix_first(self):
+        results = search_courses(Course.objects.filter(is_published=True), 'python')
+        self.assertEqual([course.slug for course in results], ['python-basics', 'advanced-python', 'web'])
+
+    def test_course_list_defaults_to_relevance_when_searching(self):
+        response = self.client.get(reverse('course_list'), {'q': 'python'})
+        self.assertEqual(response.context['sort_by'], 'relevance')
+        self.assertEqual(response.context['courses'][0].slug, 'python-basics')
+
+
+class CounterTests(CourseFixtureMixin, TestCase):
+    def test_counters_follow_writes(self):
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.lesson_count, 3)
+        lesson = self.lessons[0]
+        Material.objects.create(
+            lesson=lesson,
+            title='Quiz',
+            material_type=Material.TASK,
+            question_type=Material.SINGLE_CHOICE,
+            question_payload={'choices': ['a', 'b'], 'correct_answer': 'a'},
+        )
+        lesson.refresh_from_db()
+        self.assertEqual((lesson.material_count, lesson.task_count), (3, 1))
+
+        enrollment = Enrollment.objects.create(course=self.course, student=self.student)
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.pending_enrollment_count, self.course.accepted_enrollment_count), (1, 0))
+        enrollment.mark_accepted()
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.pending_enrollment_count, self.course.accepted_enrollment_count), (0, 1))
+
+        self.lessons[2].delete()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.lesson_count, 2)
+        self.assertEqual(list(find_counter_mismatches()), [])
+
+    def test_saving_a_stale_instance_keeps_counters(self):
+        stale_course = Course.objects.get(pk=self.course.pk)
+        stale_lesson = Lesson.objects.get(pk=self.lessons[0].pk)
+        Enrollment.objects.create(course=self.course, student=self.student)
+        Lesson.objects.create(course=self.course, title='Extra', slug='extra', order=9)
+        Material.objects.create(lesson=self.lessons[0], title='Extra', content='Text')
+
+        stale_course.title = 'Python 3'
+        stale_course.save()
+        stale_lesson.save()
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.title, self.course.lesson_count, self.course.pending_enrollment_count), ('Python 3', 4, 1))
+        self.assertEqual(Lesson.objects.get(pk=stale_lesson.pk).material_count, 3)
+
+    def test_moving_children_refreshes_both_parents(self):
+        other = Course.objects.create(title='Go', slug='go', is_published=True)
+        target = Lesson.objects.create(course=other, title='Intro', slug='intro')
+        material = self.lessons[0].materials.first()
+        material.lesson = target
+        material.save()
+        self.assertEqual(Lesson.objects.get(pk=self.lessons[0].pk).material_count, 1)
+        self.assertEqual(Lesson.objects.get(pk=target.pk).material_count, 1)
+
+        self.complete_lesson(self.lessons[0])
+        self.assertTrue(LessonProgress.objects.get(lesson=self.lessons[0], student=self.student).is_completed)
+        lesson = self.lessons[0]
+        lesson.course = other
+        lesson.slug = 'moved'
+        lesson.save()
+        self.assertEqual(Course.objects.get(pk=self.course.pk).lesson_count, 2)
+        self.assertEqual(Course.objects.get(pk=other.pk).lesson_count, 2)
+        self.assertEqual(CourseProgress.objects.get(course=self.course, student=self.student).completed_lessons, 0)
+        self.assertEqual(list(find_counter_mismatches()), [])
+
+    def test_verify_command_reports_stale_counters(self):
+        Course.objects.filter(pk=self.course.pk).update(lesson_count=99)
+        with self.assertRaises(CommandError):
+            call_command('recompute_counters', verify=True, stdout=StringIO())
+        call_command('recompute_counters', stdout=StringIO())
+        call_command('recompute_counters', verify=True, stdout=StringIO())
+
+    def test_course_list_needs_no_aggregates(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('course_list'), {'sort': 'lessons'})
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql'].upper()])
+
+
+class ProgressCacheTests(CourseFixtureMixin, TestCase):
+    def test_cached_resolver_needs_no_queries(self):
+        ProgressResolver.for_course(self.student, self.course)
+        with self.assertNumQueries(0):
+            ProgressResolver.for_course(self.student, self.course)
+
+    def test_completion_invalidates_only_that_student(self):
+        other = get_user_model().objects.create_user(phone_number='+998901110001', password='secret')
+        ProgressResolver.for_course(self.student, self.course)
+        ProgressResolver.for_course(other, self.course)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.complete_lesson(self.lessons[0])
+        with self.assertNumQueries(0):
+            ProgressResolver.for_course(other, self.course)
+        self.assertEqual(ProgressResolver.for_course(self.student, self.course).completed_lessons, 1)
+
+    def test_structure_change_invalidates_everyone(self):
+        ProgressResolver.for_course(self.student, self.course)
+        with self.captureOnCommitCallbacks(execute=True):
+            Lesson.objects.create(course=self.course, title='Extra', slug='extra', order=9)
+        self.assertEqual(ProgressResolver.for_course(self.student, self.course).total_lessons, 4)
+
+    def test_versions_change_when_the_write_commits(self):
+        key = caching.progress_keys(self.student.pk, [self.course.pk])[self.course.pk]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.complete_lesson(self.lessons[0])
+            # A concurrent reader still sees the committed data: keep its key.
+            self.assertEqual(caching.progress_keys(self.student.pk, [self.course.pk])[self.course.pk], key)
+        self.assertNotEqual(caching.progress_keys(self.student.pk, [self.course.pk])[self.course.pk], key)
+
+    def test_grading_refreshes_submission_history(self):
+        Enrollment.objects.create(course=self.course, student=self.student, status=Enrollment.STATUS_ACCEPTED)
+        material = Material.objects.create(
+            lesson=self.lessons[0],
+            title='Quiz',
+            material_type=Material.TASK,
+            question_type=Material.FREE_RESPONSE,
+            question_payload={'question': 'Why?'},
+        )
+        submission = TaskSubmission.objects.create(material=material, student=self.student, answer_payload={'answer': 'x'})
+        self.client.force_login(self.student)
+        url = reverse('submission_history')
+        self.client.get(url)
+        submission.score = 95
+        submission.status = TaskSubmission.STATUS_GRADED
+        with self.captureOnCommitCallbacks(execute=True):
+            submission.save()
+        task = self.client.get(url).context['history_data'][0]['lessons'][0]['tasks'][0]
+        self.assertEqual(task['best_score'], 95)
+
+
+class TaskFixtureMixin(CourseFixtureMixin):
+    def setUp(self):
+        super().setUp()
+        Enrollment.objects.create(course=self.course, student=self.student, status=Enrollment.STATUS_ACCEPTED)
+        self.client.force_login(self.student)
+        self.lesson = self.lessons[0]
+        self.single = Material.objects.create(
+            lesson=self.lesson,
+            title='Single',
+            material_type=Material.TASK,
+            question_type=Material.SINGLE_CHOICE,
+            question_payload={'choices': ['3', '4'], 'correct_answer': '4'},
+        )
+        self.multi = Material.objects.create(
+            lesson=self.lesson,
+            title='Multi',
+            material_type=Material.TASK,
+            question_type=Material.MULTI_CHOICE,
+            question_payload={'choices': ['a', 'b', 'c'], 'correct_answer': ['a', 'c']},
+        )
+        self.free = Material.objects.create(
+            lesson=self.lesson,
+            title='Free',
+            material_type=Material.TASK,
+            question_type=Material.FREE_RESPONSE,
+            question_payload={'question': 'Why?'},
+        )
+
+    def queue(self, material, answer):
+        return TaskSubmission.objects.create(
+            material=material,
+            student=self.student,
+            answer_payload={'answer': answer},
+            status=TaskSubmission.STATUS_QUEUED,
+        )
+
+
+class GradingQueueTests(TaskFixtureMixin, TestCase):
+    @override_settings(GRADING_ASYNC=True)
+    def test_submit_only_queues(self):
+        self.client.post(reverse('task_submit', args=[self.single.pk]), {'answer': '4'})
+        submission = TaskSubmission.objects.get(material=self.single)
+        self.assertEqual(submission.status, TaskSubmission.STATUS_QUEUED)
+        self.assertIsNone(submission.score)
+
+    @override_settings(GRADING_ASYNC=False)
+    def test_submit_grades_inline_when_disabled(self):
+        self.client.post(reverse('task_submit', args=[self.single.pk]), {'answer': '4'})
+        self.assertEqual(TaskSubmission.objects.get(material=self.single).score, 100)
+        self.assertTrue(MaterialCompletion.objects.filter(material=self.single, student=self.student).exists())
+
+    @override_settings(GRADING_ASYNC=True)
+    def test_submit_messages_for_used_up_and_conflicting_attempts(self):
+        url = reverse('task_submit', args=[self.single.pk])
+        with mock.patch.object(TaskSubmission, 'submit', side_effect=IntegrityError('taken')):
+            response = self.client.post(url, {'answer': '4'})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+
+        with mock.patch.object(TaskSubmission, 'MAX_ATTEMPTS', 2):
+            for _ in range(2):
+                self.client.post(url, {'answer': '3'})
+            response = self.client.post(url, {'answer': '4'}, follow=True)
+        self.assertIn('You have used all 2 attempts for this task.', [str(message) for message in response.context['messages']])
+
+    def test_worker_grades_batch_and_completes_materials(self):
+        right = self.queue(self.multi, ['c', 'a'])
+        wrong = self.queue(self.single, '3')
+        free = self.queue(self.free, 'Because')
+        self.assertEqual(grade_pending(batch_size=10), 3)
+        self.assertEqual(grade_pending(batch_size=10), 0)
+        for submission in (right, wrong, free):
+            submission.refresh_from_db()
+        self.assertEqual((right.status, right.score), (TaskSubmission.STATUS_GRADED, 100))
+        self.assertEqual((wrong.status, wrong.score), (TaskSubmission.STATUS_GRADED, 0))
+        self.assertEqual(free.status, TaskSubmission.STATUS_PENDING)
+        completed = set(MaterialCompletion.objects.filter(student=self.student).values_list('material_id', flat=True))
+        self.assertIn(self.multi.pk, completed)
+        self.assertNotIn(self.single.pk, completed)
+        record = LessonProgress.objects.get(lesson=self.lesson, student=self.student)
+        self.assertEqual(record.completed_materials, 1)
+
+    def test_submission_that_keeps_failing_goes_to_manual_review(self):
+        score = AnswerKey.score
+
+        def failing(key, answer_payload):
+            if answer_payload == {'answer': 'boom'}:
+                raise TypeError('bad payload')
+            return score(key, answer_payload)
+
+        bad = self.queue(self.single, 'boom')
+        good = self.queue(self.multi, ['a', 'c'])
+        with mock.patch.object(AnswerKey, 'score', failing), self.assertLogs('courses.grading', 'ERROR'):
+            self.assertEqual(grade_pending(batch_size=10), 2)
+        bad.refresh_from_db()
+        good.refresh_from_db()
+        self.assertEqual((bad.status, bad.score), (TaskSubmission.STATUS_PENDING, None))
+        self.assertEqual((good.status, good.score), (TaskSubmission.STATUS_GRADED, 100))
+
+    def test_worker_backs_off_and_keeps_running_after_errors(self):
+        outcomes = [OperationalError('server closed the connection'), 0]
+        with mock.patch('courses.management.commands.run_grading_worker.grade_pending', side_effect=outcomes), \
+                mock.patch('courses.management.commands.run_grading_worker.time.sleep') as sleep, \
+                self.assertLogs('courses.management.commands.run_grading_worker', 'ERROR'):
+            call_command('run_grading_worker', once=True, interval=1, stdout=StringIO())
+        sleep.assert_called_once_with(2)
+
+
+class RegradeTests(TaskFixtureMixin, TestCase):
+    def graded(self, material, answer, score):
+        submission = self.queue(material, answer)
+        submission.status = TaskSubmission.STATUS_GRADED
+        submission.score = score
+        submission.save()
+        if score >= TaskSubmission.PASSING_SCORE:
+            MaterialCompletion.objects.create(material=material, student=submission.student)
+        return submission
+
+    def test_fixed_answer_key_regrades_and_reconciles_completions(self):
+        other = get_user_model().objects.create_user(phone_number='+998901110002', password='secret')
+        Enrollment.objects.create(course=self.course, student=other, status=Enrollment.STATUS_ACCEPTED)
+        was_right = self.graded(self.single, '4', 100)
+        was_wrong = TaskSubmission.objects.create(
+            material=self.single, student=other, answer_payload={'answer': '3'},
+            status=TaskSubmission.STATUS_GRADED, score=0,
+        )
+        self.single.question_payload = {'choices': ['3', '4'], 'correct_answer': '3'}
+        self.single.save()
+
+        regraded, completions = regrade_materials(Material.objects.filter(pk=self.single.pk), chunk_size=1)
+
+        self.assertEqual((regraded, completions), (2, 2))
+        was_right.refresh_from_db()
+        was_wrong.refresh_from_db()
+        self.assertEqual((was_right.score, was_wrong.score), (0, 100))
+        self.assertEqual(
+            list(MaterialCompletion.objects.filter(material=self.single).values_list('student_id', flat=True)),
+            [other.pk],
+        )
+        self.assertEqual(LessonProgress.objects.get(lesson=self.lesson, student=other).completed_materials, 1)
+        self.assertEqual(LessonProgress.objects.get(lesson=self.lesson, student=self.student).completed_materials, 0)
+
+    def test_command_skips_free_response_and_requires_target(self):
+        free = self.graded(self.free, 'Because', 95)
+        with self.assertRaises(CommandError):
+            call_command('regrade', stdout=StringIO())
+        call_command('regrade', course=[self.course.slug], stdout=StringIO())
+        free.refresh_from_db()
+        self.assertEqual(free.score, 95)
+        self.assertTrue(MaterialCompletion.objects.filter(material=self.free, student=self.student).exists())
+
+    def test_course_action_regrades_but_keeps_manual_scores(self):
+        automatic = self.graded(self.single, '4', 100)
+        manual = self.graded(self.multi, ['a'], 0)
+        admin_user = get_user_model().objects.create_superuser(phone_number='+998901119999', password='secret')
+        self.client.force_login(admin_user)
+        self.client.post(
+            reverse('admin:courses_tasksubmission_changelist'),
+            {'action': 'mark_as_passing', '_selected_action': [manual.pk]},
+        )
+        self.single.question_payload = {'choices': ['3', '4'], 'correct_answer': '3'}
+        self.single.save()
+
+        self.client.post(
+            reverse('admin:courses_course_changelist'),
+            {'action': 'regrade_submissions', '_selected_action': [self.course.pk]},
+        )
+        automatic.refresh_from_db()
+        manual.refresh_from_db()
+        self.assertEqual((automatic.score, manual.score), (0, 100))
+        self.assertTrue(manual.graded_manually)
+        self.assertTrue(MaterialCompletion.objects.filter(material=self.multi, student=self.student).exists())
+
+
+class SubmitAttemptTests(TransactionTestCase):
+    def setUp(self):
+        self.student = get_user_model().objects.create_user(phone_number='+998901110000', password='secret')
+        course = Course.objects.create(title='Python', slug='python', is_published=True)
+        lesson = Lesson.objects.create(course=course, title='Lesson', slug='lesson', order=0)
+        self.material = Material.objects.create(
+            lesson=lesson,
+            title='Task',
+            material_type=Material.TASK,
+            question_type=Material.SINGLE_CHOICE,
+            question_payload={'choices': ['3', '4'], 'correct_answer': '4'},
+        )
+
+    def test_attempts_are_numbered_until_the_limit(self):
+        numbers = [
+            TaskSubmission.submit(self.material, self.student, {'answer': '3'}).attempt_number
+            for _ in range(TaskSubmission.MAX_ATTEMPTS)
+        ]
+        self.assertEqual(numbers, list(range(1, TaskSubmission.MAX_ATTEMPTS + 1)))
+        self.assertIsNone(TaskSubmission.submit(self.material, self.student, {'answer': '4'}))
+
+    def test_deleted_attempts_free_a_try_without_reusing_numbers(self):
+        for _ in range(TaskSubmission.MAX_ATTEMPTS):
+            TaskSubmission.submit(self.material, self.student, {'answer': '3'})
+        self.assertFalse(TaskSubmission.can_submit(self.material, self.student))
+        TaskSubmission.objects.filter(attempt_number=1).delete()
+
+        self.assertTrue(TaskSubmission.can_submit(self.material, self.student))
+        submission = TaskSubmission.submit(self.material, self.student, {'answer': '4'})
+        self.assertEqual(submission.attempt_number, TaskSubmission.MAX_ATTEMPTS + 1)
+        self.assertFalse(TaskSubmission.can_submit(self.material, self.student))
+        self.assertIsNone(TaskSubmission.submit(self.material, self.student, {'answer': '4'}))
+
+    def test_submit_locks_the_enrollment_not_the_user(self):
+        Enrollment.objects.create(course=self.material.lesson.course, student=self.student, status=Enrollment.STATUS_ACCEPTED)
+        with CaptureQueriesContext(connection) as queries:
+            TaskSubmission.submit(self.material, self.student, {'answer': '3'})
+        locked = [query['sql'] for query in queries if 'FOR UPDATE' in query['sql']]
+        if connection.features.has_select_for_update:
+            self.assertEqual(len(locked), 1)
+            self.assertIn(Enrollment._meta.db_table, locked[0])
+        self.assertFalse(any(get_user_model()._meta.db_table in sql for sql in locked))
+
+    def test_exhausted_retries_raise_instead_of_returning_none(self):
+        with mock.patch.object(TaskSubmission.objects, 'create', side_effect=IntegrityError('taken')) as create:
+            with self.assertRaises(IntegrityError):
+                TaskSubmission.submit(self.material, self.student, {'answer': '3'})
+        self.assertEqual(create.call_count, TaskSubmission.MAX_ATTEMPTS)
+
+    def test_parallel_submits_respect_unique_numbers_and_limit(self):
+        Enrollment.objects.create(course=self.material.lesson.course, student=self.student, status=Enrollment.STATUS_ACCEPTED)
+        threads = 8
+        barrier = threading.Barrier(threads)
+        results, errors = [], []
+
+        def submit():
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        submission = TaskSubmission.submit(self.material, self.student, {'answer': '3'})
+                        break
+                    except OperationalError:
+                        # SQLite's shared in-memory test database allows one writer at a time.
+                        continue
+                results.append(submission and submission.attempt_number)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=submit) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        numbers = sorted(TaskSubmission.objects.values_list('attempt_number', flat=True))
+        self.assertEqual(numbers, list(range(1, TaskSubmission.MAX_ATTEMPTS + 1)))
+        self.assertEqual(sorted(number for number in results if number), numbers)
+
+
+class SyntheticDataTests(TestCase):
+    def test_scale_mode_is_deterministic_and_consistent(self):
+        options = {'scale': True, 'courses': 2, 'lessons': 2, 'materials': 3, 'students': 30, 'stdout': StringIO()}
+        call_command('populate_test_data', **options)
+        first = list(TaskSubmission.objects.order_by('student_id', 'material_id', 'attempt_number').values_list(
+            'student__phone_number', 'material__title', 'attempt_number', 'score',
+        ))
+        self.assertTrue(first)
+        self.assertEqual(list(find_counter_mismatches()), [])
+        self.assertTrue(Enrollment.objects.filter(status=Enrollment.STATUS_ACCEPTED).exists())
+        self.assertEqual(
+            CourseProgress.objects.count(),
+            MaterialCompletion.objects.values('student', 'material__lesson__course').distinct().count(),
+        )
+
+        with self.assertRaises(CommandError):
+            call_command('populate_test_data', **options)
+        call_command('populate_test_data', clear=True, **options)
+        second = list(TaskSubmission.objects.order_by('student_id', 'material_id', 'attempt_number').values_list(
+            'student__phone_number', 'material__title', 'attempt_number', 'score',
+        ))
+        self.assertEqual(first, second)
+
+
+class BenchmarkTests(TestCase):
+    def test_report_covers_every_page(self):
+        report = benchmark.run(['tiny'], repeat=2, warmup=0)
+        results = report['results']['tiny']
+        self.assertTrue({'course_list', 'progress_dashboard', 'submission_history', 'home', 'profile'} <= set(results))
+        for name, result in results.items():
+            self.assertIn(result['status'], (200, 302), name)
+            self.assertGreater(result['queries'], 0, name)
+            self.assertLessEqual(result['p50_ms'], result['max_ms'], name)
+
+        slower = {'results': {'tiny': {'home': dict(results['home'], p50_ms=results['home']['p50_ms'] * 2)}}}
+        changes = {metric: (old, new) for _, page, metric, old, new in benchmark.compare(slower, report)}
+        self.assertEqual(changes['queries'], (results['home']['queries'],) * 2)
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class RequestMetricsTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Enrollment.objects.create(course=self.course, student=self.student, status=Enrollment.STATUS_ACCEPTED)
+        self.client.force_login(self.student)
+
+    def test_pages_stay_within_query_budgets(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        lesson = self.lessons[0]
+        video, image = lesson.materials.all()
+        task = Material.objects.create(
+            lesson=lesson,
+            title='Quiz',
+            material_type=Material.TASK,
+            question_type=Material.SINGLE_CHOICE,
+            question_payload={'choices': ['3', '4'], 'correct_answer': '4'},
+        )
+        with override_settings(MEDIA_ROOT=directory.name, MEDIA_ACCEL_REDIRECT=False, GRADING_ASYNC=False):
+            video.is_protected = True
+            video.media_file.save('lecture.mp4', ContentFile(b'video'))
+            buffer = BytesIO()
+            Image.new('RGB', (800, 400)).save(buffer, 'PNG')
+            image.media_file.save('diagram.png', ContentFile(buffer.getvalue()))
+
+            lesson_url = reverse('course_lesson', args=[self.course.slug, lesson.slug])
+            signed_url = re.search(r'<source src="([^"]+)"', self.client.get(lesson_url).content.decode()).group(1)
+            signed_url = signed_url.replace('&amp;', '&')
+            requests = [
+                (Client(), 'get', reverse('course_list'), {}),
+                (Client(), 'get', reverse('course_detail', args=[self.course.slug]), {}),
+                (self.client, 'get', reverse('course_list'), {}),
+                (self.client, 'get', reverse('course_detail', args=[self.course.slug]), {}),
+                (self.client, 'get', lesson_url, {}),
+                (self.client, 'get', reverse('task_submit', args=[task.pk]), {}),
+                (self.client, 'post', reverse('task_submit', args=[task.pk]), {'data': {'answer': '4'}}),
+                (self.client, 'post', reverse('material_complete', args=[video.pk]), {}),
+                (self.client, 'get', reverse('submission_history'), {}),
+                (self.client, 'get', reverse('progress_dashboard'), {}),
+                (self.client, 'get', reverse('home'), {}),
+                (self.client, 'get', reverse('profile'), {}),
+                (self.client, 'get', reverse('material_media', args=[video.pk]), {}),
+                (self.client, 'get', derivatives.preview_url(image, 320), {}),
+                (self.client, 'get', reverse('media_auth'), {'HTTP_X_ORIGINAL_URI': signed_url}),
+                (self.client, 'get', signed_url, {}),
+            ]
+            covered = set()
+            for client, method, url, kwargs in requests:
+                # Budgets are cold-cache counts.
+                cache.clear()
+                response = getattr(client, method)(url, **kwargs)
+                self.assertLess(response.status_code, 400, url)
+                covered.add(resolve(url.split('?')[0]).url_name)
+                if response.status_code == 200 and not response.streaming:
+                    self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertEqual(covered - {None}, set(settings.QUERY_BUDGETS))
+
+    def test_query_wrapper_only_lives_for_the_request(self):
+        response = self.client.get(reverse('course_list'))
+        self.assertEqual(connection.execute_wrappers, [])
+        timings = dict(re.findall(r'(\w+);dur=([\d.-]+)', response['Server-Timing']))
+        db, tpl, py, total = (float(timings[name]) for name in ('db', 'tpl', 'py', 'total'))
+        self.assertGreater(tpl, 0)
+        # Template time is not counted again as Python time.
+        self.assertGreaterEqual(py, -0.1)
+        self.assertLessEqual(py, total - db + 0.1)
+
+    def test_budget_overrun_raises(self):
+        with override_settings(QUERY_BUDGETS={'course_list': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('course_list'))
+
+    @override_settings(QUERY_BUDGETS={})
+    def test_repeated_statements_are_reported(self):
+        def lookup(sender, instance, **kwargs):
+            Lesson.objects.filter(pk=instance.pk).exists()
+
+        for index in range(5):
+            Course.objects.create(title=f'Course {index}', slug=f'course-{index}', is_published=True)
+        post_init.connect(lookup, sender=Course)
+        try:
+            with self.assertLogs('application.metrics', 'WARNING') as logs:
+                self.client.get(reverse('course_list'))
+        finally:
+            post_init.disconnect(lookup, sender=Course)
+        self.assertTrue(any('Possible N+1' in line for line in logs.output))
+
+    def test_normalized_sql_groups_literals_and_in_lists(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            normalize_sql("SELECT * FROM t WHERE id IN (%s) AND name = 'y' LIMIT 1"),
+        )
+
+
+class MetricsEndpointTests(CourseFixtureMixin, TestCase):
+    def test_exports_request_cache_and_backlog_metrics(self):
+        Enrollment.objects.create(course=self.course, student=self.student)
+        self.client.get(reverse('course_list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('lms_request_duration_seconds_count{method="GET",status="2xx",view="course_list"}', body)
+        self.assertIn('lms_request_db_queries_bucket', body)
+        self.assertIn('lms_pending_enrollments 1.0', body)
+        self.assertIn('lms_grading_queue 0.0', body)
+        self.assertIn('lms_requests_in_flight', body)
+
+    def test_backlog_gauges_are_cached_between_scrapes(self):
+        self.client.get(reverse('metrics'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('metrics'))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfilingTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(PROFILING_DIR=self.directory.name, PROFILING_INTERVAL=0.001)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(profiling.clear_targets)
+        Enrollment.objects.create(course=self.course, student=self.student, status=Enrollment.STATUS_ACCEPTED)
+        self.client.force_login(self.student)
+
+    def profiles(self):
+        return sorted(name for name in os.listdir(self.directory.name) if name.endswith('.collapsed'))
+
+    def test_requests_are_not_profiled_by_default(self):
+        response = self.client.get(reverse('progress_dashboard'))
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(self.profiles(), [])
+
+    def test_user_target_writes_collapsed_stacks(self):
+        call_command('profiling', users=[str(self.student.phone_number)], stdout=StringIO())
+        response = self.client.get(reverse('progress_dashboard'))
+        self.assertEqual(self.profiles(), [response['X-Profile-File']])
+        self.assertIn('progress_dashboard', response['X-Profile-File'])
+        with open(os.path.join(self.directory.name, response['X-Profile-File'])) as profile:
+            for line in profile:
+                stack, count = line.rsplit(' ', 1)
+                self.assertGreater(int(count), 0)
+
+        call_command('profiling', off=True, stdout=StringIO())
+        self.assertNotIn('X-Profile-File', self.client.get(reverse('progress_dashboard')))
+
+    def test_targets_are_shared_through_the_profiling_dir(self):
+        profiling.add_targets(views=['course_list'], minutes=5)
+        with open(os.path.join(self.directory.name, profiling.TARGETS_FILE)) as targets:
+            self.assertEqual(json.load(targets)['views'], ['course_list'])
+        # Other processes have their own caches; they only share the file.
+        cache.clear()
+        profiling._polled.update(at=0, targets=None)
+        self.assertIn('X-Profile-File', self.client.get(reverse('course_list')))
+
+    def test_signed_header_and_rotation(self):
+        token = profiling.make_token()
+        with override_settings(PROFILING_MAX_FILES=2):
+            for _ in range(3):
+                response = self.client.get(reverse('course_list'), HTTP_X_PROFILE=token)
+                self.assertIn('X-Profile-File', response)
+        self.assertEqual(len(self.profiles()), 2)
+        response = self.client.get(reverse('course_list'), HTTP_X_PROFILE=token + 'x')
+        self.assertNotIn('X-Profile-File', response)
+
+
+def _reload_urlconfs():
+    clear_url_caches()
+    for module in ('courses.urls', 'users.urls', settings.ROOT_URLCONF):
+        importlib.reload(sys.modules[module])
+
+
+class AsyncViewTests(CourseFixtureMixin, TestCase):
+    compared_keys = ('courses', 'lesson_states', 'next_lesson', 'total_lessons', 'completed_lessons', 'overall_progress')
+
+    def setUp(self):
+        super().setUp()
+        Enrollment.objects.create(course=self.course, student=self.student, status=Enrollment.STATUS_ACCEPTED)
+        self.complete_lesson(self.lessons[0])
+        self.client.force_login(self.student)
+        self.pages = [
+            reverse('course_list'),
+            reverse('course_list') + '?q=pyth',
+            reverse('course_detail', args=[self.course.slug]),
+            reverse('progress_dashboard'),
+            reverse('home'),
+        ]
+        # Rendered values of the sync views, compared with the async ones below.
+        self.sync_contexts = {}
+        for url in self.pages:
+            context = self.client.get(url).context
+            self.sync_contexts[url] = {
+                key: repr(list(context[key]) if key == 'courses' else context[key])
+                for key in self.compared_keys if key in context
+            }
+
+        settings_override = override_settings(ASYNC_VIEWS=True)
+        settings_override.enable()
+        self.addCleanup(_reload_urlconfs)
+        self.addCleanup(settings_override.disable)
+        _reload_urlconfs()
+
+    async def test_async_views_render_the_sync_context(self):
+        await self.async_client.aforce_login(self.student)
+        for url in self.pages:
+            cache.clear()
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertTrue(iscoroutinefunction(response.resolver_match.func), url)
+            # Queries in sync_to_async threads are still counted.
+            self.assertNotIn('desc="0 queries"', response['Server-Timing'], url)
+            for key, value in self.sync_contexts[url].items():
+                self.assertEqual(repr(response.context[key]), value, (url, key))
+
+    async def test_dashboard_requires_login(self):
+        response = await self.async_client.get(reverse('progress_dashboard'))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_unknown_course_is_404(self):
+        response = await self.async_client.get(reverse('course_detail', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'loadtest.json')
+            call_command(
+                'loadtest', url=self.live_server_url, connections=2, duration=0.5, output=output, stdout=StringIO(),
+            )
+            with open(output) as report_file:
+                report = json.load(report_file)
+        self.assertGreater(report['requests'], 0)
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(list(report['statuses']), ['200'])
+        self.assertIn('p99_ms', report)
+
+
+class GunicornConfigTests(SimpleTestCase):
+    def load(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            self.addCleanup(importlib.reload, gunicorn_config)
+            return importlib.reload(gunicorn_config)
+
+    def test_worker_class_and_counts(self):
+        cpus = gunicorn_config.cpu_count()
+        config = self.load(GUNICORN_WORKER_CLASS='sync', GUNICORN_MAX_WORKERS='100')
+        self.assertEqual((config.worker_class, config.workers), ('sync', 2 * cpus + 1))
+
+        config = self.load(SERVER_MODE='asgi', GUNICORN_WORKERS='3')
+        self.assertEqual((config.worker_class, config.workers), ('uvicorn_worker.UvicornWorker', 3))
+
+        config = self.load(GUNICORN_WORKER_CLASS='gthread', GUNICORN_MAX_WORKERS='1', GUNICORN_THREADS='8')
+        self.assertEqual((config.workers, config.threads), (1, 8))
+
+    def test_recycling_has_jitter(self):
+        config = self.load(GUNICORN_MAX_REQUESTS='500')
+        self.assertEqual((config.max_requests, config.max_requests_jitter), (500, 50))
+        self.assertTrue(config.preload_app)
+
+    def test_unknown_worker_class_is_rejected(self):
+        with self.assertRaises(RuntimeError):
+            self.load(GUNICORN_WORKER_CLASS='tornado')
+
+
+@override_settings(DATABASE_REPLICA='replica', REPLICA_VIEWS=['course_list'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def read_alias(self, method, url):
+        """Alias ``Course`` reads would use inside the view at ``url``."""
+        request = getattr(RequestFactory(), method)(url)
+        request.COOKIES.update({name: morsel.value for name, morsel in self.client.cookies.items()})
+        request.resolver_match = resolve(url)
+
+        def view(request):
+            middleware.process_view(request, request.resolver_match.func, (), {})
+            return HttpResponse(router.db_for_read(Course))
+
+        middleware = ReplicaRoutingMiddleware(view)
+        return middleware(request).content.decode()
+
+    def test_listed_views_read_from_the_replica(self):
+        self.assertEqual(self.read_alias('get', reverse('course_list')), 'replica')
+        self.assertEqual(self.read_alias('head', reverse('course_list')), 'replica')
+        self.assertEqual(self.read_alias('post', reverse('course_list')), 'default')
+        self.assertEqual(self.read_alias('get', reverse('submission_history')), 'default')
+        self.assertEqual(router.db_for_read(Course), 'default')
+
+    def test_writes_and_transactions_use_the_primary(self):
+        with use_replica():
+            self.assertEqual(router.db_for_read(Course), 'replica')
+            self.assertEqual(router.db_for_write(Course), 'default')
+            with mock.patch.object(connection, 'in_atomic_block', True):
+                self.assertEqual(router.db_for_read(Course), 'default')
+
+    def test_replica_is_never_migrated(self):
+        self.assertFalse(router.allow_migrate('replica', 'courses'))
+        self.assertTrue(router.allow_migrate('default', 'courses'))
+
+    def test_reads_after_a_write_use_the_primary(self):
+        request = RequestFactory().get(reverse('course_list'))
+        request.resolver_match = resolve(reverse('course_list'))
+
+        def view(request):
+            middleware.process_view(request, request.resolver_match.func, (), {})
+            before = router.db_for_read(Course)
+            router.db_for_write(Course)
+            return HttpResponse(f'{before} {router.db_for_read(Course)} {router.db_for_read(Session)}')
+
+        middleware = ReplicaRoutingMiddleware(view)
+        self.assertEqual(middleware(request).content.decode(), 'replica default default')
+
+    def test_progress_writes_pin_the_client_to_the_primary(self):
+        def view(request):
+            replicas._pin_after_progress_write(sender=MaterialCompletion)
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(RequestFactory().post('/'))
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        self.client.cookies[settings.REPLICA_PIN_COOKIE] = '1'
+        self.assertEqual(self.read_alias('get', reverse('course_list')), 'default')
+
+        def unrelated_write(request):
+            replicas._pin_after_progress_write(sender=Lesson)
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(unrelated_write)(RequestFactory().post('/'))
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_reads_that_get_cached_use_the_primary(self):
+        seen = []
+
+        def query(user, courses):
+            seen.append(router.db_for_read(Course))
+            return {}
+
+        with use_replica(), mock.patch.object(ProgressResolver, '_query', side_effect=query):
+            ProgressResolver.for_courses(AnonymousUser(), [Course(pk=1)])
+            with use_primary():
+                seen.append(router.db_for_read(Course))
+            seen.append(router.db_for_read(Course))
+        self.assertEqual(seen, ['default', 'default', 'replica'])
+
+    @override_settings(DATABASE_REPLICA=None)
+    def test_without_replica_everything_stays_on_default(self):
+        with use_replica():
+            self.assertEqual(router.db_for_read(Course), 'default')
+        self.assertEqual(self.read_alias('get', reverse('course_list')), 'default')
+
+
+class PageCacheTests(CourseFixtureMixin, TestCase):
+    def test_anonymous_pages_are_cached_per_language_and_query(self):
+        url = reverse('course_list')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Python')
+
+        self.assertEqual(self.client.get(url, {'sort': '-title'})['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get(url, {'sort': '-title'})['X-Page-Cache'], 'hit')
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT_LANGUAGE='ru')['X-Page-Cache'], 'miss')
+        # An empty search is the plain page; searches, unknown sorts and parameters bypass the cache.
+        self.assertEqual(self.client.get(url, {'q': ''})['X-Page-Cache'], 'hit')
+        self.assertNotIn('X-Page-Cache', self.client.get(url, {'q': 'python'}))
+        self.assertNotIn('X-Page-Cache', self.client.get(url, {'sort': 'random-1'}))
+        self.assertNotIn('X-Page-Cache', self.client.get(url, {'utm_source': 'ad'}))
+
+    def test_course_edits_invalidate_cached_pages(self):
+        detail = reverse('course_detail', args=[self.course.slug])
+        self.client.get(reverse('course_list'))
+        self.client.get(detail)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Lesson.objects.create(course=self.course, title='Bonus lesson', slug='bonus', order=3)
+        self.assertContains(self.client.get(detail), 'Bonus lesson')
+
+        self.course.title = 'Python 3'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.save()
+        response = self.client.get(reverse('course_list'))
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Python 3')
+
+    def test_cached_pages_carry_the_visitors_csrf_token(self):
+        url = reverse('course_detail', args=[self.course.slug])
+        Client().get(url)
+
+        client = Client(enforce_csrf_checks=True)
+        response = client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertNotContains(response, 'page_cache_csrf_token')
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+        response = client.post(reverse('set_language'), {'language': 'ru', 'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+
+    def test_logged_in_users_get_the_lesson_list_fragment_cached(self):
+        Enrollment.objects.create(course=self.course, student=self.student, status=Enrollment.STATUS_ACCEPTED)
+        self.client.force_login(self.student)
+        url = reverse('course_detail', args=[self.course.slug])
+        response = self.client.get(url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, reverse('course_lesson', args=[self.course.slug, self.lessons[0].slug]))
+        self.assertNotContains(response, reverse('course_lesson', args=[self.course.slug, self.lessons[1].slug]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.complete_lesson(self.lessons[0])
+        response = self.client.get(url)
+        self.assertContains(response, reverse('course_lesson', args=[self.course.slug, self.lessons[1].slug]))
+
+
+class MaterialMediaTests(CourseFixtureMixin, TestCase):
+    payload = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.directory.name, MEDIA_ACCEL_REDIRECT=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.material = self.lessons[0].materials.first()
+        self.material.media_file.save('lecture.mp4', ContentFile(self.payload))
+        self.url = reverse('material_media', args=[self.material.pk])
+        self.enrollment = Enrollment.objects.create(
+            course=self.course, student=self.student, status=Enrollment.STATUS_ACCEPTED,
+        )
+        self.client.force_login(self.student)
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.payload)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.payload)}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(b''.join(response.streaming_content), self.payload[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-')
+        self.assertEqual(b''.join(response.streaming_content), self.payload[1000:])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-24')
+        self.assertEqual(response['Content-Range'], 'bytes 1000-1023/1024')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+        # A stale If-Range gets the whole (new) file.
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='Sat, 01 Jan 2000 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_requires_accepted_enrollment_and_unlocked_lesson(self):
+        locked = self.lessons[1].materials.first()
+        locked.media_file.save('locked.mp4', ContentFile(b'locked'))
+        response = self.client.get(reverse('material_media', args=[locked.pk]))
+        self.assertEqual(response.status_code, 403)
+
+        self.enrollment.status = Enrollment.STATUS_PENDING
+        self.enrollment.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=True, MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_accel_redirect_hands_the_file_to_nginx(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.material.media_file.name)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response.content, b'')
+
+    def signed_link(self):
+        response = self.client.get(reverse('course_lesson', args=[self.course.slug, self.lessons[0].slug]))
+        self.assertIn(settings.MEDIA_USER_COOKIE, response.cookies)
+        return re.search(r'<source src="([^"]+)"', response.content.decode()).group(1).replace('&amp;', '&')
+
+    def test_protected_materials_get_signed_links_checked_without_queries(self):
+        url = self.signed_link()
+        self.assertTrue(url.startswith(settings.MEDIA_URL + self.material.media_file.name + '?'))
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.payload[:10])
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('media_auth'), HTTP_X_ORIGINAL_URI=url)
+        self.assertEqual(response.status_code, 204)
+
+        # Tampered, unsigned or shared with another browser: refused.
+        self.assertEqual(self.client.get(url.replace('u=', 'u=9')).status_code, 403)
+        self.assertEqual(self.client.get(settings.MEDIA_URL + self.material.media_file.name).status_code, 403)
+        self.assertEqual(Client().get(url).status_code, 403)
+        self.assertEqual(
+            Client().get(reverse('media_auth'), HTTP_X_ORIGINAL_URI=url).status_code, 403,
+        )
+
+    def test_signed_links_expire_and_stay_stable_within_a_step(self):
+        name = self.material.media_file.name
+        self.signed_link()
+        cookie = self.client.cookies[settings.MEDIA_USER_COOKIE].value
+        with override_settings(MEDIA_URL_TTL=600, MEDIA_URL_EXPIRY_STEP=3600):
+            url = media_signing.signed_url(name, self.student.pk, now=7200)
+            self.assertEqual(media_signing.signed_url(name, self.student.pk, now=9000), url)
+            self.assertTrue(media_signing.verify_uri(url, cookie, now=10000))
+            self.assertFalse(media_signing.verify_uri(url, cookie, now=10801))
+
+
+class TranscodingTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.directory.name, MEDIA_ACCEL_REDIRECT=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.material = self.lessons[0].materials.first()
+
+    def fake_ffmpeg(self, args):
+        # Writes what ffmpeg would: playlists and a segment, or the poster.
+        output = args[-1]
+        if output.endswith('%v.m3u8'):
+            directory = os.path.dirname(output)
+            with open(os.path.join(directory, transcoding.MASTER_PLAYLIST), 'w') as playlist:
+                playlist.write('#EXTM3U\n360p.m3u8\n')
+            with open(os.path.join(directory, '360p_00000.ts'), 'wb') as segment:
+                segment.write(b'segment')
+        else:
+            with open(output, 'wb') as poster:
+                poster.write(b'jpeg')
+
+    def test_new_video_uploads_are_queued(self):
+        self.material.media_file.save('lecture.mp4', ContentFile(b'video'))
+        self.assertEqual(self.material.transcode_status, Material.TRANSCODE_QUEUED)
+        self.material.refresh_from_db()
+        self.material.transcode_status = Material.TRANSCODE_READY
+        self.material.save()
+        self.assertEqual(self.material.transcode_status, Material.TRANSCODE_READY)
+
+        self.material.media_file.save('notes.pdf', ContentFile(b'pdf'))
+        self.assertEqual(self.material.transcode_status, Material.TRANSCODE_NONE)
+
+    def test_hls_command_skips_renditions_taller_than_the_source(self):
+        renditions = transcoding.plan_renditions(720)
+        self.assertEqual([rendition['name'] for rendition in renditions], ['360p', '480p', '720p'])
+        self.assertEqual([rendition['name'] for rendition in transcoding.plan_renditions(240)], ['360p'])
+
+        args = transcoding.hls_command('in.mp4', 'out', renditions, audio=False)
+        self.assertIn('[0:v]split=3[v0][v1][v2]', args[args.index('-filter_complex') + 1])
+        self.assertEqual(args[args.index('-var_stream_map') + 1], 'v:0,name:360p v:1,name:480p v:2,name:720p')
+        self.assertNotIn('a:0', args)
+
+    def test_worker_stores_renditions_and_lesson_plays_them(self):
+        self.material.media_file.save('lecture.mp4', ContentFile(b'video'))
+        info = {'width': 1280, 'height': 720, 'duration': 60.0, 'audio': True}
+        with mock.patch.object(transcoding, 'probe', return_value=info), \
+                mock.patch.object(transcoding, '_run', side_effect=self.fake_ffmpeg):
+            self.assertEqual(transcoding.transcode_pending(), 1)
+            self.assertEqual(transcoding.transcode_pending(), 0)
+
+        self.material.refresh_from_db()
+        self.assertEqual(self.material.transcode_status, Material.TRANSCODE_READY)
+        self.assertEqual([rendition['name'] for rendition in self.material.renditions], ['360p', '480p', '720p'])
+        self.assertEqual(self.material.renditions[0]['bandwidth'], 896000)
+
+        Enrollment.objects.create(course=self.course, student=self.student, status=Enrollment.STATUS_ACCEPTED)
+        self.client.force_login(self.student)
+        response = self.client.get(reverse('course_lesson', args=[self.course.slug, self.lessons[0].slug]))
+        hls_url = re.search(r'data-hls-src="([^"]+)"', response.content.decode()).group(1)
+        self.assertTrue(hls_url.endswith('/master.m3u8'))
+        self.assertContains(response, 'poster="')
+
+        # Segments resolve relative to the playlist and share its token.
+        segment_url = hls_url.replace('master.m3u8', '360p_00000.ts')
+        with self.assertNumQueries(0):
+            response = self.client.get(segment_url)
+        self.assertEqual(response['Content-Type'], 'video/mp2t')
+        self.assertEqual(b''.join(response.streaming_content), b'segment')
+        self.assertEqual(self.client.get(hls_url.replace('master.m3u8', '../../x')).status_code, 403)
+        self.assertEqual(Client().get(segment_url).status_code, 403)
+
+    def test_upload_replaced_mid_transcode_keeps_the_newer_renditions(self):
+        self.material.media_file.save('lecture.mp4', ContentFile(b'video'))
+        first = default_storage.path(transcoding.output_directory(self.material))
+        info = {'width': 640, 'height': 360, 'duration': 5.0, 'audio': False}
+        newer = []
+
+        def replace_upload(args):
+            self.fake_ffmpeg(args)
+            if not newer:
+                material = Material.objects.get(pk=self.material.pk)
+                material.media_file.save('lecture-v2.mp4', ContentFile(b'video 2'))
+                newer.append(default_storage.path(transcoding.output_directory(material)))
+                # Another worker's finished and in-progress output.
+                os.makedirs(newer[0])
+                os.makedirs(f'{newer[0]}.tmp-1')
+
+        with mock.patch.object(transcoding, 'probe', return_value=info), \
+                mock.patch.object(transcoding, '_run', side_effect=replace_upload):
+            self.assertEqual(transcoding.transcode_pending(), 1)
+            self.material.refresh_from_db()
+            self.assertEqual(self.material.transcode_status, Material.TRANSCODE_QUEUED)
+            self.assertTrue(os.path.isdir(newer[0]))
+            self.assertTrue(os.path.isdir(f'{newer[0]}.tmp-1'))
+
+            self.assertEqual(transcoding.transcode_pending(), 1)
+        self.material.refresh_from_db()
+        self.assertEqual(self.material.transcode_status, Material.TRANSCODE_READY)
+        self.assertTrue(os.path.isfile(os.path.join(newer[0], transcoding.MASTER_PLAYLIST)))
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.isdir(f'{newer[0]}.tmp-1'))
+
+    def test_failed_transcodes_keep_ffmpeg_errors(self):
+        self.material.media_file.save('lecture.mov', ContentFile(b'video'))
+        error = subprocess.CalledProcessError(1, 'ffmpeg', stderr=b'Invalid data found')
+        info = {'width': 640, 'height': 360, 'duration': 5.0, 'audio': False}
+        with mock.patch.object(transcoding, 'probe', return_value=info), \
+                mock.patch.object(transcoding, '_run', side_effect=error):
+            transcoding.transcode_pending()
+        self.material.refresh_from_db()
+        self.assertEqual(self.material.transcode_status, Material.TRANSCODE_FAILED)
+        self.assertEqual(self.material.transcode_error, 'Invalid data found')
+
+
+class ResumableUploadTests(CourseFixtureMixin, TestCase):
+    payload = bytes(range(256)) * 40
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.directory.name, UPLOAD_TEMP_DIR='', UPLOAD_CHUNK_MAX_SIZE=4096)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.admin = get_user_model().objects.create_user(phone_number='+998901119999', password='secret', is_student=False)
+        self.client.force_login(self.admin)
+        self.material = self.lessons[0].materials.first()
+
+    def create(self, filename='lecture.mp4', checksum=None, size=None):
+        metadata = {'material': str(self.material.pk), 'filename': filename}
+        if checksum:
+            metadata['checksum'] = checksum
+        return self.client.post(
+            reverse('upload_create'),
+            HTTP_UPLOAD_LENGTH=str(len(self.payload) if size is None else size),
+            HTTP_UPLOAD_METADATA=','.join(f'{key} {base64.b64encode(value.encode()).decode()}' for key, value in metadata.items()),
+        )
+
+    def patch(self, url, offset, data, **headers):
+        return self.client.generic(
+            'PATCH', url, data, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset), **headers,
+        )
+
+    def test_chunks_are_appended_and_the_file_attached(self):
+        response = self.create(checksum=hashlib.sha256(self.payload).hexdigest())
+        self.assertEqual(response.status_code, 201)
+        url = response['Location']
+
+        chunk = self.payload[:4096]
+        checksum = 'sha256 ' + base64.b64encode(hashlib.sha256(chunk).digest()).decode()
+        response = self.patch(url, 0, chunk, HTTP_UPLOAD_CHECKSUM=checksum)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Upload-Offset'], '4096')
+
+        # A retried chunk and a corrupted one are refused.
+        self.assertEqual(self.patch(url, 0, chunk).status_code, 409)
+        self.assertEqual(self.patch(url, 4096, b'x' * 10, HTTP_UPLOAD_CHECKSUM=checksum).status_code, 460)
+        self.assertEqual(self.client.head(url)['Upload-Offset'], '4096')
+        self.assertEqual(self.patch(url, 4096, b'x' * 5000).status_code, 413)
+
+        self.patch(url, 4096, self.payload[4096:8192])
+        response = self.patch(url, 8192, self.payload[8192:])
+        self.assertEqual(response['Upload-Offset'], str(len(self.payload)))
+
+        # The whole-file checksum is left to the worker.
+        self.assertEqual(self.client.head(url)['Upload-Status'], UploadSession.STATUS_VERIFYING)
+        self.material.refresh_from_db()
+        self.assertFalse(self.material.media_file)
+        self.assertEqual(verify_pending(), 1)
+        self.assertEqual(self.client.head(url)['Upload-Status'], UploadSession.STATUS_COMPLETED)
+
+        self.material.refresh_from_db()
+        self.assertTrue(self.material.media_file.name.startswith('materials/'))
+        with self.material.media_file.open('rb') as media:
+            self.assertEqual(media.read(), self.payload)
+        self.assertEqual(self.material.transcode_status, Material.TRANSCODE_QUEUED)
+        self.assertEqual(UploadSession.objects.get().status, UploadSession.STATUS_COMPLETED)
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, '.uploads')), [])
+
+    def send(self, url):
+        for offset in range(0, len(self.payload), 4096):
+            response = self.patch(url, offset, self.payload[offset:offset + 4096])
+        return response
+
+    def test_whole_file_checksum_mismatch_rejects_the_upload(self):
+        url = self.create(checksum='0' * 64)['Location']
+        self.assertEqual(self.send(url).status_code, 204)
+        self.assertEqual(verify_pending(), 1)
+        self.assertEqual(self.client.head(url).status_code, 460)
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, '.uploads')), [])
+        self.material.refresh_from_db()
+        self.assertFalse(self.material.media_file)
+
+    @override_settings(UPLOAD_VERIFY_ASYNC=False)
+    def test_checksum_is_checked_inline_when_not_async(self):
+        url = self.create(checksum='0' * 64)['Location']
+        self.assertEqual(self.send(url).status_code, 460)
+        self.assertFalse(UploadSession.objects.exists())
+
+        url = self.create(checksum=hashlib.sha256(self.payload).hexdigest())['Location']
+        self.assertEqual(self.send(url).status_code, 204)
+        self.assertEqual(UploadSession.objects.get().status, UploadSession.STATUS_COMPLETED)
+
+    def test_termination_and_expiry(self):
+        url = self.create()['Location']
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.head(url).status_code, 404)
+
+        self.create()
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        self.create()
+        self.assertEqual(UploadSession.objects.count(), 1)
+
+    def test_only_administrators_may_upload(self):
+        self.assertEqual(self.create(size=settings.UPLOAD_MAX_SIZE + 1).status_code, 413)
+        self.client.force_login(self.student)
+        self.assertEqual(self.create().status_code, 403)
+
+
+class DerivativeTests(CourseFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.directory.name, MEDIA_ACCEL_REDIRECT=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        Enrollment.objects.create(course=self.course, student=self.student, status=Enrollment.STATUS_ACCEPTED)
+        self.client.force_login(self.student)
+        self.material = self.lessons[0].materials.first()
+
+    def upload_image(self, name='diagram.png', size=(2000, 1000)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'navy').save(buffer, 'PNG')
+        self.material.media_file.save(name, ContentFile(buffer.getvalue()))
+
+    def lesson_page(self):
+        return self.client.get(reverse('course_lesson', args=[self.course.slug, self.lessons[0].slug]))
+
+    def test_lesson_page_ships_resized_webp_images(self):
+        self.upload_image()
+        response = self.lesson_page()
+        self.assertContains(response, 'srcset=')
+        self.assertNotContains(response, '<video')
+        url = re.search(r'<img\s+src="([^"]+)"', response.content.decode()).group(1)
+        self.assertEqual(url, derivatives.preview_url(self.material, 640))
+
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (640, 320))
+
+        # Unknown widths and stale keys are refused; so are other students.
+        self.assertEqual(self.client.get(url.replace('/640/', '/641/')).status_code, 404)
+        self.assertEqual(self.client.get(url.replace('.webp', '0.webp')).status_code, 404)
+        other = get_user_model().objects.create_user(phone_number='+998901110001', password='secret')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_images_pillow_refuses_are_not_found(self):
+        self.upload_image()
+        url = derivatives.preview_url(self.material, 320)
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        with mock.patch.object(derivatives, '_write_webp', side_effect=ValueError('bad mode')):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_pdf_previews_render_the_first_page(self):
+        self.material.media_file.save('slides.pdf', ContentFile(b'%PDF-1.4'))
+
+        def render(source, width, directory):
+            path = os.path.join(directory, 'page.png')
+            Image.new('RGB', (width, width * 2), 'white').save(path)
+            return path
+
+        with mock.patch.object(derivatives, '_render_pdf_page', side_effect=render):
+            response = self.client.get(derivatives.preview_url(self.material, 320))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(self.lesson_page(), 'Open PDF')
+
+    def test_least_recently_used_derivatives_are_evicted(self):
+        self.upload_image()
+        names = [derivatives.ensure(self.material, width) for width in settings.THUMBNAIL_WIDTHS]
+        paths = [os.path.join(self.directory.name, name) for name in names]
+        for age, path in enumerate(reversed(paths)):
+            os.utime(path, (1000 - age, 1000 - age))
+        # Serving one refreshes it.
+        derivatives.ensure(self.material, settings.THUMBNAIL_WIDTHS[0])
+
+        sizes = [os.path.getsize(path) for path in paths]
+        self.assertEqual(derivatives.evict(max_bytes=sum(sizes) - 1), 1)
+        self.assertEqual([os.path.exists(path) for path in paths], [True, False, True])
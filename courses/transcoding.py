@@ -0,0 +1,226 @@
+"""
+Video transcoding to adaptive HLS.
+
+Saving a material with a new video upload queues it
+(``Material.TRANSCODE_QUEUED``). ``transcode_pending`` (run by
+``manage.py run_transcoding_worker``) claims queued materials with
+``SELECT ... FOR UPDATE SKIP LOCKED`` like the grading worker and runs
+ffmpeg on them outside the transaction, so any number of workers can run
+side by side.
+
+Each video gets one H.264/AAC rendition per ``TRANSCODE_RENDITIONS`` entry
+no taller than the source, a master playlist and a poster frame, written
+to ``hls/<material id>/<digest of the upload name>/`` in the media storage
+(which must be a local directory). Everything sits flat in that directory
+so one signed directory URL (``courses.media_signing``) covers every
+playlist and segment. The lesson page plays ``master.m3u8`` once the
+material is ready and the original upload until then.
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from application.util import VIDEO_EXTENSIONS
+
+from .models import Material
+
+MASTER_PLAYLIST = 'master.m3u8'
+POSTER = 'poster.jpg'
+
+
+def is_video(name):
+    return os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS
+
+
+def queue_if_changed(material):
+    """Before saving: queue ``material`` for transcoding if its upload changed."""
+    name = material.media_file.name or ''
+    previous = ''
+    if material.pk is not None:
+        previous = Material.objects.filter(pk=material.pk).values_list('media_file', flat=True).first() or ''
+    if name == previous:
+        return
+    material.hls_playlist = ''
+    material.poster = ''
+    material.renditions = None
+    material.transcode_error = ''
+    if name and is_video(name) and settings.TRANSCODE_VIDEOS:
+        material.transcode_status = Material.TRANSCODE_QUEUED
+    else:
+        material.transcode_status = Material.TRANSCODE_NONE
+
+
+def _run(args):
+    subprocess.run(args, check=True, capture_output=True, timeout=settings.TRANSCODE_TIMEOUT)
+
+
+def probe(path):
+    """``{'width', 'height', 'duration', 'audio'}`` of the video at ``path``."""
+    output = subprocess.run(
+        [
+            settings.FFPROBE_BINARY, '-v', 'error',
+            '-show_entries', 'stream=codec_type,width,height:format=duration',
+            '-of', 'json', path,
+        ],
+        check=True,
+        capture_output=True,
+        timeout=60,
+    ).stdout
+    info = json.loads(output)
+    streams = info.get('streams', [])
+    video = next((stream for stream in streams if stream.get('codec_type') == 'video'), None)
+    if video is None:
+        raise ValueError(f'{path} has no video stream')
+    return {
+        'width': int(video['width']),
+        'height': int(video['height']),
+        'duration': float(info.get('format', {}).get('duration') or 0),
+        'audio': any(stream.get('codec_type') == 'audio' for stream in streams),
+    }
+
+
+def plan_renditions(source_height):
+    """The configured renditions worth producing for a source ``source_height`` pixels tall."""
+    renditions = sorted(settings.TRANSCODE_RENDITIONS, key=lambda rendition: rendition['height'])
+    # Upscaling only costs bandwidth; a small source still gets one rendition.
+    return [rendition for rendition in renditions if rendition['height'] <= source_height] or renditions[:1]
+
+
+def hls_command(source, directory, renditions, audio=True):
+    """ffmpeg arguments writing all ``renditions`` of ``source`` into ``directory`` in one pass."""
+    segment = settings.HLS_SEGMENT_SECONDS
+    count = len(renditions)
+    split = f'[0:v]split={count}' + ''.join(f'[v{index}]' for index in range(count))
+    scales = [
+        f'[v{index}]scale=-2:{rendition["height"]}[v{index}out]'
+        for index, rendition in enumerate(renditions)
+    ]
+    args = [
+        settings.FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y', '-i', source,
+        '-filter_complex', ';'.join([split, *scales]),
+    ]
+    streams = []
+    for index, rendition in enumerate(renditions):
+        kbps = rendition['video_kbps']
+        args += [
+            '-map', f'[v{index}out]',
+            f'-c:v:{index}', 'libx264',
+            f'-b:v:{index}', f'{kbps}k',
+            f'-maxrate:v:{index}', f'{round(kbps * 1.07)}k',
+            f'-bufsize:v:{index}', f'{round(kbps * 1.5)}k',
+        ]
+        stream = f'v:{index}'
+        if audio:
+            args += ['-map', 'a:0', f'-c:a:{index}', 'aac', f'-b:a:{index}', f'{rendition["audio_kbps"]}k', '-ac', '2']
+            stream += f',a:{index}'
+        streams.append(f'{stream},name:{rendition["name"]}')
+    args += [
+        '-preset', 'veryfast',
+        '-pix_fmt', 'yuv420p',
+        # Key frames on segment boundaries so every rendition switches cleanly.
+        '-force_key_frames', f'expr:gte(t,n_forced*{segment})',
+        '-sc_threshold', '0',
+        '-f', 'hls',
+        '-hls_time', str(segment),
+        '-hls_playlist_type', 'vod',
+        '-hls_flags', 'independent_segments',
+        '-hls_segment_filename', os.path.join(directory, '%v_%05d.ts'),
+        '-master_pl_name', MASTER_PLAYLIST,
+        '-var_stream_map', ' '.join(streams),
+        os.path.join(directory, '%v.m3u8'),
+    ]
+    return args
+
+
+def poster_command(source, path, duration):
+    # A few seconds in, past fade-ins and black title frames.
+    offset = min(3.0, duration / 2)
+    return [
+        settings.FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y',
+        '-ss', f'{offset:.2f}', '-i', source,
+        '-frames:v', '1', '-vf', 'scale=1280:-2', '-q:v', '3', path,
+    ]
+
+
+def output_directory(material):
+    """Media storage directory of the renditions of ``material``'s current upload."""
+    digest = hashlib.md5(material.media_file.name.encode(), usedforsecurity=False).hexdigest()[:12]
+    return f'hls/{material.pk}/{digest}'
+
+
+def transcode(material):
+    """Transcode ``material``'s upload; returns the ``Material`` fields to store."""
+    source = default_storage.path(material.media_file.name)
+    info = probe(source)
+    renditions = plan_renditions(info['height'])
+    directory = output_directory(material)
+    final = default_storage.path(directory)
+    # Written next to the final directory and swapped in complete.
+    working = f'{final}.tmp-{os.getpid()}'
+    shutil.rmtree(working, ignore_errors=True)
+    os.makedirs(working)
+    try:
+        _run(hls_command(source, working, renditions, info['audio']))
+        _run(poster_command(source, os.path.join(working, POSTER), info['duration']))
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(working, final)
+    finally:
+        shutil.rmtree(working, ignore_errors=True)
+    return {
+        'hls_playlist': f'{directory}/{MASTER_PLAYLIST}',
+        'poster': f'{directory}/{POSTER}',
+        'renditions': [
+            {
+                'name': rendition['name'],
+                'height': rendition['height'],
+                'bandwidth': (rendition['video_kbps'] + (rendition['audio_kbps'] if info['audio'] else 0)) * 1000,
+            }
+            for rendition in renditions
+        ],
+    }
+
+
+def remove_stale_renditions(material):
+    """
+    Delete renditions of earlier uploads of ``material``, whose current
+    upload must be the one just stored. Directories other workers are
+    still writing (``.tmp-``) are left alone.
+    """
+    final = default_storage.path(output_directory(material))
+    parent = os.path.dirname(final)
+    for entry in os.listdir(parent):
+        if entry != os.path.basename(final) and '.tmp-' not in entry:
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+
+def transcode_pending(batch_size=1):
+    """Claim up to ``batch_size`` queued videos and transcode them; returns how many were claimed."""
+    with transaction.atomic():
+        materials = list(
+            Material.objects.select_for_update(skip_locked=True)
+            .filter(transcode_status=Material.TRANSCODE_QUEUED)
+            .order_by('updated_at')[:batch_size]
+        )
+        Material.objects.filter(pk__in=[material.pk for material in materials]).update(
+            transcode_status=Material.TRANSCODE_PROCESSING,
+        )
+
+    for material in materials:
+        # Only store the result if the upload was not replaced meanwhile.
+        current = Material.objects.filter(pk=material.pk, media_file=material.media_file.name)
+        try:
+            fields = transcode(material)
+        except (OSError, ValueError, KeyError, subprocess.SubprocessError) as error:
+            stderr = getattr(error, 'stderr', None)
+            message = stderr.decode(errors='replace')[-2000:] if stderr else str(error)
+            current.update(transcode_status=Material.TRANSCODE_FAILED, transcode_error=message)
+        else:
+            if current.update(transcode_status=Material.TRANSCODE_READY, transcode_error='', **fields):
+                remove_stale_renditions(material)
+    return len(materials)
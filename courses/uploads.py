@@ -0,0 +1,237 @@
+"""
+Resumable chunked uploads of material media files.
+
+The protocol is tus 1.0 (core plus the creation, checksum and termination
+extensions), served by ``courses.views.upload_create``/``upload_detail``
+for administrators; the material admin page has a widget that speaks it.
+
+A client creates an ``UploadSession`` for a material and sends the file in
+``PATCH`` requests of at most ``UPLOAD_CHUNK_MAX_SIZE`` bytes. Each chunk
+is streamed from the request straight into a ``.part`` file at its offset,
+so no chunk is ever held in memory and no request takes longer than one
+chunk. After an interruption the client asks for the offset with ``HEAD``
+and carries on from there; ``Upload-Checksum`` lets it have each chunk
+verified as it is written.
+
+When the last byte arrives the ``.part`` file is renamed into the
+material's ``upload_to`` directory and attached. Saving the material
+queues the video for transcoding like a form upload would.
+
+An upload created with a ``checksum`` (hex SHA-256 of the whole file in
+``Upload-Metadata``) is verified first. Reading back many gigabytes takes
+minutes, so with ``UPLOAD_VERIFY_ASYNC`` the last ``PATCH`` only moves the
+session to ``verifying`` and ``verify_pending`` (run by
+``manage.py run_transcoding_worker``) checks and attaches it. ``HEAD``
+reports the state in ``Upload-Status``; a mismatch answers ``460``. The
+admin widget sends per-chunk checksums only: hashing a whole multi-gigabyte
+file in the browser would mean reading it twice.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import shutil
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Material, UploadSession
+
+BLOCK_SIZE = 1024 * 1024
+CHECKSUM_ALGORITHMS = ('sha1', 'sha256')
+
+
+class UploadError(Exception):
+    """Refused upload request; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_metadata(header):
+    """``Upload-Metadata`` (``key base64value,...``) as a dict of strings."""
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in (header or '').split(','))):
+        key, _, value = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(400, f'Invalid Upload-Metadata value for {key!r}')
+    return metadata
+
+
+def purge_expired():
+    """Delete unfinished or rejected sessions untouched for ``UPLOAD_SESSION_TTL`` seconds and their files."""
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    expired = UploadSession.objects.filter(
+        status__in=[UploadSession.STATUS_ACTIVE, UploadSession.STATUS_REJECTED],
+        updated_at__lt=cutoff,
+    )
+    for session in expired:
+        abort(session)
+
+
+def create_session(material, user, size, filename, checksum=''):
+    if material.material_type != Material.LEARNING:
+        raise UploadError(400, 'Only learning materials have media files')
+    if size > settings.UPLOAD_MAX_SIZE:
+        raise UploadError(413, f'Uploads are limited to {settings.UPLOAD_MAX_SIZE} bytes')
+    filename = os.path.basename(filename)
+    if not filename:
+        raise UploadError(400, 'A filename is required in Upload-Metadata')
+    checksum = checksum.lower()
+    if checksum and (len(checksum) != 64 or set(checksum) - set('0123456789abcdef')):
+        raise UploadError(400, 'checksum must be a hex encoded SHA-256')
+
+    purge_expired()
+    session = UploadSession.objects.create(
+        material=material,
+        created_by=user,
+        filename=filename,
+        size=size,
+        checksum=checksum,
+    )
+    os.makedirs(os.path.dirname(session.part_path), exist_ok=True)
+    open(session.part_path, 'wb').close()
+    if size == 0:
+        finish(session)
+    return session
+
+
+def _chunk_digest(header):
+    """``(hashlib object, expected digest)`` for an ``Upload-Checksum`` header."""
+    if not header:
+        return None, None
+    algorithm, _, value = header.partition(' ')
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise UploadError(400, f'Unsupported checksum algorithm {algorithm!r}')
+    try:
+        return hashlib.new(algorithm), base64.b64decode(value, validate=True)
+    except binascii.Error:
+        raise UploadError(400, 'Invalid Upload-Checksum value')
+
+
+def write_chunk(session_id, user, offset, stream, length, checksum_header=None):
+    """
+    Write ``length`` bytes from ``stream`` at ``offset``; returns the
+    session. A chunk cut short by a dropped connection is kept, so the
+    client resumes after its last byte.
+    """
+    if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+        raise UploadError(413, f'Chunks are limited to {settings.UPLOAD_CHUNK_MAX_SIZE} bytes')
+    digest, expected = _chunk_digest(checksum_header)
+
+    with transaction.atomic():
+        # The row lock keeps a retried request from writing the same range twice.
+        session = UploadSession.objects.select_for_update().filter(pk=session_id, created_by=user).first()
+        if session is None:
+            raise UploadError(404, 'Unknown upload')
+        if session.status != UploadSession.STATUS_ACTIVE:
+            raise UploadError(403, 'The upload is already complete')
+        if offset != session.offset:
+            raise UploadError(409, f'Upload-Offset must be {session.offset}')
+        if offset + length > session.size:
+            raise UploadError(413, 'The chunk goes past Upload-Length')
+
+        received = 0
+        with open(session.part_path, 'r+b') as part:
+            part.seek(offset)
+            while received < length:
+                block = stream.read(min(BLOCK_SIZE, length - received))
+                if not block:
+                    break
+                part.write(block)
+                if digest is not None:
+                    digest.update(block)
+                received += len(block)
+            if digest is not None and (received != length or digest.digest() != expected):
+                part.truncate(offset)
+                # 460 Checksum Mismatch (tus checksum extension).
+                raise UploadError(460, 'Upload-Checksum does not match the chunk')
+            # Drop whatever an earlier, interrupted write left past the new end.
+            part.truncate(offset + received)
+
+        session.offset = offset + received
+        session.save(update_fields=['offset', 'updated_at'])
+
+    if session.offset == session.size:
+        finish(session)
+    return session
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finish(session):
+    """Attach a fully received upload, or leave it to ``verify_pending`` if it has a checksum."""
+    if session.checksum and settings.UPLOAD_VERIFY_ASYNC:
+        session.status = UploadSession.STATUS_VERIFYING
+        session.save(update_fields=['status', 'updated_at'])
+        return
+    if session.checksum and _file_sha256(session.part_path) != session.checksum:
+        abort(session)
+        raise UploadError(460, 'The file does not match its checksum; upload it again')
+    _attach(session)
+
+
+def verify_pending(batch_size=1):
+    """Check and attach uploads waiting in ``verifying``; returns how many were claimed."""
+    with transaction.atomic():
+        # The row stays locked while the file is read so no other worker takes it.
+        sessions = list(
+            UploadSession.objects.select_for_update(skip_locked=True)
+            .filter(status=UploadSession.STATUS_VERIFYING)
+            .select_related('material')
+            .order_by('updated_at')[:batch_size]
+        )
+        for session in sessions:
+            try:
+                matches = _file_sha256(session.part_path) == session.checksum
+            except FileNotFoundError:
+                matches = False
+            if matches:
+                _attach(session)
+                continue
+            try:
+                os.remove(session.part_path)
+            except FileNotFoundError:
+                pass
+            session.status = UploadSession.STATUS_REJECTED
+            session.save(update_fields=['status', 'updated_at'])
+    return len(sessions)
+
+
+def _attach(session):
+    material = session.material
+    name = default_storage.get_available_name(
+        material._meta.get_field('media_file').generate_filename(material, session.filename),
+    )
+    destination = default_storage.path(name)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    # A rename when UPLOAD_TEMP_DIR is on the media filesystem, a copy otherwise.
+    shutil.move(session.part_path, destination)
+    if settings.FILE_UPLOAD_PERMISSIONS is not None:
+        os.chmod(destination, settings.FILE_UPLOAD_PERMISSIONS)
+
+    with transaction.atomic():
+        material.media_file.name = name
+        material.save()
+        session.status = UploadSession.STATUS_COMPLETED
+        session.save(update_fields=['status', 'updated_at'])
+
+
+def abort(session):
+    try:
+        os.remove(session.part_path)
+    except FileNotFoundError:
+        pass
+    session.delete()
@@ -1,14 +1,27 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
+# Read-heavy pages have async versions for the ASGI deployment.
+_async = settings.ASYNC_VIEWS
+
 urlpatterns = [
-    path("", views.course_list, name="course_list"),
-    path("dashboard/", views.progress_dashboard, name="progress_dashboard"),
+    path("", views.course_list_async if _async else views.course_list, name="course_list"),
+    path("dashboard/", views.progress_dashboard_async if _async else views.progress_dashboard, name="progress_dashboard"),
     path("submissions/history/", views.submission_history, name="submission_history"),
-    path("<slug:course_slug>/", views.course_detail, name="course_detail"),
+    path("media-auth/", views.media_auth, name="media_auth"),
+    path("uploads/", views.upload_create, name="upload_create"),
+    path("uploads/<uuid:session_id>/", views.upload_detail, name="upload_detail"),
+    path("<slug:course_slug>/", views.course_detail_async if _async else views.course_detail, name="course_detail"),
     path("<slug:course_slug>/enroll/", views.enroll_course, name="course_enroll"),
     path("<slug:course_slug>/lessons/<slug:lesson_slug>/", views.lesson_detail, name="course_lesson"),
     path("materials/<int:material_pk>/complete/", views.complete_material, name="material_complete"),
     path("materials/<int:material_pk>/submit/", views.submit_task, name="task_submit"),
+    path("materials/<int:material_pk>/media/", views.material_media, name="material_media"),
+    path(
+        "materials/<int:material_pk>/preview/<int:width>/<str:key>.webp",
+        views.material_preview,
+        name="material_preview",
+    ),
 ]
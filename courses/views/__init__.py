@@ -8,3 +8,11 @@ from .course import (
     submission_history,
     submit_task,
 )
+from .asynchronous import (
+    course_detail_async,
+    course_list_async,
+    progress_dashboard_async,
+    resolve_user,
+)
+from .media import material_media, material_preview, media_auth, signed_media
+from .uploads import upload_create, upload_detail
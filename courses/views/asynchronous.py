@@ -0,0 +1,82 @@
+"""
+Async versions of the read-heavy course pages, routed instead of the sync
+views when ``ASYNC_VIEWS`` is on (the ASGI deployment, see
+``application/gunicorn.py``).
+
+They build the same context as their sync counterparts through the async
+ORM. Work that only has a sync API (search, the progress cache) goes
+through ``sync_to_async``. Everything the template touches is loaded
+before ``render``, which runs on the event loop and cannot query.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import aget_object_or_404, render
+
+from .. import caching
+from ..models import Course, Enrollment
+from ..page_cache import cache_anonymous_page
+from ..progress import ProgressResolver
+from ..search import search_courses
+from .course import _dashboard_context, _sort_courses
+
+
+async def resolve_user(request):
+    """
+    Load the user without blocking the event loop. Templates read
+    ``request.user`` synchronously, so it is replaced with the loaded user.
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+@cache_anonymous_page
+async def course_list_async(request):
+    await resolve_user(request)
+    courses = Course.objects.filter(is_published=True)
+
+    search_query = request.GET.get('q', '').strip()
+    if search_query:
+        # The trigram fallback runs a query while building the queryset.
+        courses = await sync_to_async(search_courses)(courses, search_query)
+
+    sort_by = request.GET.get('sort', 'relevance' if search_query else 'title')
+    context = {
+        'courses': [course async for course in _sort_courses(courses, sort_by)],
+        'search_query': search_query,
+        'sort_by': sort_by,
+    }
+    return render(request, 'courses/list.html', context)
+
+
+@cache_anonymous_page
+async def course_detail_async(request, course_slug):
+    course = await aget_object_or_404(Course, slug=course_slug, is_published=True)
+    user = await resolve_user(request)
+    enrollment = await course.aenrollment_for(user)
+    progress = await ProgressResolver.afor_course(user, course)
+    context = {
+        'course': course,
+        'enrollment': enrollment,
+        'lesson_states': progress.states,
+        'lesson_list_version': await sync_to_async(caching.lesson_list_version)(user.pk, course.pk),
+    }
+    return render(request, 'courses/detail.html', context)
+
+
+@login_required
+async def progress_dashboard_async(request):
+    user = await resolve_user(request)
+    if not user.is_student:
+        raise PermissionDenied
+
+    enrollments = [
+        enrollment
+        async for enrollment in Enrollment.objects.filter(
+            student=user,
+            status=Enrollment.STATUS_ACCEPTED,
+        ).select_related('course')
+    ]
+    resolvers = await ProgressResolver.afor_courses(user, [enrollment.course for enrollment in enrollments])
+    context = _dashboard_context(enrollments, resolvers)
+    return render(request, 'courses/progress_dashboard.html', context)
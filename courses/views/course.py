@@ -1,10 +1,18 @@
+import posixpath
+from collections import defaultdict
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
-from django.db.models import Prefetch, Q, Count
+from django.db import IntegrityError
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
 from django.utils.translation import gettext as _
 
+from application.util import IMAGE_EXTENSIONS
+
 from ..forms import TaskSubmissionForm
 from ..models import (
     Course,
@@ -14,50 +22,51 @@ from ..models import (
     MaterialCompletion,
     TaskSubmission,
 )
+from .. import caching, derivatives, media_signing
+from ..page_cache import cache_anonymous_page
+from ..progress import ProgressResolver
+from ..search import search_courses
 
 
+@cache_anonymous_page
 def course_list(request):
-    courses = Course.objects.filter(is_published=True).prefetch_related('lessons')
+    courses = Course.objects.filter(is_published=True)
     
     # Search functionality
     search_query = request.GET.get('q', '').strip()
     if search_query:
-        courses = courses.filter(
-            Q(title__icontains=search_query) | 
-            Q(summary__icontains=search_query)
-        )
-    
-    # Sort functionality
-    sort_by = request.GET.get('sort', 'title')
-    if sort_by == 'lessons':
-        courses = courses.annotate(lesson_count=Count('lessons')).order_by('-lesson_count')
-    elif sort_by == 'title':
-        courses = courses.order_by('title')
-    elif sort_by == '-title':
-        courses = courses.order_by('-title')
+        courses = search_courses(courses, search_query)
     
+    # Sort functionality; searches default to relevance order
+    sort_by = request.GET.get('sort', 'relevance' if search_query else 'title')
     context = {
-        'courses': courses,
+        'courses': _sort_courses(courses, sort_by),
         'search_query': search_query,
         'sort_by': sort_by,
     }
     return render(request, 'courses/list.html', context)
 
 
+def _sort_courses(courses, sort_by):
+    if sort_by == 'lessons':
+        return courses.order_by('-lesson_count', 'title')
+    if sort_by == 'title':
+        return courses.order_by('title')
+    if sort_by == '-title':
+        return courses.order_by('-title')
+    return courses
+
+
+@cache_anonymous_page
 def course_detail(request, course_slug):
     course = get_object_or_404(Course, slug=course_slug, is_published=True)
     enrollment = course.enrollment_for(request.user)
-    lesson_states = []
-    for lesson in course.lessons.all():
-        lesson_states.append({
-            'lesson': lesson,
-            'completed': lesson.completed_for(request.user),
-            'available': lesson.is_available_for(request.user),
-        })
+    progress = ProgressResolver.for_course(request.user, course)
     context = {
         'course': course,
         'enrollment': enrollment,
-        'lesson_states': lesson_states,
+        'lesson_states': progress.states,
+        'lesson_list_version': caching.lesson_list_version(request.user.pk, course.pk),
     }
     return render(request, 'courses/detail.html', context)
 
@@ -79,52 +88,101 @@ def enroll_course(request, course_slug):
     return redirect('course_detail', course_slug=course.slug)
 
 
+def _media_url(material, user):
+    # Signed links are checked without a query, so nginx can serve them.
+    if material.is_protected:
+        return media_signing.signed_url(material.media_file.name, user.pk)
+    return reverse('material_media', args=[material.pk])
+
+
+def _media_kind(name):
+    # Anything else keeps playing in the <video> element.
+    extension = posixpath.splitext(name)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return 'image'
+    if extension == '.pdf':
+        return 'pdf'
+    return 'video'
+
+
+def _hls_urls(material, user):
+    # One token for the directory covers the playlists and segments.
+    directory = posixpath.dirname(material.hls_playlist)
+    return {
+        'hls_url': media_signing.signed_directory_url(directory, posixpath.basename(material.hls_playlist), user.pk),
+        'poster_url': media_signing.signed_directory_url(directory, posixpath.basename(material.poster), user.pk),
+    }
+
+
 @login_required
 def lesson_detail(request, course_slug, lesson_slug):
-    lesson = get_object_or_404(Lesson, course__slug=course_slug, slug=lesson_slug)
+    lesson = get_object_or_404(
+        Lesson.objects.select_related('course'),
+        course__slug=course_slug,
+        slug=lesson_slug,
+    )
     enrollment = get_object_or_404(
         Enrollment,
         course=lesson.course,
         student=request.user,
         status=Enrollment.STATUS_ACCEPTED,
     )
-    if not lesson.is_available_for(request.user) and not lesson.completed_for(request.user):
+    if not lesson.is_accessible_for(request.user):
         messages.warning(request, _('Complete the previous lessons before continuing.'))
         return redirect('course_detail', course_slug=course_slug)
-    materials = lesson.materials.select_related('lesson').order_by('order')
+    materials = list(lesson.materials.order_by('order'))
     completed = set(
         MaterialCompletion.objects.filter(material__lesson=lesson, student=request.user)
         .values_list('material_id', flat=True)
     )
     
-    # Get submission data for task materials
+    # Load every submission for the lesson's tasks at once and group them per material
+    submissions_by_material = defaultdict(list)
+    task_ids = [material.pk for material in materials if material.material_type == Material.TASK]
+    if task_ids:
+        for submission in TaskSubmission.objects.filter(
+            material_id__in=task_ids,
+            student=request.user,
+        ).order_by('-submitted_at'):
+            submissions_by_material[submission.material_id].append(submission)
+    
     material_data = []
     for material in materials:
+        material.lesson = lesson
         data = {'material': material, 'completed': material.id in completed}
+        if material.media_file:
+            data['media_url'] = _media_url(material, request.user)
+            data['media_kind'] = _media_kind(material.media_file.name)
+            if derivatives.kind(material.media_file.name):
+                data['preview_url'] = derivatives.preview_url(material, derivatives.default_width())
+                data['preview_srcset'] = derivatives.srcset(material)
+            if material.transcode_status == Material.TRANSCODE_READY:
+                data.update(_hls_urls(material, request.user))
         if material.material_type == Material.TASK:
-            submissions = TaskSubmission.objects.filter(
-                material=material, 
-                student=request.user
-            ).order_by('-submitted_at')
+            submissions = submissions_by_material[material.pk]
             data['submissions'] = submissions
-            data['can_submit'] = TaskSubmission.can_submit(material, request.user)
-            data['attempts_used'] = TaskSubmission.get_attempts_count(material, request.user)
-            data['latest_submission'] = submissions.first()
+            data['attempts_used'] = len(submissions)
+            data['can_submit'] = len(submissions) < TaskSubmission.MAX_ATTEMPTS
+            data['latest_submission'] = submissions[0] if submissions else None
         material_data.append(data)
     
     context = {
         'lesson': lesson,
         'course': lesson.course,
         'material_data': material_data,
+        'has_hls': any('hls_url' in data for data in material_data),
         'enrollment': enrollment,
         'completed_ids': completed,
     }
-    return render(request, 'courses/lesson.html', context)
+    response = render(request, 'courses/lesson.html', context)
+    if any(material.media_file and (material.is_protected or material.hls_playlist) for material in materials):
+        media_signing.set_user_cookie(response, request.user)
+    return response
 
 
 @login_required
 def complete_material(request, material_pk):
-    material = get_object_or_404(Material, pk=material_pk)
+    material = get_object_or_404(Material.objects.select_related('lesson__course'), pk=material_pk)
     if request.method != 'POST':
         raise PermissionDenied
     enrollment = get_object_or_404(
@@ -134,7 +192,7 @@ def complete_material(request, material_pk):
         status=Enrollment.STATUS_ACCEPTED,
     )
     lesson = material.lesson
-    if not lesson.is_available_for(request.user) and not lesson.completed_for(request.user):
+    if not lesson.is_accessible_for(request.user):
         raise PermissionDenied
     
     # Only allow completion for learning materials (not tasks)
@@ -149,7 +207,7 @@ def complete_material(request, material_pk):
 
 @login_required
 def submit_task(request, material_pk):
-    material = get_object_or_404(Material, pk=material_pk, material_type=Material.TASK)
+    material = get_object_or_404(Material.objects.select_related('lesson__course'), pk=material_pk, material_type=Material.TASK)
     enrollment = get_object_or_404(
         Enrollment,
         course=material.lesson.course,
@@ -158,34 +216,40 @@ def submit_task(request, material_pk):
     )
     lesson = material.lesson
     
-    if not lesson.is_available_for(request.user) and not lesson.completed_for(request.user):
+    if not lesson.is_accessible_for(request.user):
         raise PermissionDenied
     
-    # Check attempt limit
-    if not TaskSubmission.can_submit(material, request.user):
-        messages.error(request, _('You have used all 3 attempts for this task.'))
-        return redirect('course_lesson', course_slug=lesson.course.slug, lesson_slug=lesson.slug)
-    
     if request.method == 'POST':
         form = TaskSubmissionForm(material, request.POST)
         if form.is_valid():
-            attempt_number = TaskSubmission.get_attempts_count(material, request.user) + 1
-            submission = TaskSubmission.objects.create(
-                material=material,
-                student=request.user,
-                answer_payload=form.get_answer_payload(),
-                attempt_number=attempt_number,
-            )
+            grade_async = settings.GRADING_ASYNC
+            # Numbers the attempt and enforces the limit atomically
+            try:
+                submission = TaskSubmission.submit(
+                    material,
+                    request.user,
+                    form.get_answer_payload(),
+                    status=TaskSubmission.STATUS_QUEUED if grade_async else TaskSubmission.STATUS_PENDING,
+                )
+            except IntegrityError:
+                # Concurrent submits kept taking the attempt number.
+                messages.error(request, _('Your answer could not be saved. Please submit it again.'))
+                return redirect('task_submit', material_pk=material.pk)
+            if submission is None:
+                messages.error(request, _('You have used all {count} attempts for this task.').format(count=TaskSubmission.MAX_ATTEMPTS))
+                return redirect('course_lesson', course_slug=lesson.course.slug, lesson_slug=lesson.slug)
             
-            # Try auto-grading
-            if submission.auto_grade():
+            if grade_async:
+                # Graded by manage.py run_grading_worker
+                messages.info(request, _('Your answer has been submitted and will be graded shortly.'))
+            elif submission.auto_grade():
                 if submission.is_passing():
                     MaterialCompletion.objects.get_or_create(material=material, student=request.user)
                     messages.success(request, _('Correct! Score: {score}%. Material completed.').format(score=int(submission.score)))
                 else:
                     messages.warning(request, _('Incorrect. Score: {score}%. You have {remaining} attempts remaining.').format(
                         score=int(submission.score),
-                        remaining=3 - attempt_number
+                        remaining=TaskSubmission.MAX_ATTEMPTS - TaskSubmission.get_attempts_count(material, request.user)
                     ))
             else:
                 messages.info(request, _('Your answer has been submitted for review.'))
@@ -194,11 +258,16 @@ def submit_task(request, material_pk):
     else:
         form = TaskSubmissionForm(material)
     
+    attempts_used = TaskSubmission.get_attempts_count(material, request.user)
+    if attempts_used >= TaskSubmission.MAX_ATTEMPTS:
+        messages.error(request, _('You have used all {count} attempts for this task.').format(count=TaskSubmission.MAX_ATTEMPTS))
+        return redirect('course_lesson', course_slug=lesson.course.slug, lesson_slug=lesson.slug)
+    
     context = {
         'material': material,
         'lesson': lesson,
         'form': form,
-        'attempts_used': TaskSubmission.get_attempts_count(material, request.user),
+        'attempts_used': attempts_used,
     }
     return render(request, 'courses/submit_task.html', context)
 
@@ -209,9 +278,24 @@ def submission_history(request):
     if not request.user.is_student:
         raise PermissionDenied
     
+    course_ids = Enrollment.objects.filter(
+        student=request.user,
+        status=Enrollment.STATUS_ACCEPTED
+    ).values_list('course_id', flat=True)
+    key = caching.student_key('submission-history', request.user.pk, course_ids)
+    history_data = caching.get_or_set(key, lambda: _build_submission_history(request.user))
+    
+    context = {
+        'history_data': history_data,
+    }
+    return render(request, 'courses/submission_history.html', context)
+
+
+def _build_submission_history(user):
+    """Per-course/lesson grouping of the user's task submissions (cached by the view)."""
     # Get all enrolled courses with their lessons and task materials
     enrollments = Enrollment.objects.filter(
-        student=request.user,
+        student=user,
         status=Enrollment.STATUS_ACCEPTED
     ).select_related('course').prefetch_related(
         Prefetch(
@@ -222,7 +306,7 @@ def submission_history(request):
                     queryset=Material.objects.filter(material_type='task').prefetch_related(
                         Prefetch(
                             'submissions',
-                            queryset=TaskSubmission.objects.filter(student=request.user).order_by('-submitted_at'),
+                            queryset=TaskSubmission.objects.filter(student=user).order_by('-submitted_at'),
                             to_attr='student_submissions'
                         )
                     )
@@ -258,11 +342,7 @@ def submission_history(request):
                     course_data['lessons'].append(lesson_data)
         if course_data['lessons']:
             history_data.append(course_data)
-    
-    context = {
-        'history_data': history_data,
-    }
-    return render(request, 'courses/submission_history.html', context)
+    return history_data
 
 
 @login_required
@@ -271,60 +351,47 @@ def progress_dashboard(request):
     if not request.user.is_student:
         raise PermissionDenied
     
-    # Get all enrollments with course and lesson data
-    enrollments = Enrollment.objects.filter(
+    # Get all enrollments with course data
+    enrollments = list(Enrollment.objects.filter(
         student=request.user,
         status=Enrollment.STATUS_ACCEPTED
-    ).select_related('course').prefetch_related('course__lessons__materials')
-    
-    # Build dashboard data
+    ).select_related('course'))
+    resolvers = ProgressResolver.for_courses(request.user, [enrollment.course for enrollment in enrollments])
+    context = _dashboard_context(enrollments, resolvers)
+    return render(request, 'courses/progress_dashboard.html', context)
+
+
+def _dashboard_context(enrollments, resolvers):
+    """Template context of the progress dashboard from loaded enrollments and their resolvers."""
     dashboard_data = []
     total_lessons = 0
     completed_lessons = 0
     
     for enrollment in enrollments:
         course = enrollment.course
-        lessons = list(course.lessons.all())
-        total_lessons += len(lessons)
-        
-        # Calculate course statistics
-        course_completed = 0
-        next_lesson = None
-        
-        for lesson in lessons:
-            if lesson.completed_for(request.user):
-                course_completed += 1
-                completed_lessons += 1
-            elif next_lesson is None and lesson.is_available_for(request.user):
-                next_lesson = lesson
-        
-        # Calculate progress percentage
-        progress_percentage = round((course_completed / len(lessons) * 100)) if lessons else 0
-        
-        # Count materials
-        total_materials = sum(material.material_type == 'learning' for lesson in lessons for material in lesson.materials.all())
-        total_tasks = sum(material.material_type == 'task' for lesson in lessons for material in lesson.materials.all())
+        progress = resolvers[course.pk]
+        total_lessons += progress.total_lessons
+        completed_lessons += progress.completed_lessons
         
         dashboard_data.append({
             'enrollment': enrollment,
             'course': course,
-            'total_lessons': len(lessons),
-            'completed_lessons': course_completed,
-            'progress_percentage': progress_percentage,
-            'next_lesson': next_lesson,
-            'total_materials': total_materials,
-            'total_tasks': total_tasks,
-            'is_completed': course_completed == len(lessons) and len(lessons) > 0,
+            'total_lessons': progress.total_lessons,
+            'completed_lessons': progress.completed_lessons,
+            'progress_percentage': progress.progress_percentage,
+            'next_lesson': progress.next_lesson,
+            'total_materials': progress.learning_count,
+            'total_tasks': progress.task_count,
+            'is_completed': progress.is_completed,
         })
     
     # Overall statistics
     overall_progress = round((completed_lessons / total_lessons * 100)) if total_lessons else 0
     
-    context = {
+    return {
         'dashboard_data': dashboard_data,
         'total_courses': len(dashboard_data),
         'total_lessons': total_lessons,
         'completed_lessons': completed_lessons,
         'overall_progress': overall_progress,
     }
-    return render(request, 'courses/progress_dashboard.html', context)
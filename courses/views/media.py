@@ -0,0 +1,204 @@
+"""
+Access-controlled streaming of ``Material.media_file``.
+
+``material_media`` checks that the student has an accepted enrollment and
+the lesson unlocked (or already completed); administrators can always
+watch. Protected materials are linked with signed URLs instead
+(``courses.media_signing``), which ``media_auth`` and ``signed_media``
+check without a database query.
+
+The bytes never go through Python in production: with
+``MEDIA_ACCEL_REDIRECT`` set the response is an empty ``X-Accel-Redirect``
+to nginx's internal location, which serves the file with ``sendfile`` and
+handles ``Range`` itself. Without it (dev, runserver) the file is streamed
+by ``FileResponse`` with single byte range support, so players can seek
+without downloading from the start.
+"""
+import mimetypes
+import posixpath
+import re
+import subprocess
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import http_date, parse_http_date_safe
+from PIL import Image
+
+from .. import derivatives, media_signing
+from ..models import Enrollment, Material
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Types mimetypes gets wrong or does not know (.ts is a Qt translation to it).
+_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+}
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` (inclusive) of a single ``bytes=`` range, ``None`` to
+    send the whole file. Raises ``ValueError`` if the range cannot be
+    satisfied.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        # Multiple ranges and other units may be answered with the whole file.
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if not length or not size:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class _FileRange:
+    """``length`` bytes of ``file`` from its current position."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        # Lets the WSGI server sendfile() Content-Length bytes from the offset.
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def _check_access(user, material):
+    if not user.is_student:
+        return
+    lesson = material.lesson
+    get_object_or_404(
+        Enrollment,
+        course_id=lesson.course_id,
+        student=user,
+        status=Enrollment.STATUS_ACCEPTED,
+    )
+    if not lesson.is_accessible_for(user):
+        raise PermissionDenied
+
+
+def _accel_redirect(name, content_type):
+    response = HttpResponse(content_type=content_type)
+    response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_PREFIX + name)
+    return response
+
+
+def _stream(request, storage, name, content_type):
+    try:
+        file = storage.open(name, 'rb')
+    except FileNotFoundError:
+        raise Http404
+    size = storage.size(name)
+    modified = int(storage.get_modified_time(name).timestamp())
+
+    requested = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if requested and if_range and parse_http_date_safe(if_range) != modified:
+        # The client's partial copy is of an older upload.
+        requested = None
+    try:
+        byte_range = parse_range(requested, size) if requested else None
+    except ValueError:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(_FileRange(file, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(modified)
+    return response
+
+
+def _serve(request, storage, name):
+    content_type = (
+        _CONTENT_TYPES.get(posixpath.splitext(name)[1])
+        or mimetypes.guess_type(name)[0]
+        or 'application/octet-stream'
+    )
+    if settings.MEDIA_ACCEL_REDIRECT:
+        response = _accel_redirect(name, content_type)
+    else:
+        response = _stream(request, storage, name, content_type)
+    # Players re-request ranges while seeking; let the browser keep them.
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+@login_required
+def material_media(request, material_pk):
+    material = get_object_or_404(Material.objects.select_related('lesson'), pk=material_pk)
+    if not material.media_file:
+        raise Http404
+    _check_access(request.user, material)
+    return _serve(request, material.media_file.storage, material.media_file.name)
+
+
+@login_required
+def material_preview(request, material_pk, width, key):
+    """WebP thumbnail of an image or PDF material (``courses.derivatives``), cacheable forever."""
+    material = get_object_or_404(Material.objects.select_related('lesson'), pk=material_pk)
+    if (
+        not material.media_file
+        or derivatives.kind(material.media_file.name) is None
+        or width not in settings.THUMBNAIL_WIDTHS
+        or key != derivatives.derivative_key(material.media_file.name, width)
+    ):
+        raise Http404
+    _check_access(request.user, material)
+    try:
+        name = derivatives.ensure(material, width)
+    except (OSError, ValueError, Image.DecompressionBombError, subprocess.SubprocessError):
+        # Missing, unreadable or oversized upload (Pillow and pdftoppm errors included).
+        raise Http404
+    response = _serve(request, default_storage, name)
+    # The name changes with the upload, so the bytes behind a URL never do.
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+def signed_media(request, path):
+    """Serves ``MEDIA_URL`` when nginx does not (dev); only signed URLs are answered."""
+    if not media_signing.verify(path, request.GET, request.COOKIES.get(settings.MEDIA_USER_COOKIE)):
+        raise PermissionDenied
+    return _serve(request, default_storage, media_signing.media_name(path))
+
+
+def media_auth(request):
+    """nginx ``auth_request`` target: 204 if ``X-Original-URI`` is a valid signed media URL, 403 if not."""
+    uri = request.headers.get('X-Original-URI', '')
+    if media_signing.verify_uri(uri, request.COOKIES.get(settings.MEDIA_USER_COOKIE)):
+        return HttpResponse(status=204)
+    return HttpResponse(status=403)
@@ -0,0 +1,97 @@
+"""tus endpoints for resumable material uploads (see ``courses.uploads``)."""
+from django.conf import settings
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
+
+from users.decorators import admin_required
+
+from .. import uploads
+from ..models import Material, UploadSession
+
+TUS_VERSION = '1.0.0'
+
+
+def _tus_response(status=204, **headers):
+    response = HttpResponse(status=status)
+    response['Tus-Resumable'] = TUS_VERSION
+    response['Cache-Control'] = 'no-store'
+    for name, value in headers.items():
+        response[name.replace('_', '-')] = value
+    return response
+
+
+def _error(error):
+    response = _tus_response(error.status)
+    response.content = str(error)
+    response['Content-Type'] = 'text/plain; charset=utf-8'
+    return response
+
+
+def _int_header(request, name):
+    try:
+        value = int(request.headers[name])
+    except (KeyError, ValueError):
+        raise uploads.UploadError(400, f'{name} must be a non-negative integer')
+    if value < 0:
+        raise uploads.UploadError(400, f'{name} must be a non-negative integer')
+    return value
+
+
+@admin_required
+@require_http_methods(['OPTIONS', 'POST'])
+def upload_create(request):
+    if request.method == 'OPTIONS':
+        return _tus_response(
+            Tus_Version=TUS_VERSION,
+            Tus_Extension='creation,checksum,termination',
+            Tus_Max_Size=settings.UPLOAD_MAX_SIZE,
+            Tus_Checksum_Algorithm=','.join(uploads.CHECKSUM_ALGORITHMS),
+        )
+    try:
+        size = _int_header(request, 'Upload-Length')
+        metadata = uploads.parse_metadata(request.headers.get('Upload-Metadata'))
+        material_id = metadata.get('material', '')
+        material = Material.objects.filter(pk=material_id).first() if material_id.isdigit() else None
+        if material is None:
+            raise uploads.UploadError(400, 'Upload-Metadata must name an existing material')
+        session = uploads.create_session(
+            material,
+            request.user,
+            size,
+            metadata.get('filename', ''),
+            metadata.get('checksum', ''),
+        )
+    except uploads.UploadError as error:
+        return _error(error)
+    return _tus_response(201, Location=reverse('upload_detail', args=[session.pk]), Upload_Offset=session.offset)
+
+
+@admin_required
+@require_http_methods(['HEAD', 'PATCH', 'DELETE'])
+def upload_detail(request, session_id):
+    if request.method == 'PATCH':
+        if request.content_type != 'application/offset+octet-stream':
+            return _tus_response(415)
+        try:
+            session = uploads.write_chunk(
+                session_id,
+                request.user,
+                _int_header(request, 'Upload-Offset'),
+                request,
+                _int_header(request, 'Content-Length'),
+                request.headers.get('Upload-Checksum'),
+            )
+        except uploads.UploadError as error:
+            return _error(error)
+        return _tus_response(Upload_Offset=session.offset)
+
+    session = get_object_or_404(UploadSession, pk=session_id, created_by=request.user)
+    if request.method == 'DELETE':
+        uploads.abort(session)
+        return _tus_response()
+    if session.status == UploadSession.STATUS_REJECTED:
+        # 460 Checksum Mismatch, as the last PATCH answers without UPLOAD_VERIFY_ASYNC.
+        return _tus_response(460, Upload_Status=session.status)
+    return _tus_response(200, Upload_Offset=session.offset, Upload_Length=session.size, Upload_Status=session.status)
@@ -44,6 +44,8 @@ translations = {
     "Mark as 100 percent passing": {"uz": "100 foiz o'tgan deb belgilash", "ru": "Отметить как пройденное на 100%"},
     "{count} submissions marked as graded": {"uz": "{count} ta topshiriq baholangan deb belgilandi", "ru": "{count} представлений отмечено как оцененное"},
     "{count} submissions marked as passing": {"uz": "{count} ta topshiriq o'tgan deb belgilandi", "ru": "{count} представлений отмечено как пройденное"},
+    "Regrade submissions": {"uz": "Topshiriqlarni qayta baholash", "ru": "Переоценить ответы"},
+    "{count} submissions regraded, {completions} completions changed": {"uz": "{count} ta topshiriq qayta baholandi, {completions} ta bajarilish o'zgardi", "ru": "Переоценено ответов: {count}, изменено завершений: {completions}"},
     "{count} enrollments accepted": {"uz": "{count} ta ro'yxatdan o'tish qabul qilindi", "ru": "{count} регистраций принято"},
     "{count} enrollments rejected": {"uz": "{count} ta ro'yxatdan o'tish rad etildi", "ru": "{count} регистраций отклонено"},
     "Mark selected enrollments as accepted": {"uz": "Tanlangan ro'yxatdan o'tishlarni qabul qilingan deb belgilash", "ru": "Отметить выбранные регистрации как принятые"},
@@ -91,6 +93,9 @@ translations = {
     "Sort: A-Z": {"uz": "Tartiblash: A-Z", "ru": "Сортировка: А-Я"},
     "Sort: Z-A": {"uz": "Tartiblash: Z-A", "ru": "Сортировка: Я-А"},
     "Sort: Most Lessons": {"uz": "Tartiblash: Ko'p Darslar", "ru": "Сортировка: Больше уроков"},
+    "Sort: Relevance": {"uz": "Tartiblash: Moslik", "ru": "Сортировка: По релевантности"},
+    "Grading...": {"uz": "Baholanmoqda...", "ru": "Проверяется..."},
+    "Your answer has been submitted and will be graded shortly.": {"uz": "Javobingiz yuborildi va tez orada baholanadi.", "ru": "Ваш ответ отправлен и скоро будет проверен."},
     "Search": {"uz": "Qidirish", "ru": "Поиск"},
     "Clear": {"uz": "Tozalash", "ru": "Очистить"},
     "View Course": {"uz": "Kursni Ko'rish", "ru": "Посмотреть курс"},
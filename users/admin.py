@@ -1,5 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+
+from application.profiling import add_targets
 from .forms import CustomUserCreationForm, CustomUserChangeForm
 from .models import CustomUser
 
@@ -39,6 +41,7 @@ class CustomUserAdmin(UserAdmin):
     )
     
     readonly_fields = ("last_login", "date_joined")
+    actions = ("profile_requests",)
     
     def full_name(self, obj):
         return obj.get_full_name() or "-"
@@ -55,6 +58,12 @@ class CustomUserAdmin(UserAdmin):
         return "Unknown"
     user_type.short_description = "User Type"
 
+    def profile_requests(self, request, queryset):
+        """Record sampling profiles of the selected users' requests for 15 minutes."""
+        targets = add_targets(users=queryset.values_list("pk", flat=True), minutes=15)
+        self.message_user(request, f"Profiling requests of {len(targets['users'])} users for 15 minutes")
+    profile_requests.short_description = "Profile requests for 15 minutes"
+
 
 
 admin.site.register(CustomUser, CustomUserAdmin)
@@ -1,8 +1,9 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 urlpatterns = [
-    path("", views.home, name="home"),
+    path("", views.home_async if settings.ASYNC_VIEWS else views.home, name="home"),
     path("register/", views.create_account, name="register"),
     path("login/", views.user_login, name="login"),
     path("logout/", views.user_logout, name="logout"),
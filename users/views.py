@@ -1,9 +1,13 @@
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils.translation import gettext as _
-from courses.models import Course, Enrollment, Lesson, MaterialCompletion, TaskSubmission
+from courses.models import Course, Enrollment, MaterialCompletion, TaskSubmission
+from courses import caching
+from courses.progress import ProgressResolver
+from courses.views import resolve_user
 from .forms import CustomAuthenticationForm, QuickCreateAccountForm
 
 
@@ -40,7 +44,10 @@ def create_account(request):
 @login_required
 def user_logout(request):
     logout(request)
-    return redirect("login")
+    response = redirect("login")
+    # Signed media links are bound to the user in this cookie.
+    response.delete_cookie(settings.MEDIA_USER_COOKIE)
+    return response
 
 
 @login_required
@@ -55,41 +62,12 @@ def home(request):
     
     if request.user.is_student:
         # Student-specific context
-        enrollments = Enrollment.objects.filter(
+        enrollments = list(Enrollment.objects.filter(
             student=request.user,
             status=Enrollment.STATUS_ACCEPTED
-        ).select_related('course').prefetch_related('course__lessons')
-        
-        # Find next available lesson across all courses
-        next_lesson = None
-        next_course = None
-        total_completed = 0
-        total_lessons = 0
-        
-        for enrollment in enrollments:
-            course = enrollment.course
-            lessons = list(course.lessons.all())
-            total_lessons += len(lessons)
-            
-            for lesson in lessons:
-                if lesson.completed_for(request.user):
-                    total_completed += 1
-                elif next_lesson is None and lesson.is_available_for(request.user):
-                    next_lesson = lesson
-                    next_course = course
-        
-        # Recent enrollments for quick access
-        recent_enrollments = enrollments[:3]
-        
-        context.update({
-            'enrollments': enrollments,
-            'recent_enrollments': recent_enrollments,
-            'next_lesson': next_lesson,
-            'next_course': next_course,
-            'total_completed': total_completed,
-            'total_lessons': total_lessons,
-            'total_courses': enrollments.count(),
-        })
+        ).select_related('course'))
+        resolvers = ProgressResolver.for_courses(request.user, [enrollment.course for enrollment in enrollments])
+        context.update(_student_home_context(enrollments, resolvers))
     else:
         # Admin-specific context
         context.update({
@@ -98,12 +76,67 @@ def home(request):
         })
     
     # Featured courses for all users
-    featured_courses = Course.objects.filter(is_published=True).prefetch_related('lessons')[:3]
+    featured_courses = Course.objects.filter(is_published=True)[:3]
     context['featured_courses'] = featured_courses
     
     return render(request, "users/home.html", context)
 
 
+@login_required
+async def home_async(request):
+    """Async version of ``home``, routed instead of it when ``ASYNC_VIEWS`` is on."""
+    user = await resolve_user(request)
+    context = {
+        'user': user,
+    }
+    
+    if user.is_student:
+        enrollments = [
+            enrollment
+            async for enrollment in Enrollment.objects.filter(
+                student=user,
+                status=Enrollment.STATUS_ACCEPTED
+            ).select_related('course')
+        ]
+        resolvers = await ProgressResolver.afor_courses(user, [enrollment.course for enrollment in enrollments])
+        context.update(_student_home_context(enrollments, resolvers))
+    else:
+        context.update({
+            'total_courses': await Course.objects.filter(is_published=True).acount(),
+            'pending_enrollments': await Enrollment.objects.filter(status=Enrollment.STATUS_PENDING).acount(),
+        })
+    
+    context['featured_courses'] = [course async for course in Course.objects.filter(is_published=True)[:3]]
+    return render(request, "users/home.html", context)
+
+
+def _student_home_context(enrollments, resolvers):
+    # Find next available lesson across all courses
+    next_lesson = None
+    next_course = None
+    total_completed = 0
+    total_lessons = 0
+    
+    for enrollment in enrollments:
+        progress = resolvers[enrollment.course_id]
+        total_lessons += progress.total_lessons
+        total_completed += progress.completed_lessons
+        if next_lesson is None and progress.next_lesson is not None:
+            next_lesson = progress.next_lesson
+            next_course = enrollment.course
+    
+    return {
+        'enrollments': enrollments,
+        # Recent enrollments for quick access
+        'recent_enrollments': enrollments[:3],
+        'next_lesson': next_lesson,
+        'next_course': next_course,
+        'total_completed': total_completed,
+        'total_lessons': total_lessons,
+        'total_courses': len(enrollments),
+    }
+
+
 @login_required
 def profile(request):
     """
@@ -126,36 +159,20 @@ def profile(request):
     
     if user.is_student:
         # Student statistics
-        enrollments = Enrollment.objects.filter(
+        enrollments = list(Enrollment.objects.filter(
             student=user,
             status=Enrollment.STATUS_ACCEPTED
-        ).select_related('course').prefetch_related('course__lessons')
-        
-        total_courses = enrollments.count()
-        total_lessons = 0
-        completed_lessons = 0
-        total_materials = 0
-        completed_materials = MaterialCompletion.objects.filter(student=user).count()
-        
-        for enrollment in enrollments:
-            lessons = enrollment.course.lessons.all()
-            total_lessons += len(lessons)
-            for lesson in lessons:
-                if lesson.completed_for(user):
-                    completed_lessons += 1
-                total_materials += lesson.materials.count()
-        
-        # Task submission stats
-        total_submissions = TaskSubmission.objects.filter(student=user).count()
-        passing_submissions = TaskSubmission.objects.filter(
-            student=user,
-            status=TaskSubmission.STATUS_GRADED
-        ).filter(score__gte=90).count()
+        ).select_related('course'))
+        resolvers = ProgressResolver.for_courses(user, [enrollment.course for enrollment in enrollments])
         
-        # Recent activity
-        recent_submissions = TaskSubmission.objects.filter(
-            student=user
-        ).select_related('material__lesson__course').order_by('-submitted_at')[:5]
+        total_courses = len(enrollments)
+        total_lessons = sum(progress.total_lessons for progress in resolvers.values())
+        completed_lessons = sum(progress.completed_lessons for progress in resolvers.values())
+        total_materials = sum(progress.total_materials for progress in resolvers.values())
+        stats = caching.get_or_set(
+            caching.student_key('profile-stats', user.pk),
+            lambda: _submission_stats(user),
+        )
         
         # Calculate overall progress
         overall_progress = 0
@@ -167,12 +184,9 @@ def profile(request):
             'total_lessons': total_lessons,
             'completed_lessons': completed_lessons,
             'total_materials': total_materials,
-            'completed_materials': completed_materials,
             'overall_progress': overall_progress,
-            'total_submissions': total_submissions,
-            'passing_submissions': passing_submissions,
-            'recent_submissions': recent_submissions,
             'enrollments': enrollments,
+            **stats,
         })
     else:
         # Admin statistics
@@ -180,7 +194,23 @@ def profile(request):
             'total_courses': Course.objects.filter(is_published=True).count(),
             'total_students': Enrollment.objects.values('student').distinct().count(),
             'pending_enrollments': Enrollment.objects.filter(status=Enrollment.STATUS_PENDING).count(),
-            'total_submissions': TaskSubmission.objects.filter(status=TaskSubmission.STATUS_PENDING_REVIEW).count(),
+            'total_submissions': TaskSubmission.objects.filter(status=TaskSubmission.STATUS_PENDING).count(),
         })
     
     return render(request, 'users/profile.html', context)
+
+
+def _submission_stats(user):
+    """Completion and submission statistics shown on a student's profile."""
+    return {
+        'completed_materials': MaterialCompletion.objects.filter(student=user).count(),
+        'total_submissions': TaskSubmission.objects.filter(student=user).count(),
+        'passing_submissions': TaskSubmission.objects.filter(
+            student=user,
+            status=TaskSubmission.STATUS_GRADED
+        ).filter(score__gte=90).count(),
+        # Recent activity
+        'recent_submissions': list(TaskSubmission.objects.filter(
+            student=user
+        ).select_related('material__lesson__course').order_by('-submitted_at')[:5]),
+    }